@@ -0,0 +1,264 @@
+"""
+本地 OpenAI 兼容桩服务 - 用于离线压测真实 DeepSeekProvider 代码路径
+
+运行:
+    python ai_stub_server.py --port 8100 --latency lognormal:1.5,0.5 --error-rate 0.05
+
+然后让后端指向它:
+    MODELSCOPE_BASE_URL=http://127.0.0.1:8100/v1 uvicorn app.main:app
+
+支持 POST /v1/chat/completions（stream 与非 stream）、GET /v1/models、GET /stats。
+延迟分布格式:
+    fixed:<秒>                  固定延迟
+    uniform:<最小>,<最大>        均匀分布
+    normal:<均值>,<标准差>       正态分布（截断到 >=0）
+    lognormal:<中位数>,<sigma>   对数正态分布（长尾，最接近真实 LLM）
+"""
+import os
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class LatencyModel:
+    """按配置的分布采样延迟（秒）"""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"unknown latency distribution: {spec}")
+
+    def sample(self) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            return p[0] if p else 0.0
+        if self.kind == "uniform":
+            return random.uniform(p[0], p[1])
+        if self.kind == "normal":
+            return max(0.0, random.gauss(p[0], p[1]))
+        # lognormal: 参数为中位数和 sigma
+        return random.lognormvariate(math.log(max(p[0], 1e-6)), p[1])
+
+
+class StubConfig:
+    def __init__(self):
+        self.latency = LatencyModel(os.getenv("STUB_LATENCY", "fixed:0.5"))
+        self.token_delay = float(os.getenv("STUB_TOKEN_DELAY", "0.02"))  # 流式每个分片间隔
+        self.error_rate = float(os.getenv("STUB_ERROR_RATE", "0"))
+        self.error_statuses = [int(s) for s in os.getenv("STUB_ERROR_STATUSES", "500,429").split(",")]
+        self.hang_rate = float(os.getenv("STUB_HANG_RATE", "0"))  # 模拟卡死，用于验证超时/熔断
+        self.hang_seconds = float(os.getenv("STUB_HANG_SECONDS", "120"))
+        self.fence_rate = float(os.getenv("STUB_FENCE_RATE", "0.5"))  # JSON 包裹 ```json 代码块的比例
+        self.fractional_rate = float(os.getenv("STUB_FRACTIONAL_RATE", "0.3"))  # 指标返回小数（如 72.5）的比例
+        self.stream_break_rate = float(os.getenv("STUB_STREAM_BREAK_RATE", "0"))  # 流式中途断开
+
+
+config = StubConfig()
+stats = {"requests": 0, "streams": 0, "errors": 0, "hangs": 0, "stream_breaks": 0}
+
+app = FastAPI(title="AI Stub Server")
+
+
+def _fake_metrics() -> dict:
+    metrics = {
+        "skin_age": random.randint(22, 40),
+        "hydration": random.randint(40, 85),
+        "inflammation": random.randint(10, 60),
+        "elasticity": random.randint(50, 90),
+        "pigmentation": random.randint(20, 60),
+        "wrinkles": random.randint(10, 45),
+    }
+    if random.random() < config.fractional_rate:
+        # 真实模型偶尔给出小数评分，用于验证结构化输出校验的兼容性
+        metrics["hydration"] += 0.5
+        metrics["skin_age"] = str(metrics["skin_age"] + 0.4)
+    return metrics
+
+
+def _face_payload() -> dict:
+    """与 DeepSeekProvider.analyze_face 期望的结构一致"""
+    return {
+        "metrics": _fake_metrics(),
+        "advice_summary": "肌肤整体稳定，注意保湿与防晒。",
+        "detailed_advice": "【护理】早晚使用保湿精华。\n【作息】晚11点前入睡。\n【饮食】多喝水，少辛辣。\n【注意】如有红肿请及时就医。",
+    }
+
+
+def _plan_payload() -> dict:
+    """与 DeepSeekProvider.generate_plan / PlanService 期望的结构一致"""
+    return {
+        "goal": "稳定屏障、提升水润度",
+        "phases": [
+            {"phase": "第1-3天：调理期", "actions": {"护理": ["温和清洁", "基础保湿"], "作息": ["规律睡眠"], "饮食": ["多喝温水"]}},
+            {"phase": "第4-10天：强化期", "actions": {"护理": ["补水面膜每周2次"], "作息": ["适量运动"], "饮食": ["多食蔬果"]}},
+            {"phase": "第11-14天：巩固期", "actions": {"护理": ["维持护理"], "作息": ["保持习惯"], "饮食": ["均衡饮食"]}},
+        ],
+    }
+
+
+def _build_reply(messages: list) -> str:
+    text = "\n".join(str(m.get("content", "")) for m in messages)
+    if "皮肤分析" in text and "metrics" in text:
+        payload = _face_payload()
+    elif "护理方案" in text:
+        payload = _plan_payload()
+    else:
+        return "【辨证】多与脾虚湿盛相关。\n【内调】薏米红豆粥，规律作息。\n【外养】按揉足三里，温和保湿。"
+
+    body = json.dumps(payload, ensure_ascii=False)
+    if random.random() < config.fence_rate:
+        body = f"```json\n{body}\n```"
+    return body
+
+
+def _usage(messages: list, reply: str) -> dict:
+    # 粗略估算：中文约 1 字 ≈ 1 token
+    prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages)
+    completion_tokens = len(reply)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+async def _maybe_fail():
+    """按配置注入卡死或错误；返回错误响应或 None"""
+    if random.random() < config.hang_rate:
+        stats["hangs"] += 1
+        await asyncio.sleep(config.hang_seconds)
+    if random.random() < config.error_rate:
+        stats["errors"] += 1
+        status = random.choice(config.error_statuses)
+        return JSONResponse(
+            status_code=status,
+            content={"error": {"message": "injected failure", "type": "stub_error", "code": status}}
+        )
+    return None
+
+
+@app.get("/v1/models")
+def list_models():
+    return {"object": "list", "data": [{"id": "stub-model", "object": "model", "owned_by": "stub"}]}
+
+
+@app.get("/stats")
+def get_stats():
+    return {**stats, "latency": config.latency.spec, "error_rate": config.error_rate}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "stub-model")
+    stats["requests"] += 1
+
+    error = await _maybe_fail()
+    if error is not None:
+        return error
+
+    reply = _build_reply(messages)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+
+    if body.get("stream"):
+        stats["streams"] += 1
+        return StreamingResponse(
+            _stream(completion_id, created, model, reply, messages,
+                    bool((body.get("stream_options") or {}).get("include_usage"))),
+            media_type="text/event-stream"
+        )
+
+    await asyncio.sleep(config.latency.sample())
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": reply},
+            "finish_reason": "stop",
+        }],
+        "usage": _usage(messages, reply),
+    }
+
+
+async def _stream(completion_id: str, created: int, model: str, reply: str, messages: list,
+                  include_usage: bool = False):
+    def chunk(delta: Optional[dict], finish_reason=None, usage=None) -> str:
+        data = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        if include_usage:
+            # 与 OpenAI 一致：请求 include_usage 时每个分片带 usage 字段，仅最后一个分片有值
+            data["usage"] = usage
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    # 首 token 延迟
+    await asyncio.sleep(config.latency.sample())
+    yield chunk({"role": "assistant", "content": ""})
+
+    pieces = [reply[i:i + 4] for i in range(0, len(reply), 4)]
+    break_at = len(pieces) // 2 if random.random() < config.stream_break_rate else None
+    for i, piece in enumerate(pieces):
+        if break_at is not None and i == break_at:
+            stats["stream_breaks"] += 1
+            # 发送非法数据模拟上游中途断开
+            yield "data: {broken\n\n"
+            return
+        yield chunk({"content": piece})
+        await asyncio.sleep(config.token_delay)
+
+    yield chunk({}, finish_reason="stop")
+    if include_usage:
+        yield chunk(None, usage=_usage(messages, reply))
+    yield "data: [DONE]\n\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的本地 AI 桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", help="延迟分布，如 lognormal:1.5,0.5")
+    parser.add_argument("--token-delay", type=float, help="流式分片间隔（秒）")
+    parser.add_argument("--error-rate", type=float, help="错误响应比例 0-1")
+    parser.add_argument("--hang-rate", type=float, help="卡死请求比例 0-1")
+    parser.add_argument("--stream-break-rate", type=float, help="流式中途断开比例 0-1")
+    parser.add_argument("--fence-rate", type=float, help="JSON 包裹代码块的比例 0-1")
+    args = parser.parse_args()
+
+    if args.latency:
+        config.latency = LatencyModel(args.latency)
+    if args.token_delay is not None:
+        config.token_delay = args.token_delay
+    if args.error_rate is not None:
+        config.error_rate = args.error_rate
+    if args.hang_rate is not None:
+        config.hang_rate = args.hang_rate
+    if args.stream_break_rate is not None:
+        config.stream_break_rate = args.stream_break_rate
+    if args.fence_rate is not None:
+        config.fence_rate = args.fence_rate
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,73 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
+from app.ai.resilience import Deadline
+from app.ai.scheduler import LANE_CONSULT
 
 class BaseAIProvider(ABC):
+    @property
+    def provider_id(self) -> str:
+        """Provider/模型标识，用于缓存键等场景区分不同实现"""
+        return type(self).__name__
+
     @abstractmethod
-    def analyze_face(self, image_path: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def analyze_face(self, image_path: str, context: Optional[Dict[str, Any]] = None,
+                     deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         分析人脸图片并返回指标和建议。
         context 可以包含上一次的指标以保证数据连续性。
+        deadline 为调用方的时间预算，超出后应直接返回降级结果。
         """
         pass
-    
+
     @abstractmethod
-    def generate_plan(self, patient_data: Dict[str, Any], jieqi: str) -> Dict[str, Any]:
+    def generate_plan(self, patient_data: Dict[str, Any], jieqi: str,
+                      deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         根据患者数据和节气生成长期方案。
         """
         pass
+
+    @abstractmethod
+    def chat(self, history: list, prompt: str, deadline: Optional[Deadline] = None,
+             lane: str = LANE_CONSULT, compaction_stats: Optional[dict] = None) -> str:
+        """
+        多轮对话，返回空字符串表示调用失败（由调用方降级）。
+        compaction_stats 不为 None 时，Provider 把历史压缩统计写入该字典。
+        """
+        pass
+
+    # ===== 异步接口 =====
+    # 默认实现把同步方法放到线程池执行，避免阻塞事件循环；
+    # 支持原生异步 HTTP 的 Provider 应覆盖这些方法。
+
+    async def analyze_face_async(self, image_path: str, context: Optional[Dict[str, Any]] = None,
+                                 deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.analyze_face, image_path, context, deadline)
+
+    async def generate_plan_async(self, patient_data: Dict[str, Any], jieqi: str,
+                                  deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.generate_plan, patient_data, jieqi, deadline)
+
+    async def chat_async(self, history: list, prompt: str, deadline: Optional[Deadline] = None,
+                         lane: str = LANE_CONSULT, compaction_stats: Optional[dict] = None) -> str:
+        return await asyncio.to_thread(self.chat, history, prompt, deadline, lane, compaction_stats)
+
+    async def chat_stream_async(self, history: list, prompt: str, deadline: Optional[Deadline] = None,
+                                lane: str = LANE_CONSULT,
+                                compaction_stats: Optional[dict] = None) -> AsyncIterator[str]:
+        """
+        流式对话，逐段产出增量文本。
+        默认实现一次性产出完整回复；上游异常直接抛出，由调用方降级。
+        """
+        reply = await self.chat_async(history, prompt, deadline, lane, compaction_stats)
+        if reply:
+            yield reply
+
+    async def warm_up_async(self) -> None:
+        """启动预热（建立连接等），默认无操作"""
+        pass
+
+    async def aclose(self) -> None:
+        """释放异步连接池等资源"""
+        pass
@@ -1,8 +1,19 @@
 import os
 import json
-from typing import Dict, Any, Optional
-from openai import OpenAI
+import time
+import asyncio
+from types import SimpleNamespace
+from typing import Dict, Any, Optional, AsyncIterator, Callable
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
 from app.ai.base import BaseAIProvider
+from app.ai.resilience import Deadline, CircuitOpenError, get_breaker
+from app.ai.single_flight import SingleFlight, AsyncSingleFlight, request_key
+from app.ai.scheduler import scheduler, AICallRejectedError, LANE_CONSULT, LANE_FACE_EXAM, LANE_PLAN
+from app.ai.metrics import ai_metrics
+from app.ai.history_compactor import HistoryCompactor, estimate_tokens
+from app.ai.json_extractor import StreamingJSONExtractor, JSONExtractionError, extract_json
+from app.schemas.ai_output import FaceAnalysisOutput, PlanOutput
 from app.core.config import settings
 
 class DeepSeekProvider(BaseAIProvider):
@@ -10,48 +21,375 @@ class DeepSeekProvider(BaseAIProvider):
     魔搭社区 DeepSeek API 集成
     """
     
+    # 进程内共享的请求合并器（所有实例共用，键中包含上游地址和模型）
+    _flight = SingleFlight()
+    _async_flight = AsyncSingleFlight()
+    
     DEFAULT_BASE_URL = "https://api-inference.modelscope.cn/v1"
     DEFAULT_MODEL = "deepseek-ai/DeepSeek-V3.2"
     
-    def __init__(self, api_key: str = None, model: str = None):
+    def __init__(self, api_key: str = None, model: str = None,
+                 client: OpenAI = None, async_client: AsyncOpenAI = None):
+        """
+        client / async_client 可由 ProviderRegistry 传入，使不同模型的实例共用同一连接池；
+        未传入时自行创建
+        """
         self.api_key = api_key or settings.MODELSCOPE_API_KEY
         self.model = model or settings.MODELSCOPE_MODEL
         self.base_url = settings.MODELSCOPE_BASE_URL
+        # 同一上游地址的所有实例共用一个熔断器
+        self.breaker = get_breaker(self.base_url)
+        self.compactor = HistoryCompactor()
         
-        self.client = None
+        self.client = client
+        self.async_client = async_client
         if self.api_key:
-            self.client = OpenAI(
-                base_url=self.base_url,
-                api_key=self.api_key
-            )
+            if self.client is None or self.async_client is None:
+                self.client, self.async_client = self.create_clients(self.base_url, self.api_key)
         else:
             print("Warning: MODELSCOPE_API_KEY not set, will fall back to mock data")
     
-    def _call_api(self, messages: list, temperature: float = 0.7, max_tokens: int = 1000) -> str:
-        """调用魔搭 DeepSeek API"""
+    @staticmethod
+    def create_clients(base_url: str, api_key: str):
+        """创建同步与异步 OpenAI 客户端（异步客户端带连接池上限）"""
+        client = OpenAI(base_url=base_url, api_key=api_key)
+        # 异步客户端共享一个连接池，供 async 路由并发调用
+        async_client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=settings.AI_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.AI_MAX_KEEPALIVE_CONNECTIONS
+                )
+            )
+        )
+        return client, async_client
+    
+    @property
+    def provider_id(self) -> str:
+        return f"ModelScope-{self.model}"
+    
+    def _call_api(self, messages: list, temperature: float = 0.7, max_tokens: int = 1000,
+                  deadline: Optional[Deadline] = None, lane: str = LANE_CONSULT) -> str:
+        """调用魔搭 DeepSeek API（相同请求并发时合并为一次上游调用）"""
         if not self.client:
             return ""
         
+        key = self._flight_key(messages, temperature, max_tokens)
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                stream=False,
-                timeout=90  # 90秒超时
+            return self._flight.do(
+                key,
+                lambda: self._request_api(messages, temperature, max_tokens, deadline, lane),
+                wait_timeout=deadline.remaining() if deadline else None
             )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"ModelScope DeepSeek API error: {e}")
+        except TimeoutError:
+            # 跟随者自己的时间预算先耗尽
+            return ""
+    
+    def _request_api(self, messages: list, temperature: float, max_tokens: int,
+                     deadline: Optional[Deadline], lane: str) -> str:
+        # 先排队拿调度额度，排队超时直接降级
+        if not scheduler.acquire(lane, self._queue_timeout(deadline)):
+            print(f"[AI Scheduler] {lane} call rejected after queueing")
+            ai_metrics.record_call(lane, self.model, "rejected")
             return ""
+        
+        try:
+            timeout = self._resolve_timeout(deadline)
+            if timeout is None:
+                ai_metrics.record_call(lane, self.model, "unavailable")
+                return ""
+            
+            # 有时间预算时关闭 SDK 自动重试，避免重试把预算耗尽
+            client = self.client if deadline is None else self.client.with_options(max_retries=0)
+            started = time.monotonic()
+            try:
+                response = client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=False,
+                    timeout=timeout
+                )
+                latency = time.monotonic() - started
+                self.breaker.record_success(latency)
+                ai_metrics.record_call(lane, self.model, "success", latency, response.usage)
+                return response.choices[0].message.content
+            except Exception as e:
+                latency = time.monotonic() - started
+                self.breaker.record_failure(latency)
+                ai_metrics.record_call(lane, self.model, "error", latency)
+                print(f"ModelScope DeepSeek API error: {e}")
+                return ""
+            except BaseException:
+                # 被取消（CancelledError 不是 Exception）：不计成败，但必须归还熔断器的探测名额
+                self.breaker.release()
+                ai_metrics.record_call(lane, self.model, "cancelled", time.monotonic() - started)
+                raise
+        finally:
+            scheduler.release()
+    
+    async def _call_api_async(self, messages: list, temperature: float = 0.7, max_tokens: int = 1000,
+                              deadline: Optional[Deadline] = None, lane: str = LANE_CONSULT) -> str:
+        """异步调用魔搭 DeepSeek API（不阻塞事件循环，相同请求并发时合并）"""
+        if not self.async_client:
+            return ""
+        
+        key = self._flight_key(messages, temperature, max_tokens)
+        try:
+            return await self._async_flight.do(
+                key,
+                lambda: self._request_api_async(messages, temperature, max_tokens, deadline, lane),
+                wait_timeout=deadline.remaining() if deadline else None
+            )
+        except asyncio.TimeoutError:
+            return ""
+    
+    async def _request_api_async(self, messages: list, temperature: float, max_tokens: int,
+                                 deadline: Optional[Deadline], lane: str) -> str:
+        if not await scheduler.acquire_async(lane, self._queue_timeout(deadline)):
+            print(f"[AI Scheduler] {lane} call rejected after queueing")
+            ai_metrics.record_call(lane, self.model, "rejected")
+            return ""
+        
+        try:
+            timeout = self._resolve_timeout(deadline)
+            if timeout is None:
+                ai_metrics.record_call(lane, self.model, "unavailable")
+                return ""
+            
+            client = self.async_client if deadline is None else self.async_client.with_options(max_retries=0)
+            started = time.monotonic()
+            try:
+                response = await client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=False,
+                    timeout=timeout
+                )
+                latency = time.monotonic() - started
+                self.breaker.record_success(latency)
+                ai_metrics.record_call(lane, self.model, "success", latency, response.usage)
+                return response.choices[0].message.content
+            except Exception as e:
+                latency = time.monotonic() - started
+                self.breaker.record_failure(latency)
+                ai_metrics.record_call(lane, self.model, "error", latency)
+                print(f"ModelScope DeepSeek API error: {e}")
+                return ""
+            except BaseException:
+                # 被取消（CancelledError 不是 Exception）：不计成败，但必须归还熔断器的探测名额
+                self.breaker.release()
+                ai_metrics.record_call(lane, self.model, "cancelled", time.monotonic() - started)
+                raise
+        finally:
+            scheduler.release()
+    
+    async def _stream_api_async(self, messages: list, temperature: float = 0.7, max_tokens: int = 1000,
+                                deadline: Optional[Deadline] = None, lane: str = LANE_CONSULT,
+                                stop: Optional[Callable[[str], bool]] = None) -> AsyncIterator[str]:
+        """
+        以 stream=True 调用 API，逐个产出增量文本。
+        与 _call_api_async 不同，这里不吞掉异常：流中途断开时调用方需要知道。
+        stop(delta) 返回 True 时主动结束流（如 JSON 已解析完整），按成功记录；
+        调用方关闭生成器则视为客户端中断，记为 cancelled
+        """
+        if not self.async_client:
+            return
+        
+        if not await scheduler.acquire_async(lane, self._queue_timeout(deadline)):
+            ai_metrics.record_call(lane, self.model, "rejected")
+            raise AICallRejectedError(f"AI scheduler rejected {lane} call after queueing")
+        
+        try:
+            timeout = self._resolve_timeout(deadline)
+            if timeout is None:
+                ai_metrics.record_call(lane, self.model, "unavailable")
+                raise CircuitOpenError(f"AI upstream unavailable: breaker {self.breaker.state}")
+            
+            client = self.async_client if deadline is None else self.async_client.with_options(max_retries=0)
+            started = time.monotonic()
+            usage = None
+            received = []
+            try:
+                # async with 保证提前结束（解析完成、客户端断开）时关闭响应，连接立即归还连接池
+                async with await client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    # 流式响应默认不返回用量，需显式请求（最后一个 choices 为空的分片附带 usage）
+                    stream_options={"include_usage": True},
+                    timeout=timeout
+                ) as stream:
+                    async for chunk in stream:
+                        usage = getattr(chunk, "usage", None) or usage
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            received.append(delta)
+                            yield delta
+                            if stop is not None and stop(delta):
+                                break
+            except GeneratorExit:
+                # 客户端提前断开，不算上游故障
+                latency = time.monotonic() - started
+                self.breaker.record_success(latency)
+                self._record_stream(lane, "cancelled", latency, usage, messages, received)
+                raise
+            except Exception:
+                latency = time.monotonic() - started
+                self.breaker.record_failure(latency)
+                ai_metrics.record_call(lane, self.model, "error", latency, usage)
+                raise
+            except BaseException:
+                self.breaker.release()
+                ai_metrics.record_call(lane, self.model, "cancelled", time.monotonic() - started, usage)
+                raise
+            latency = time.monotonic() - started
+            self.breaker.record_success(latency)
+            self._record_stream(lane, "success", latency, usage, messages, received)
+        finally:
+            scheduler.release()
+    
+    def _record_stream(self, lane: str, outcome: str, latency: float, usage, messages: list, received: list):
+        """
+        记录一次流式调用。提前结束的流收不到最后的 usage 分片，
+        此时按提示词与已收到的文本估算 token（图片输入不计入），并在指标中标记为估算
+        """
+        if usage is not None:
+            ai_metrics.record_call(lane, self.model, outcome, latency, usage)
+            return
+        prompt_tokens = 0
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, list):
+                content = "".join(part.get("text", "") for part in content if part.get("type") == "text")
+            prompt_tokens += estimate_tokens(content or "") + 4
+        estimated = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=estimate_tokens("".join(received)))
+        ai_metrics.record_call(lane, self.model, outcome, latency, estimated, usage_estimated=True)
+    
+    async def _call_api_json_async(self, messages: list, schema, temperature: float = 0.7,
+                                   max_tokens: int = 1000, deadline: Optional[Deadline] = None,
+                                   lane: str = LANE_CONSULT) -> Optional[Dict[str, Any]]:
+        """
+        以流式调用获取结构化 JSON：边接收边解析，必填字段齐全或对象闭合后立即结束流，
+        不再为模型附加的说明文字付费；流中途断开时尝试用已收到的部分修复。
+        失败返回 None（相同请求并发时合并）
+        """
+        if not self.async_client:
+            return None
+        
+        key = self._flight_key(messages, temperature, max_tokens) + ":json-stream"
+        try:
+            return await self._async_flight.do(
+                key,
+                lambda: self._stream_json_async(messages, schema, temperature, max_tokens, deadline, lane),
+                wait_timeout=deadline.remaining() if deadline else None
+            )
+        except asyncio.TimeoutError:
+            return None
+    
+    async def _stream_json_async(self, messages: list, schema, temperature: float, max_tokens: int,
+                                 deadline: Optional[Deadline], lane: str) -> Optional[Dict[str, Any]]:
+        extractor = StreamingJSONExtractor(schema)
+        # 必填字段齐全或对象闭合后由 _stream_api_async 主动结束流（按成功记录）
+        stream = self._stream_api_async(messages, temperature, max_tokens, deadline, lane, stop=extractor.feed)
+        try:
+            async for _ in stream:
+                pass
+        except (AICallRejectedError, CircuitOpenError) as e:
+            print(f"[AI JSON Stream] {lane}: {e}")
+            return None
+        except Exception as e:
+            # 中途断开：下面用已收到的内容尝试修复
+            print(f"ModelScope DeepSeek stream error: {type(e).__name__}: {e}")
+        finally:
+            await stream.aclose()
+        
+        try:
+            return extractor.result()
+        except JSONExtractionError as e:
+            print(f"JSON parse error: {e}, response: {extractor.text[:200]}")
+            return None
+    
+    def _flight_key(self, messages: list, temperature: float, max_tokens: int) -> str:
+        return request_key(
+            base_url=self.base_url,
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    
+    @staticmethod
+    def _queue_timeout(deadline: Optional[Deadline]) -> float:
+        """调度排队的最长等待时间，不超过调用方剩余预算"""
+        wait = settings.AI_SCHEDULER_MAX_QUEUE_SECONDS
+        if deadline is not None:
+            wait = min(wait, deadline.remaining())
+        return wait
+    
+    def _resolve_timeout(self, deadline: Optional[Deadline]) -> Optional[float]:
+        """
+        计算本次调用可用的超时；返回 None 表示应立即降级
+        （熔断器打开，或时间预算已耗尽）。
+        """
+        if deadline is not None and deadline.expired:
+            return None
+        if not self.breaker.allow_request():
+            return None
+        
+        timeout = settings.AI_REQUEST_TIMEOUT
+        if deadline is not None:
+            timeout = min(timeout, deadline.remaining())
+        return timeout
+    
+    async def warm_up_async(self) -> None:
+        """预先建立到上游的连接（TLS 握手等），避免首个请求承担建连延迟"""
+        if not self.async_client:
+            return
+        await self.async_client.with_options(
+            timeout=settings.AI_WARMUP_TIMEOUT, max_retries=0
+        ).models.list()
+    
+    async def aclose(self) -> None:
+        if self.async_client:
+            await self.async_client.close()
+    
+    @staticmethod
+    def _extract_json(response: str, schema=None) -> Dict[str, Any]:
+        """从模型输出中提取 JSON（兼容代码块包裹、尾随说明与截断），失败抛出 JSONExtractionError"""
+        return extract_json(response, schema)
     
-    def analyze_face(self, image_path: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def analyze_face(self, image_path: str, context: Optional[Dict[str, Any]] = None,
+                     deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         分析人脸图片并返回指标和建议
         """
         last_metrics = context.get("last_metrics", {}) if context else {}
-        
+        response = self._call_api(self._build_face_messages(last_metrics), deadline=deadline, lane=LANE_FACE_EXAM)
+        return self._parse_face_response(response, last_metrics)
+    
+    async def analyze_face_async(self, image_path: str, context: Optional[Dict[str, Any]] = None,
+                                 deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        last_metrics = context.get("last_metrics", {}) if context else {}
+        messages = self._build_face_messages(last_metrics)
+        if settings.AI_STREAM_JSON_ENABLED:
+            result = await self._call_api_json_async(
+                messages, FaceAnalysisOutput, deadline=deadline, lane=LANE_FACE_EXAM
+            )
+            return self._finish_face_result(result, last_metrics)
+        response = await self._call_api_async(messages, deadline=deadline, lane=LANE_FACE_EXAM)
+        return self._parse_face_response(response, last_metrics)
+    
+    def _build_face_messages(self, last_metrics: dict) -> list:
         prompt = f"""你是一位专业的医美皮肤分析师。请根据描述分析患者的皮肤状况。
 
 患者历史数据：
@@ -76,35 +414,48 @@ class DeepSeekProvider(BaseAIProvider):
 2. 给出具体可操作的建议
 """
         
-        messages = [
+        return [
             {"role": "system", "content": "你是专业的医美皮肤分析AI助手，擅长分析皮肤状况并给出个性化建议。请只输出JSON格式的结果。"},
             {"role": "user", "content": prompt}
         ]
-        
-        response = self._call_api(messages)
-        
+    
+    def _parse_face_response(self, response: str, last_metrics: dict) -> Dict[str, Any]:
+        result = None
         if response:
             try:
-                # 尝试提取 JSON（可能包含 markdown 代码块）
-                json_str = response
-                if "```json" in response:
-                    json_str = response.split("```json")[1].split("```")[0]
-                elif "```" in response:
-                    json_str = response.split("```")[1].split("```")[0]
-                
-                result = json.loads(json_str.strip())
-                result["ai_provider"] = f"ModelScope-{self.model.split('/')[-1]}"
-                return result
-            except (json.JSONDecodeError, IndexError) as e:
+                result = self._extract_json(response, FaceAnalysisOutput)
+            except JSONExtractionError as e:
                 print(f"JSON parse error: {e}, response: {response[:200]}")
+        return self._finish_face_result(result, last_metrics)
+    
+    def _finish_face_result(self, result: Optional[Dict[str, Any]], last_metrics: dict) -> Dict[str, Any]:
+        if result is not None:
+            result["ai_provider"] = f"ModelScope-{self.model.split('/')[-1]}"
+            ai_metrics.record_result(LANE_FACE_EXAM, fallback=False)
+            return result
         
         # 如果 API 调用失败，返回模拟数据
+        ai_metrics.record_result(LANE_FACE_EXAM, fallback=True)
         return self._get_mock_analysis(last_metrics)
     
-    def generate_plan(self, patient_data: Dict[str, Any], jieqi: str) -> Dict[str, Any]:
+    def generate_plan(self, patient_data: Dict[str, Any], jieqi: str,
+                      deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         """
         根据患者数据和节气生成长期方案
         """
+        response = self._call_api(self._build_plan_messages(patient_data, jieqi), deadline=deadline, lane=LANE_PLAN)
+        return self._parse_plan_response(response, jieqi)
+    
+    async def generate_plan_async(self, patient_data: Dict[str, Any], jieqi: str,
+                                  deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        messages = self._build_plan_messages(patient_data, jieqi)
+        if settings.AI_STREAM_JSON_ENABLED:
+            result = await self._call_api_json_async(messages, PlanOutput, deadline=deadline, lane=LANE_PLAN)
+            return self._finish_plan_result(result, jieqi)
+        response = await self._call_api_async(messages, deadline=deadline, lane=LANE_PLAN)
+        return self._parse_plan_response(response, jieqi)
+    
+    def _build_plan_messages(self, patient_data: Dict[str, Any], jieqi: str) -> list:
         metrics = patient_data.get("metrics", {})
         jieqi_advice = patient_data.get("jieqi_advice", {})
         
@@ -141,26 +492,26 @@ class DeepSeekProvider(BaseAIProvider):
 }}
 """
         
-        messages = [
+        return [
             {"role": "system", "content": "你是专业的医美护理方案规划AI，擅长根据节气和肤质制定个性化方案。请只输出JSON格式的结果。"},
             {"role": "user", "content": prompt}
         ]
-        
-        response = self._call_api(messages)
-        
+    
+    def _parse_plan_response(self, response: str, jieqi: str) -> Dict[str, Any]:
+        result = None
         if response:
             try:
-                json_str = response
-                if "```json" in response:
-                    json_str = response.split("```json")[1].split("```")[0]
-                elif "```" in response:
-                    json_str = response.split("```")[1].split("```")[0]
-                
-                result = json.loads(json_str.strip())
-                return result
-            except (json.JSONDecodeError, IndexError) as e:
+                result = self._extract_json(response, PlanOutput)
+            except JSONExtractionError as e:
                 print(f"JSON parse error: {e}")
+        return self._finish_plan_result(result, jieqi)
+    
+    def _finish_plan_result(self, result: Optional[Dict[str, Any]], jieqi: str) -> Dict[str, Any]:
+        if result is not None:
+            ai_metrics.record_result(LANE_PLAN, fallback=False)
+            return result
         
+        ai_metrics.record_result(LANE_PLAN, fallback=True)
         return self._get_mock_plan(jieqi)
     
     def _get_mock_analysis(self, last_metrics: dict) -> Dict[str, Any]:
@@ -193,13 +544,72 @@ class DeepSeekProvider(BaseAIProvider):
             "metrics": metrics,
             "advice_summary": "建议加强日常保湿护理，注意防晒和规律作息。",
             "detailed_advice": "【护理】建议使用高保湿精华，每周2次补水面膜。\n【作息】保持规律睡眠，晚11点前入睡。\n【饮食】多喝水，减少辛辣刺激。\n【注意】如有红肿情况请及时就医。",
-            "ai_provider": "MockAI"
+            "ai_provider": "MockAI",
+            "is_fallback": True  # 降级数据，不应写入缓存
         }
     
-    def chat(self, history: list, prompt: str) -> str:
+    def chat(self, history: list, prompt: str, deadline: Optional[Deadline] = None,
+             lane: str = LANE_CONSULT, compaction_stats: Optional[dict] = None) -> str:
         """
         与 AI 进行对话 (支持上下文)
+        lane 为调度优先级通道，问卷/方案等后台调用应传入对应通道
+        历史超出 token 预算时先压缩；传入 compaction_stats 字典可取回压缩统计
         """
+        messages = self._compact_chat_messages(history, prompt, deadline, lane, compaction_stats)
+        return self._call_api(messages, deadline=deadline, lane=lane)
+    
+    async def chat_async(self, history: list, prompt: str, deadline: Optional[Deadline] = None,
+                         lane: str = LANE_CONSULT, compaction_stats: Optional[dict] = None) -> str:
+        messages = await self._compact_chat_messages_async(history, prompt, deadline, lane, compaction_stats)
+        return await self._call_api_async(messages, deadline=deadline, lane=lane)
+    
+    async def chat_stream_async(self, history: list, prompt: str, deadline: Optional[Deadline] = None,
+                                lane: str = LANE_CONSULT,
+                                compaction_stats: Optional[dict] = None) -> AsyncIterator[str]:
+        messages = await self._compact_chat_messages_async(history, prompt, deadline, lane, compaction_stats)
+        stream = self._stream_api_async(messages, deadline=deadline, lane=lane)
+        try:
+            async for delta in stream:
+                yield delta
+        finally:
+            # 客户端断开时本生成器被关闭，需同时关闭内层流（记为 cancelled 并归还连接）
+            await stream.aclose()
+    
+    def _compact_chat_messages(self, history: list, prompt: str, deadline: Optional[Deadline],
+                               lane: str, compaction_stats: Optional[dict]) -> list:
+        """构建对话消息，超出预算时把较早轮次替换为摘要（摘要缺失时先请求 AI 生成）"""
+        messages = self._build_chat_messages(history, prompt)
+        plan = self.compactor.plan(messages)
+        summary = None
+        if plan is not None and plan.needs_summary:
+            summary = self._call_api(
+                self.compactor.summary_messages(messages, plan), temperature=0.3,
+                max_tokens=self.compactor.summary_max_tokens * 2, deadline=deadline, lane=lane
+            )
+        return self._finish_compaction(messages, plan, summary, lane, compaction_stats)
+    
+    async def _compact_chat_messages_async(self, history: list, prompt: str, deadline: Optional[Deadline],
+                                           lane: str, compaction_stats: Optional[dict]) -> list:
+        messages = self._build_chat_messages(history, prompt)
+        plan = self.compactor.plan(messages)
+        summary = None
+        if plan is not None and plan.needs_summary:
+            summary = await self._call_api_async(
+                self.compactor.summary_messages(messages, plan), temperature=0.3,
+                max_tokens=self.compactor.summary_max_tokens * 2, deadline=deadline, lane=lane
+            )
+        return self._finish_compaction(messages, plan, summary, lane, compaction_stats)
+    
+    def _finish_compaction(self, messages: list, plan, summary: Optional[str], lane: str,
+                           compaction_stats: Optional[dict]) -> list:
+        if plan is not None:
+            ai_metrics.record_cache("history_summary", lane, hit=not plan.needs_summary)
+        messages, stats = self.compactor.apply(messages, plan, summary)
+        if compaction_stats is not None:
+            compaction_stats.update(stats)
+        return messages
+    
+    def _build_chat_messages(self, history: list, prompt: str) -> list:
         # 构建系统提示词 - 中医美容专家人设
         system_prompt = """你是一位资深的中医美容专家，拥有30年中医临床经验。
 你精通中医基础理论（阴阳五行、脏腑经络）、面诊、舌诊以及中医美容疗法（食疗、药膳、穴位按摩、中药面膜、刮痧等）。
@@ -226,7 +636,7 @@ class DeepSeekProvider(BaseAIProvider):
         # 添加当前问题
         messages.append({"role": "user", "content": prompt})
         
-        return self._call_api(messages)
+        return messages
 
     def _get_mock_plan(self, jieqi: str) -> Dict[str, Any]:
         """生成模拟方案"""
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Optional, Tuple, Union
+from app.core.config import settings
+from app.ai.metrics import ai_metrics
+
+
+class AIHedge:
+    """
+    对冲降级：AI 调用在延迟 SLO 内未返回时，调用方先返回 Mock/规则结果（标记为 provisional），
+    AI 调用在后台继续执行，完成后由调用方注册的回调把正式结果写回数据库替换临时结果。
+
+    用法：
+        result, pending = AIHedge.run(fn, slo, caller)
+        if pending is not None:
+            ...保存临时结果...
+            AIHedge.on_late(pending, caller, finalize)   # 临时结果落库后再注册，避免回调先于落库执行
+    """
+
+    _executor: Optional[ThreadPoolExecutor] = None
+    # finalize 单独使用小线程池：AI 大面积变慢时不会排在卡住的调用后面
+    _finalizer: Optional[ThreadPoolExecutor] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def enabled(slo_seconds: float) -> bool:
+        return settings.AI_HEDGE_ENABLED and slo_seconds > 0
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=settings.AI_HEDGE_WORKERS,
+                    thread_name_prefix="ai-hedge"
+                )
+            return cls._executor
+
+    @classmethod
+    def _get_finalizer(cls) -> ThreadPoolExecutor:
+        with cls._lock:
+            if cls._finalizer is None:
+                cls._finalizer = ThreadPoolExecutor(
+                    max_workers=settings.AI_HEDGE_FINALIZE_WORKERS,
+                    thread_name_prefix="ai-hedge-finalize"
+                )
+            return cls._finalizer
+
+    @classmethod
+    def run(cls, fn: Callable[[], Any], slo_seconds: float, caller: str) -> Tuple[Any, Optional[Future]]:
+        """
+        在线程池中执行同步 AI 调用，最多等待 slo_seconds。
+        按时返回 (结果, None)；超时返回 (None, future)，调用方应走降级并随后调用 on_late
+        """
+        future = cls._get_executor().submit(fn)
+        try:
+            result = future.result(timeout=slo_seconds)
+        except FutureTimeoutError:
+            ai_metrics.record_hedge(caller, "provisional")
+            return None, future
+        ai_metrics.record_hedge(caller, "in_time")
+        return result, None
+
+    @classmethod
+    async def run_async(cls, fn: Callable[[], Awaitable[Any]], slo_seconds: float,
+                        caller: str) -> Tuple[Any, Optional[asyncio.Task]]:
+        """run 的异步版本：AI 调用作为独立 Task 运行，超时后不会被取消"""
+        task = asyncio.ensure_future(fn())
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), slo_seconds)
+        except asyncio.TimeoutError:
+            ai_metrics.record_hedge(caller, "provisional")
+            return None, task
+        ai_metrics.record_hedge(caller, "in_time")
+        return result, None
+
+    @classmethod
+    def on_late(cls, pending: Union[Future, asyncio.Task], caller: str,
+                finalize: Callable[[Any], bool]):
+        """
+        AI 调用完成后在 finalize 专用线程池中执行 finalize(result)（结果替换与数据库写入都是同步操作）。
+        finalize 返回 True 表示已用 AI 结果替换临时结果；调用异常时以 None 调用 finalize
+        """
+        def deliver(done):
+            try:
+                result = done.result()
+            except BaseException as e:
+                print(f"[AI Hedge] {caller} late call failed: {type(e).__name__}: {e}")
+                result = None
+            cls._get_finalizer().submit(cls._finalize, caller, finalize, result)
+
+        pending.add_done_callback(deliver)
+
+    @classmethod
+    def resume(cls, caller: str, retry: Callable[[], bool]) -> Future:
+        """
+        服务重启后临时结果的 on_late 回调已丢失：在后台重新执行 AI 调用并写回。
+        retry 自行完成调用与替换，返回是否已用 AI 结果替换临时结果
+        """
+        return cls._get_executor().submit(cls._finalize, caller, lambda _: retry(), None)
+
+    @staticmethod
+    def _finalize(caller: str, finalize: Callable[[Any], bool], result: Any):
+        try:
+            replaced = finalize(result)
+        except Exception as e:
+            print(f"[AI Hedge] {caller} finalize error: {type(e).__name__}: {e}")
+            replaced = False
+        ai_metrics.record_hedge(caller, "replaced" if replaced else "late_failed")
+
+    @classmethod
+    def shutdown(cls):
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=False)
+                cls._executor = None
+            if cls._finalizer is not None:
+                cls._finalizer.shutdown(wait=False)
+                cls._finalizer = None
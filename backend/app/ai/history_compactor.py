@@ -0,0 +1,177 @@
+import hashlib
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.utils.lru_cache import LRUCache
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算 token 数：中文等 CJK 字符约 1 字 1 token，其余字符约 4 个 1 token。
+    只用于预算控制，不追求与上游分词器完全一致。
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _message_tokens(message: Dict[str, str]) -> int:
+    # 每条消息额外计入少量角色/分隔开销
+    return estimate_tokens(message.get("content", "")) + 4
+
+
+class CompactionPlan:
+    """一次压缩的中间结果：哪些轮次被摘要、是否已有可复用的摘要"""
+
+    def __init__(self, boundary: int, base_index: int, base_summary: Optional[str],
+                 cache_key: str, tokens_before: int):
+        self.boundary = boundary            # history[:boundary] 将被摘要
+        self.base_index = base_index        # history[:base_index] 已有缓存摘要
+        self.base_summary = base_summary
+        self.cache_key = cache_key          # history[:boundary] 对应的摘要缓存键
+        self.tokens_before = tokens_before
+
+    @property
+    def needs_summary(self) -> bool:
+        return self.base_index < self.boundary
+
+
+class HistoryCompactor:
+    """
+    多轮对话历史压缩
+
+    消息总 token 超出预算时：系统提示词、最近若干条消息与当前问题原样保留，
+    更早的轮次替换为一段滚动摘要。摘要边界按 keep_recent 条对齐，
+    同一会话后续几轮可以直接复用缓存的摘要；边界前移时只需把
+    上一段摘要与新增的几条消息再摘要一次，而不是重新摘要全部历史。
+    """
+
+    SUMMARY_PREFIX = "以下是本次问诊较早对话的摘要，请结合摘要继续回答：\n"
+
+    _cache = LRUCache(max_entries=settings.CHAT_SUMMARY_CACHE_MAX_ENTRIES)
+
+    def __init__(self, budget_tokens: int = None, keep_recent: int = None,
+                 summary_max_tokens: int = None):
+        self.budget_tokens = budget_tokens or settings.CHAT_HISTORY_TOKEN_BUDGET
+        self.keep_recent = max(2, keep_recent or settings.CHAT_HISTORY_KEEP_RECENT)
+        self.summary_max_tokens = summary_max_tokens or settings.CHAT_SUMMARY_MAX_TOKENS
+
+    @staticmethod
+    def _split(messages: List[Dict[str, str]]):
+        """拆分为 (系统提示词, 历史消息, 当前问题)"""
+        return messages[0], messages[1:-1], messages[-1]
+
+    @staticmethod
+    def _prefix_keys(history: List[Dict[str, str]], step: int, upto: int) -> Dict[int, str]:
+        """计算 history[:i]（i 为 step 的整数倍且 <= upto）的累计哈希"""
+        digest = hashlib.sha256()
+        keys = {}
+        for i, message in enumerate(history[:upto], start=1):
+            digest.update(message.get("role", "").encode("utf-8"))
+            digest.update(b"\x00")
+            digest.update(message.get("content", "").encode("utf-8"))
+            digest.update(b"\x01")
+            if i % step == 0 or i == upto:
+                keys[i] = digest.hexdigest()
+        return keys
+
+    def plan(self, messages: List[Dict[str, str]]) -> Optional[CompactionPlan]:
+        """未超预算返回 None；否则确定摘要边界并查找可复用的摘要"""
+        system, history, prompt = self._split(messages)
+        tokens_before = sum(_message_tokens(m) for m in messages)
+        if tokens_before <= self.budget_tokens or len(history) <= self.keep_recent:
+            return None
+
+        step = self.keep_recent
+        fixed = _message_tokens(system) + _message_tokens(prompt) + self.summary_max_tokens
+        # 边界向下对齐到 step 的整数倍，保证至少保留 keep_recent 条原文
+        boundary = (len(history) - self.keep_recent) // step * step
+        # 保留的原文仍超预算时，按 step 继续前移边界，但最后一问一答始终原样保留
+        last_boundary = len(history) - 2
+        while boundary < last_boundary and \
+                fixed + sum(_message_tokens(m) for m in history[boundary:]) > self.budget_tokens:
+            boundary = min(last_boundary, boundary + step)
+        if boundary <= 0:
+            return None
+
+        keys = self._prefix_keys(history, step, boundary)
+        # 从最长前缀开始查找已缓存的摘要
+        for index in sorted(keys, reverse=True):
+            summary = self._cache.get(keys[index])
+            if summary is not None:
+                return CompactionPlan(boundary, index, summary, keys[boundary], tokens_before)
+        return CompactionPlan(boundary, 0, None, keys[boundary], tokens_before)
+
+    def summary_messages(self, messages: List[Dict[str, str]], plan: CompactionPlan) -> List[Dict[str, str]]:
+        """构建请求 AI 生成滚动摘要的消息"""
+        _, history, _ = self._split(messages)
+        transcript = "\n".join(
+            f"{'患者' if m.get('role') == 'user' else '专家'}：{m.get('content', '')}"
+            for m in history[plan.base_index:plan.boundary]
+        )
+        previous = f"已有摘要：\n{plan.base_summary}\n\n" if plan.base_summary else ""
+        prompt = f"""{previous}新增对话：
+{transcript}
+
+请把以上内容合并为一段不超过{self.summary_max_tokens}字的问诊摘要，
+保留患者的症状、体质判断、已给出的调理建议和尚未解决的问题。直接输出摘要。"""
+        return [
+            {"role": "system", "content": "你是中医美容问诊记录员，负责压缩对话记录。"},
+            {"role": "user", "content": prompt},
+        ]
+
+    def _extractive_summary(self, history: List[Dict[str, str]], plan: CompactionPlan) -> str:
+        """AI 摘要失败时的降级：截取患者较早的描述"""
+        parts = [plan.base_summary] if plan.base_summary else []
+        parts += [
+            f"患者：{m.get('content', '')}"
+            for m in history[plan.base_index:plan.boundary] if m.get("role") == "user"
+        ]
+        text = "\n".join(parts)
+        # 按估算 token 截断（CJK 字符按 1:1 处理，足够保守）
+        return text[-self.summary_max_tokens:]
+
+    def apply(self, messages: List[Dict[str, str]], plan: Optional[CompactionPlan],
+              summary: Optional[str] = None) -> Tuple[List[Dict[str, str]], dict]:
+        """
+        用摘要替换被压缩的轮次，返回 (新消息列表, 压缩统计)
+        summary 为本次 AI 生成的摘要；为空时使用缓存摘要或截取式降级摘要
+        """
+        system, history, prompt = self._split(messages)
+        if plan is None:
+            tokens = sum(_message_tokens(m) for m in messages)
+            return messages, {
+                "compacted": False,
+                "tokens_before": tokens,
+                "tokens_after": tokens,
+                "budget_tokens": self.budget_tokens,
+                "messages_summarized": 0,
+                "messages_kept": len(history),
+                "summary_source": None,
+            }
+
+        if not plan.needs_summary:
+            text, source = plan.base_summary, "cache"
+        elif summary:
+            text, source = summary.strip(), "ai"
+            self._cache.put(plan.cache_key, text)
+        else:
+            # 降级摘要不缓存，下一轮仍会尝试 AI 摘要
+            text, source = self._extractive_summary(history, plan), "extractive"
+
+        compacted = [system, {"role": "system", "content": self.SUMMARY_PREFIX + text}]
+        compacted += history[plan.boundary:]
+        compacted.append(prompt)
+        return compacted, {
+            "compacted": True,
+            "tokens_before": plan.tokens_before,
+            "tokens_after": sum(_message_tokens(m) for m in compacted),
+            "budget_tokens": self.budget_tokens,
+            "messages_summarized": plan.boundary,
+            "messages_kept": len(history) - plan.boundary,
+            "summary_source": source,
+        }
+
+    @classmethod
+    def stats(cls) -> dict:
+        return cls._cache.stats()
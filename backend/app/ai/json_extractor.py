@@ -0,0 +1,146 @@
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple, Type
+from pydantic import BaseModel, ValidationError
+
+# 模型常见的尾随逗号: {"a": 1,} / [1, 2,]
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class JSONExtractionError(ValueError):
+    """无法从模型输出中提取出符合 Schema 的 JSON"""
+    pass
+
+
+class StreamingJSONExtractor:
+    """
+    增量 JSON 提取器（可逐段 feed 流式分片，也可一次性 feed 完整回复）
+
+    - 跳过 JSON 之前的 ```json 代码块标记和说明文字，从第一个 { 开始扫描
+    - 跟踪括号栈与字符串状态，顶层对象闭合后忽略后续内容
+    - 输出被截断时尝试修复：补齐未闭合的字符串和括号，必要时回退到最近一个完整的值
+    - 传入 schema 时用 Pydantic 校验；顶层字段每完成一个就检查一次，
+      必填字段齐全即 ready，调用方可以提前中止流式请求，节省输出 token
+    """
+
+    def __init__(self, schema: Optional[Type[BaseModel]] = None):
+        self.schema = schema
+        self._buffer: List[str] = []
+        self._started = False
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        # 可安全截断的位置: (截断后长度, 当时的括号栈)
+        self._cut_points: List[Tuple[int, str]] = []
+        self.complete = False
+        self.ready = False
+        self._ready_result: Optional[Dict[str, Any]] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._buffer)
+
+    def feed(self, chunk: str) -> bool:
+        """追加一段输出，返回是否已可提前结束（对象已闭合或必填字段已齐全）"""
+        for ch in chunk:
+            if self.complete:
+                break
+            if not self._started:
+                if ch != "{":
+                    continue
+                self._started = True
+            self._consume(ch)
+        return self.complete or self.ready
+
+    def _consume(self, ch: str):
+        self._buffer.append(ch)
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+            return
+
+        if ch == '"':
+            self._in_string = True
+        elif ch in _CLOSERS:
+            self._stack.append(ch)
+        elif ch in "}]":
+            if self._stack:
+                self._stack.pop()
+            self._cut_points.append((len(self._buffer), "".join(self._stack)))
+            if not self._stack:
+                self.complete = True
+            elif len(self._stack) == 1:
+                self._check_ready(len(self._buffer))
+        elif ch == ",":
+            # 逗号前是一个完整的值
+            self._cut_points.append((len(self._buffer) - 1, "".join(self._stack)))
+            if len(self._stack) == 1:
+                self._check_ready(len(self._buffer) - 1)
+
+    def _check_ready(self, end: int):
+        """顶层字段完成时检查必填字段是否齐全"""
+        if self.schema is None or self.ready:
+            return
+        try:
+            candidate = self._loads(self.text[:end] + "}")
+            self._ready_result = self._validate(candidate)
+            self.ready = True
+        except (ValueError, ValidationError):
+            pass
+
+    @staticmethod
+    def _loads(text: str) -> Any:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text))
+
+    def _validate(self, data: Any) -> Dict[str, Any]:
+        if not isinstance(data, dict):
+            raise JSONExtractionError("top-level JSON value is not an object")
+        if self.schema is None:
+            return data
+        return self.schema.model_validate(data).model_dump()
+
+    def _repair_candidates(self):
+        """按保留内容从多到少的顺序产出修复后的候选文本"""
+        text = self.text
+        closers = "".join(_CLOSERS[c] for c in reversed(self._stack))
+        if self._in_string:
+            # 截断在字符串中间：补齐引号（值被截短，但通常仍可用）
+            yield text + ('\\' if self._escape else "") + '"' + closers
+        else:
+            yield text + closers
+        for end, stack in reversed(self._cut_points):
+            yield text[:end] + "".join(_CLOSERS[c] for c in reversed(stack))
+
+    def result(self) -> Dict[str, Any]:
+        """返回解析并校验后的对象；无法修复或校验失败时抛出 JSONExtractionError"""
+        if not self._started:
+            raise JSONExtractionError("no JSON object found in model output")
+        if self.complete:
+            try:
+                return self._validate(self._loads(self.text))
+            except (ValueError, ValidationError) as e:
+                raise JSONExtractionError(str(e)) from e
+        if self._ready_result is not None:
+            return self._ready_result
+
+        first_error: Optional[Exception] = None
+        for candidate in self._repair_candidates():
+            try:
+                return self._validate(self._loads(candidate))
+            except (ValueError, ValidationError) as e:
+                # 保留内容最多的候选的错误，最能说明问题
+                first_error = first_error or e
+        raise JSONExtractionError(f"truncated JSON could not be repaired: {first_error}") from first_error
+
+
+def extract_json(text: str, schema: Optional[Type[BaseModel]] = None) -> Dict[str, Any]:
+    """从完整的模型回复中提取 JSON 对象（兼容代码块包裹与截断）"""
+    extractor = StreamingJSONExtractor(schema)
+    extractor.feed(text or "")
+    return extractor.result()
@@ -0,0 +1,155 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+# 延迟直方图桶上界（秒），最后一个桶为 +Inf
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 90.0)
+
+
+class _CallStats:
+    def __init__(self):
+        self.calls = 0
+        self.outcomes: Dict[str, int] = defaultdict(int)
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.usage_estimated = 0  # token 数为估算值的调用次数（流提前结束、上游未返回 usage）
+
+    def observe(self, latency: float):
+        self.latency_sum += latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """按直方图估算分位数（返回所在桶上界）"""
+        total = sum(self.buckets)
+        if not total:
+            return None
+        target = q * total
+        cumulative = 0
+        for i, count in enumerate(self.buckets):
+            cumulative += count
+            if cumulative >= target:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float("inf")
+        return None
+
+    def to_dict(self) -> dict:
+        observed = sum(self.buckets)
+        return {
+            "calls": self.calls,
+            "outcomes": dict(self.outcomes),
+            "latency_avg_ms": round(self.latency_sum / observed * 1000, 1) if observed else 0.0,
+            "latency_p50_s": self.percentile(0.5),
+            "latency_p95_s": self.percentile(0.95),
+            "latency_histogram": {
+                **{f"le_{b}": c for b, c in zip(LATENCY_BUCKETS, self.buckets)},
+                "le_inf": self.buckets[-1],
+            },
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "usage_estimated_calls": self.usage_estimated,
+        }
+
+
+class AIMetrics:
+    """
+    AI 调用埋点汇总（进程内）
+
+    - 上游调用：按 (调用方, 模型) 统计次数、结果、延迟直方图、token 用量
+    - 缓存：按 (缓存名, 调用方) 统计命中/未命中
+    - 业务结果：按调用方统计返回给用户的结果中降级（Mock/规则）占比
+    - 对冲：按调用方统计 SLO 内返回、先返回临时结果、临时结果被替换/未能替换的次数
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple[str, str], _CallStats] = defaultdict(_CallStats)
+        self._cache: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: {"hit": 0, "miss": 0})
+        self._results: Dict[str, Dict[str, int]] = defaultdict(lambda: {"total": 0, "fallback": 0})
+        self._hedge: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"in_time": 0, "provisional": 0, "replaced": 0, "late_failed": 0}
+        )
+
+    def record_call(
+        self,
+        caller: str,
+        model: str,
+        outcome: str,
+        latency: Optional[float] = None,
+        usage=None,
+        usage_estimated: bool = False
+    ):
+        """
+        记录一次上游调用
+        outcome: success / error / cancelled（调用被取消或流式被客户端中断）/ rejected（排队超时）/ unavailable（熔断或预算耗尽）
+        usage: OpenAI 响应中的 usage 对象（可为 None）；usage_estimated=True 表示为本地估算值
+        """
+        with self._lock:
+            stats = self._calls[(caller, model)]
+            stats.calls += 1
+            stats.outcomes[outcome] += 1
+            if latency is not None:
+                stats.observe(latency)
+            if usage is not None:
+                stats.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+                stats.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+                if usage_estimated:
+                    stats.usage_estimated += 1
+
+    def record_cache(self, cache: str, caller: str, hit: bool):
+        with self._lock:
+            self._cache[(cache, caller)]["hit" if hit else "miss"] += 1
+
+    def record_result(self, caller: str, fallback: bool):
+        """记录一次业务结果，fallback=True 表示返回的是 Mock/规则降级结果"""
+        with self._lock:
+            entry = self._results[caller]
+            entry["total"] += 1
+            if fallback:
+                entry["fallback"] += 1
+
+    def record_hedge(self, caller: str, outcome: str):
+        """outcome: in_time / provisional / replaced / late_failed"""
+        with self._lock:
+            self._hedge[caller][outcome] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            calls = [
+                {"caller": caller, "model": model, **stats.to_dict()}
+                for (caller, model), stats in self._calls.items()
+            ]
+            cache = [
+                {
+                    "cache": name,
+                    "caller": caller,
+                    **counts,
+                    "hit_rate": round(counts["hit"] / (counts["hit"] + counts["miss"]), 3)
+                    if counts["hit"] + counts["miss"] else 0.0,
+                }
+                for (name, caller), counts in self._cache.items()
+            ]
+            results = {
+                caller: {
+                    **counts,
+                    "fallback_rate": round(counts["fallback"] / counts["total"], 3) if counts["total"] else 0.0,
+                }
+                for caller, counts in self._results.items()
+            }
+            hedge = {caller: dict(counts) for caller, counts in self._hedge.items()}
+        return {"calls": calls, "cache": cache, "results": results, "hedge": hedge}
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._cache.clear()
+            self._results.clear()
+            self._hedge.clear()
+
+
+# 进程内共享的埋点实例
+ai_metrics = AIMetrics()
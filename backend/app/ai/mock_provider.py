@@ -1,9 +1,12 @@
 import random
 from app.ai.base import BaseAIProvider
 from typing import Dict, Any, Optional
+from app.ai.resilience import Deadline
+from app.ai.scheduler import LANE_CONSULT
 
 class MockAIProvider(BaseAIProvider):
-    def analyze_face(self, image_path: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def analyze_face(self, image_path: str, context: Optional[Dict[str, Any]] = None,
+                     deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         # Context: last_metrics (dict) 上一次的指标
         last_metrics = context.get("last_metrics", {}) if context else {}
         
@@ -45,7 +48,8 @@ class MockAIProvider(BaseAIProvider):
             "ai_provider": "MockAI-v1"
         }
 
-    def generate_plan(self, patient_data: Dict[str, Any], jieqi: str) -> Dict[str, Any]:
+    def generate_plan(self, patient_data: Dict[str, Any], jieqi: str,
+                      deadline: Optional[Deadline] = None) -> Dict[str, Any]:
         # 生成一个为期2周的方案
         goal = f"针对{jieqi}节气的皮肤调理"
         
@@ -73,3 +77,23 @@ class MockAIProvider(BaseAIProvider):
             "phases": phases,
             "sys_advice": f"结合患者历史数据与{jieqi}气候特点，建议采取稳进式护肤策略。"
         }
+
+    def chat(self, history: list, prompt: str, deadline: Optional[Deadline] = None,
+             lane: str = LANE_CONSULT, compaction_stats: Optional[dict] = None) -> str:
+        return (
+            f"您好，关于「{prompt[:30]}」，从中医角度看，皮肤问题多与脏腑气血失调相关。"
+            "建议保持规律作息、饮食清淡，并来院进行面诊以便给出个性化调理方案。"
+        )
+
+    # Mock 数据为纯内存计算，异步接口直接复用同步实现，无需线程池
+    async def analyze_face_async(self, image_path: str, context: Optional[Dict[str, Any]] = None,
+                                 deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        return self.analyze_face(image_path, context)
+
+    async def generate_plan_async(self, patient_data: Dict[str, Any], jieqi: str,
+                                  deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        return self.generate_plan(patient_data, jieqi)
+
+    async def chat_async(self, history: list, prompt: str, deadline: Optional[Deadline] = None,
+                         lane: str = LANE_CONSULT, compaction_stats: Optional[dict] = None) -> str:
+        return self.chat(history, prompt)
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+from typing import Callable, Dict, Tuple
+from app.core.config import settings
+from app.ai.base import BaseAIProvider
+from app.ai.deepseek_provider import DeepSeekProvider
+from app.ai.mock_provider import MockAIProvider
+from app.ai.scheduler import LANE_PRIORITY
+
+
+class ProviderRegistry:
+    """
+    AI Provider 注册表
+
+    - 按 settings.AI_PROVIDER 选择实现，AI_TASK_PROVIDERS / AI_TASK_MODELS 可按任务覆盖
+      （任务即调度通道: consult / face_exam / survey / plan），例如问卷使用更便宜的模型
+    - 相同 (实现, 模型) 只创建一个实例；指向同一上游的 DeepSeekProvider 共用一套 HTTP 连接池
+    - 启动时可预热，关闭时统一释放连接
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._factories: Dict[str, Callable[[str], BaseAIProvider]] = {}
+        self._instances: Dict[Tuple[str, str], BaseAIProvider] = {}
+        self._clients: Dict[Tuple[str, str], tuple] = {}
+
+        self.register("modelscope", self._create_deepseek)
+        self.register("deepseek", self._create_deepseek)
+        self.register("mock", lambda model: MockAIProvider())
+
+    def register(self, name: str, factory: Callable[[str], BaseAIProvider]):
+        """注册 Provider 实现；factory(model) 返回实例，model 为空时使用实现的默认模型"""
+        self._factories[name.lower()] = factory
+
+    def _create_deepseek(self, model: str) -> DeepSeekProvider:
+        api_key = settings.MODELSCOPE_API_KEY
+        if not api_key:
+            return DeepSeekProvider(model=model)
+        # 调用方已持有 self._lock
+        client_key = (settings.MODELSCOPE_BASE_URL, api_key)
+        if client_key not in self._clients:
+            self._clients[client_key] = DeepSeekProvider.create_clients(*client_key)
+        client, async_client = self._clients[client_key]
+        return DeepSeekProvider(model=model, client=client, async_client=async_client)
+
+    @staticmethod
+    def resolve(task: str) -> Tuple[str, str]:
+        """返回任务对应的 (实现名, 模型)"""
+        name = settings.AI_TASK_PROVIDERS.get(task, settings.AI_PROVIDER).lower()
+        model = settings.AI_TASK_MODELS.get(task, "")
+        return name, model
+
+    def get(self, task: str) -> BaseAIProvider:
+        name, model = self.resolve(task)
+        key = (name, model)
+        with self._lock:
+            provider = self._instances.get(key)
+            if provider is None:
+                factory = self._factories.get(name)
+                if factory is None:
+                    print(f"[ProviderRegistry] unknown AI provider '{name}' for {task}, using mock")
+                    factory = self._factories["mock"]
+                provider = factory(model or None)
+                self._instances[key] = provider
+            return provider
+
+    async def warm_up(self):
+        """实例化全部任务的 Provider 并预建上游连接；预热失败不影响启动"""
+        providers = list({id(p): p for p in (self.get(task) for task in LANE_PRIORITY)}.values())
+        results = await asyncio.gather(
+            *(p.warm_up_async() for p in providers), return_exceptions=True
+        )
+        for provider, result in zip(providers, results):
+            if isinstance(result, BaseException):
+                print(f"[ProviderRegistry] warm-up failed for {provider.provider_id}: "
+                      f"{type(result).__name__}: {result}")
+
+    async def aclose(self):
+        """关闭共享的连接池（应用关闭时调用）"""
+        with self._lock:
+            clients = list(self._clients.values())
+            instances = [
+                p for p in self._instances.values()
+                if not (isinstance(p, DeepSeekProvider) and
+                        any(p.async_client is c[1] for c in clients))
+            ]
+            self._clients.clear()
+            self._instances.clear()
+        for client, async_client in clients:
+            client.close()
+            await async_client.close()
+        for provider in instances:
+            await provider.aclose()
+
+    def snapshot(self) -> dict:
+        """各任务当前使用的实现与模型（供监控接口展示）"""
+        return {
+            task: self.get(task).provider_id for task in LANE_PRIORITY
+        }
+
+
+# 进程内共享的 Provider 注册表
+provider_registry = ProviderRegistry()
+
+
+def get_provider(task: str) -> BaseAIProvider:
+    return provider_registry.get(task)
@@ -0,0 +1,184 @@
+import time
+import threading
+from collections import deque
+from typing import Dict, Optional
+from app.core.config import settings
+
+
+class Deadline:
+    """
+    单次请求的时间预算（基于 monotonic 时钟）。
+    由调用方创建并逐层传递，Provider 据此收紧每次上游调用的超时。
+    """
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开时拒绝调用"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    上游 AI 服务熔断器：closed / open / half_open
+
+    - closed: 在最近 window_size 次调用中，失败率或慢调用率超过阈值则打开
+    - open: 直接拒绝调用（调用方走降级），open_seconds 后进入 half_open
+    - half_open: 放行少量探测调用，全部成功则关闭，任一失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int = None,
+        min_calls: int = None,
+        failure_rate_threshold: float = None,
+        slow_call_seconds: float = None,
+        slow_call_rate_threshold: float = None,
+        open_seconds: float = None,
+        half_open_max_calls: int = None
+    ):
+        self.name = name
+        self.window_size = window_size or settings.AI_BREAKER_WINDOW_SIZE
+        self.min_calls = min_calls or settings.AI_BREAKER_MIN_CALLS
+        self.failure_rate_threshold = failure_rate_threshold or settings.AI_BREAKER_FAILURE_RATE
+        self.slow_call_seconds = slow_call_seconds or settings.AI_BREAKER_SLOW_CALL_SECONDS
+        self.slow_call_rate_threshold = slow_call_rate_threshold or settings.AI_BREAKER_SLOW_CALL_RATE
+        self.open_seconds = open_seconds or settings.AI_BREAKER_OPEN_SECONDS
+        self.half_open_max_calls = half_open_max_calls or settings.AI_BREAKER_HALF_OPEN_CALLS
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        # 每项为 (是否失败, 是否慢调用)
+        self._window = deque(maxlen=self.window_size)
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._half_open_successes = 0
+        self._rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._half_open_in_flight = 0
+            self._half_open_successes = 0
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._window.clear()
+        print(f"[CircuitBreaker:{self.name}] opened")
+
+    def allow_request(self) -> bool:
+        """是否放行本次调用；放行后必须调用 record_success / record_failure，调用被取消时调用 release"""
+        with self._lock:
+            self._refresh_state()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def release(self):
+        """
+        放行的调用未得出成败就结束（asyncio 取消、客户端断开等）：不计入统计，
+        只归还半开状态的探测名额，否则名额耗尽后熔断器一直停在 half_open
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+
+    def record_success(self, latency: float):
+        self._record(failed=False, latency=latency)
+
+    def record_failure(self, latency: float):
+        self._record(failed=True, latency=latency)
+
+    def _record(self, failed: bool, latency: float):
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._half_open_in_flight = max(0, self._half_open_in_flight - 1)
+                if failed or slow:
+                    self._open()
+                    return
+                self._half_open_successes += 1
+                if self._half_open_successes >= self.half_open_max_calls:
+                    self._state = self.CLOSED
+                    self._window.clear()
+                    print(f"[CircuitBreaker:{self.name}] closed")
+                return
+
+            if self._state == self.OPEN:
+                return
+
+            self._window.append((failed, slow))
+            if len(self._window) < self.min_calls:
+                return
+
+            failures = sum(1 for f, _ in self._window if f)
+            slow_calls = sum(1 for _, s in self._window if s)
+            if (failures / len(self._window) >= self.failure_rate_threshold
+                    or slow_calls / len(self._window) >= self.slow_call_rate_threshold):
+                self._open()
+
+    def snapshot(self) -> dict:
+        """供监控接口展示"""
+        with self._lock:
+            self._refresh_state()
+            calls = len(self._window)
+            failures = sum(1 for f, _ in self._window if f)
+            slow_calls = sum(1 for _, s in self._window if s)
+            return {
+                "name": self.name,
+                "state": self._state,
+                "window_calls": calls,
+                "failure_rate": round(failures / calls, 3) if calls else 0.0,
+                "slow_call_rate": round(slow_calls / calls, 3) if calls else 0.0,
+                "rejected_calls": self._rejected,
+                "open_remaining_seconds": round(
+                    max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1
+                ) if self._state == self.OPEN else 0.0,
+            }
+
+
+# 按上游地址共享熔断器，多个 Provider 实例指向同一服务时共用状态
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breakers_snapshot() -> list:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [b.snapshot() for b in breakers]
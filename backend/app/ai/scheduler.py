@@ -0,0 +1,182 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import Dict, Optional
+from app.core.config import settings
+
+# 优先级通道（数值越小越优先）
+LANE_CONSULT = "consult"        # 交互式问诊
+LANE_FACE_EXAM = "face_exam"    # 面诊分析
+LANE_SURVEY = "survey"          # 问卷建议
+LANE_PLAN = "plan"              # 方案生成（含批量重算）
+
+LANE_PRIORITY = {
+    LANE_CONSULT: 0,
+    LANE_FACE_EXAM: 1,
+    LANE_SURVEY: 2,
+    LANE_PLAN: 3,
+}
+
+
+class AICallRejectedError(Exception):
+    """排队超时，调度器拒绝本次调用"""
+    pass
+
+
+class _Waiter:
+    def __init__(self, lane: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.lane = lane
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.loop = loop
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def wake(self):
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve_future)
+
+    def _resolve_future(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class _LaneStats:
+    def __init__(self):
+        self.acquired = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, waited: float):
+        self.acquired += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+
+class AICallScheduler:
+    """
+    出站 AI 调用调度器
+
+    - 全局最多 max_in_flight 个并发上游调用（同步线程与异步协程共享额度）
+    - 排队时按通道优先级放行，交互式问诊优先于批量方案
+    - 排队超过等待上限时拒绝，调用方走降级
+    """
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queues: Dict[str, deque] = {lane: deque() for lane in LANE_PRIORITY}
+        self._stats: Dict[str, _LaneStats] = {lane: _LaneStats() for lane in LANE_PRIORITY}
+
+    @staticmethod
+    def _normalize_lane(lane: Optional[str]) -> str:
+        return lane if lane in LANE_PRIORITY else LANE_CONSULT
+
+    def _try_acquire_locked(self, lane: str) -> bool:
+        """有空闲额度且没有同级或更高优先级在排队时直接放行"""
+        if self._in_flight >= self.max_in_flight:
+            return False
+        priority = LANE_PRIORITY[lane]
+        for other, queue in self._queues.items():
+            if queue and LANE_PRIORITY[other] <= priority:
+                return False
+        self._in_flight += 1
+        self._stats[lane].record_wait(0.0)
+        return True
+
+    def _dispatch_locked(self):
+        """按优先级把空闲额度分配给排队者"""
+        while self._in_flight < self.max_in_flight:
+            waiter = None
+            for lane in sorted(self._queues, key=LANE_PRIORITY.get):
+                if self._queues[lane]:
+                    waiter = self._queues[lane].popleft()
+                    break
+            if waiter is None:
+                return
+            waiter.granted = True
+            self._in_flight += 1
+            self._stats[waiter.lane].record_wait(time.monotonic() - waiter.enqueued_at)
+            waiter.wake()
+
+    def _abandon_locked(self, waiter: _Waiter) -> bool:
+        """
+        等待超时/取消后的清理；返回 True 表示在此期间已被放行（额度已占用）
+        """
+        if waiter.granted:
+            return True
+        try:
+            self._queues[waiter.lane].remove(waiter)
+        except ValueError:
+            pass
+        self._stats[waiter.lane].rejected += 1
+        return False
+
+    def acquire(self, lane: str = None, timeout: Optional[float] = None) -> bool:
+        """同步获取调用额度；返回 False 表示排队超时被拒绝"""
+        lane = self._normalize_lane(lane)
+        with self._lock:
+            if self._try_acquire_locked(lane):
+                return True
+            waiter = _Waiter(lane)
+            self._queues[lane].append(waiter)
+
+        waiter.event.wait(timeout)
+        with self._lock:
+            return self._abandon_locked(waiter)
+
+    async def acquire_async(self, lane: str = None, timeout: Optional[float] = None) -> bool:
+        """异步获取调用额度，排队期间不阻塞事件循环"""
+        lane = self._normalize_lane(lane)
+        with self._lock:
+            if self._try_acquire_locked(lane):
+                return True
+            waiter = _Waiter(lane, asyncio.get_running_loop())
+            self._queues[lane].append(waiter)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = self._abandon_locked(waiter)
+            if granted:
+                self.release()
+            raise
+
+        with self._lock:
+            return self._abandon_locked(waiter)
+
+    def release(self):
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._dispatch_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lanes = {}
+            for lane, st in self._stats.items():
+                lanes[lane] = {
+                    "queued": len(self._queues[lane]),
+                    "acquired": st.acquired,
+                    "rejected": st.rejected,
+                    "avg_wait_ms": round(st.wait_total / st.acquired * 1000, 1) if st.acquired else 0.0,
+                    "max_wait_ms": round(st.wait_max * 1000, 1),
+                }
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self._in_flight,
+                "lanes": lanes,
+            }
+
+
+# 进程内共享的调度器
+scheduler = AICallScheduler(settings.AI_SCHEDULER_MAX_IN_FLIGHT)
@@ -0,0 +1,109 @@
+import json
+import asyncio
+import hashlib
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+def request_key(**params) -> str:
+    """对请求参数（消息列表、模型、温度等）做稳定哈希，作为合并键"""
+    raw = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    同步调用合并：同一 key 同时只有一个线程真正执行 fn，
+    其余并发调用等待并共享其结果（或异常）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.leader_calls = 0
+        self.shared_calls = 0
+
+    def do(self, key: str, fn: Callable[[], Any], wait_timeout: Optional[float] = None) -> Any:
+        """
+        执行或加入一次调用；跟随者等待超过 wait_timeout 时抛出 TimeoutError
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.leader_calls += 1
+            else:
+                self.shared_calls += 1
+
+        if not leader:
+            if not call.event.wait(wait_timeout):
+                raise TimeoutError("single-flight wait timed out")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "leader_calls": self.leader_calls,
+            "shared_calls": self.shared_calls,
+        }
+
+
+class AsyncSingleFlight:
+    """
+    异步调用合并：同一 key 的并发协程共享同一个上游任务。
+    上游调用以独立 Task 运行，发起方被取消不会影响其他等待者。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.leader_calls = 0
+        self.shared_calls = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]],
+                 wait_timeout: Optional[float] = None) -> Any:
+        """
+        执行或加入一次调用；等待超过 wait_timeout 时抛出 asyncio.TimeoutError
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.leader_calls += 1
+        else:
+            self.shared_calls += 1
+
+        return await asyncio.wait_for(asyncio.shield(task), wait_timeout)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "leader_calls": self.leader_calls,
+            "shared_calls": self.shared_calls,
+        }
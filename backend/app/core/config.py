@@ -1,5 +1,5 @@
 import os
-from typing import List, Union
+from typing import Dict, List, Union
 from pydantic import field_validator
 from pydantic_settings import BaseSettings
 
@@ -14,7 +14,117 @@ class Settings(BaseSettings):
     MODELSCOPE_MODEL: str = os.getenv("MODELSCOPE_MODEL", "deepseek-ai/DeepSeek-V3.2")
     MODELSCOPE_BASE_URL: str = os.getenv("MODELSCOPE_BASE_URL", "https://api-inference.modelscope.cn/v1")
     AI_PROVIDER: str = os.getenv("AI_PROVIDER", "modelscope")  # 使用真实 AI
+    # 按任务覆盖 Provider / 模型（任务: consult, face_exam, survey, plan），
+    # 如 AI_TASK_PROVIDERS='{"face_exam": "mock"}'、AI_TASK_MODELS='{"survey": "Qwen/Qwen2.5-7B-Instruct"}'
+    AI_TASK_PROVIDERS: Dict[str, str] = {}
+    AI_TASK_MODELS: Dict[str, str] = {}
+    AI_WARMUP_ENABLED: bool = True  # 启动时预建上游连接
+    AI_WARMUP_TIMEOUT: float = 5.0
+    # 结构化输出（面诊/方案）走流式增量解析，必填字段齐全即结束流
+    AI_STREAM_JSON_ENABLED: bool = True
+    AI_REQUEST_TIMEOUT: float = 90.0  # 单次 AI 调用超时（秒）
+    AI_MAX_CONNECTIONS: int = 100  # 异步 HTTP 连接池上限
+    AI_MAX_KEEPALIVE_CONNECTIONS: int = 20
     
+    # AI 熔断器：最近 N 次调用失败率/慢调用率超阈值后打开，直接走降级
+    AI_BREAKER_WINDOW_SIZE: int = 20
+    AI_BREAKER_MIN_CALLS: int = 5
+    AI_BREAKER_FAILURE_RATE: float = 0.5
+    AI_BREAKER_SLOW_CALL_SECONDS: float = 30.0
+    AI_BREAKER_SLOW_CALL_RATE: float = 0.8
+    AI_BREAKER_OPEN_SECONDS: float = 30.0
+    AI_BREAKER_HALF_OPEN_CALLS: int = 2
+    
+    # AI 调用调度：全局并发上限与最长排队时间（秒），超时拒绝并降级
+    AI_SCHEDULER_MAX_IN_FLIGHT: int = 8
+    AI_SCHEDULER_MAX_QUEUE_SECONDS: float = 10.0
+    
+    # 各业务调用 AI 的时间预算（秒），超出后直接降级
+    AI_DEADLINE_FACE_EXAM: float = 60.0
+    AI_DEADLINE_PLAN: float = 30.0
+    AI_DEADLINE_SURVEY: float = 15.0
+    
+    # 对冲降级：AI 在各接口的延迟 SLO（秒）内未返回时先返回 Mock/规则结果（provisional），
+    # AI 结果在后台完成后替换临时结果；SLO 为 0 表示该接口不启用
+    AI_HEDGE_ENABLED: bool = False
+    AI_HEDGE_SLO_FACE_EXAM: float = 8.0
+    AI_HEDGE_SLO_PLAN: float = 5.0
+    AI_HEDGE_SLO_SURVEY: float = 3.0
+    AI_HEDGE_WORKERS: int = 8
+    AI_HEDGE_FINALIZE_WORKERS: int = 2  # 迟到结果写回数据库的线程数，与 AI 调用线程分开
+    
+    # 面诊异步分析工作池
+    FACE_EXAM_WORKERS: int = 4
+    FACE_EXAM_EVENTS_TIMEOUT: float = 120.0  # SSE 订阅最长等待（秒）
+    
+    # 批量面诊
+    FACE_EXAM_BATCH_MAX_ITEMS: int = 50
+    FACE_EXAM_BATCH_CONCURRENCY: int = 4  # 同时进行的 AI 分析数
+    
+    # 历史面诊照片批量导入（import_exams.py）
+    IMPORT_WORKERS: int = 8  # 并行写入图片的线程数
+    IMPORT_BATCH_SIZE: int = 200  # 每批写入的记录数，也是断点续传的粒度
+    
+    # 面诊分析缓存（同图重复上传不再调用 AI）
+    ANALYSIS_CACHE_ENABLED: bool = True
+    ANALYSIS_CACHE_TTL_SECONDS: int = 30 * 24 * 3600  # 30 天
+    ANALYSIS_CACHE_MAX_ENTRIES: int = 10000
+    
+    # 方案生成缓存（按节气 + 分桶指标复用 AI 方案）
+    PLAN_CACHE_ENABLED: bool = True
+    PLAN_CACHE_MAX_ENTRIES: int = 512
+    PLAN_CACHE_METRIC_BUCKET: int = 10  # 0-100 评分的分桶宽度
+    PLAN_CACHE_SKIN_AGE_BUCKET: int = 5  # 肌龄分桶宽度（岁）
+    
+    # 多轮问诊历史压缩：超出 token 预算时，较早轮次替换为滚动摘要
+    CHAT_HISTORY_TOKEN_BUDGET: int = 3000
+    CHAT_HISTORY_KEEP_RECENT: int = 6  # 原样保留的最近消息条数（也是摘要边界的对齐步长）
+    CHAT_SUMMARY_MAX_TOKENS: int = 300
+    CHAT_SUMMARY_CACHE_MAX_ENTRIES: int = 1024
+    
+    # 服务端问诊会话：空闲超时后过期清理，活跃会话历史保存在内存热缓存
+    CONSULT_SESSION_IDLE_SECONDS: int = 2 * 3600
+    CONSULT_SESSION_CACHE_MAX_ENTRIES: int = 1000
+    CONSULT_SESSION_CLEANUP_INTERVAL: float = 600.0  # 清理间隔（秒）
+    
+    # 上传图片缩略图：在进程池中生成，与原图存放在同一目录
+    THUMBNAIL_ENABLED: bool = True
+    THUMBNAIL_SIZES: List[int] = [240, 720]  # 长边像素，第一个尺寸用作 thumbnail_url
+    THUMBNAIL_FORMATS: List[str] = ["webp", "jpeg"]  # 第一个格式用作 thumbnail_url
+    THUMBNAIL_QUALITY: int = 80
+    THUMBNAIL_WORKERS: int = 2
+    
+    # AI 分析前的图片规范化：旋转、去元数据、缩小后重新编码，原图保留归档
+    ANALYSIS_IMAGE_NORMALIZE_ENABLED: bool = True
+    ANALYSIS_IMAGE_MAX_SIDE: int = 1024  # 长边像素
+    ANALYSIS_IMAGE_QUALITY: int = 85
+    
+    # /static/uploads 缓存有效期（秒）；上传文件按内容寻址、永不改变，可长期缓存
+    UPLOAD_CACHE_MAX_AGE: int = 365 * 24 * 3600
+    
+    # 上传文件存储后端: local（本地 uploads/ 目录）/ s3（S3 兼容对象存储，多节点共享）
+    STORAGE_BACKEND: str = "local"
+    S3_ENDPOINT_URL: str = ""  # MinIO 等自建服务地址，如 http://127.0.0.1:9000；AWS 留空
+    S3_REGION: str = "us-east-1"
+    S3_ACCESS_KEY: str = ""
+    S3_SECRET_KEY: str = ""
+    S3_BUCKET: str = "face-ai-uploads"
+    S3_KEY_PREFIX: str = "uploads/"
+    S3_PUBLIC_BASE_URL: str = ""  # 配置 CDN/公开读地址后不再使用预签名 URL
+    S3_PRESIGN_EXPIRES: int = 3600  # 预签名读取 URL 有效期（秒）
+    S3_MAX_POOL_CONNECTIONS: int = 32
+    S3_MULTIPART_THRESHOLD: int = 8 * 1024 * 1024  # 超过该大小分片上传
+    S3_MULTIPART_CHUNKSIZE: int = 8 * 1024 * 1024  # 分片大小（S3 要求至少 5MB）
+    S3_MULTIPART_CONCURRENCY: int = 4
+    S3_SCRATCH_DIR: str = "uploads/.tmp/s3"  # 生成缩略图等需要解码时的本地临时目录
+    
+    # 感知哈希近似重复检索：同一患者重复上传复用分析结果，跨患者同图标记
+    PHASH_ENABLED: bool = True
+    PHASH_REUSE_ENABLED: bool = True
+    PHASH_REUSE_MAX_DISTANCE: int = 4  # 汉明距离（64 位），不超过该值视为同一张照片
+    PHASH_DUPLICATE_MAX_DISTANCE: int = 6  # 跨患者标记阈值
+    PHASH_INDEX_REFRESH_SECONDS: int = 600  # 后台从数据库增量同步其他节点新增记录的间隔
+
     # CORS - 默认允许本地开发和常见部署场景
     BACKEND_CORS_ORIGINS: List[str] = ["http://localhost:5173", "http://localhost:3000", "http://127.0.0.1:5173"]
 
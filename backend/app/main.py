@@ -1,6 +1,5 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from app.core.config import settings
 from app.core.database import engine
@@ -10,8 +9,21 @@ from app.models.base import Base
 from app.models.patient import Patient, User
 from app.models.face_exam import FaceExam
 from app.models.plan import Plan, Survey, TimelineEvent
+from app.models.analysis_cache import AnalysisCache
+from app.models.consult_session import ConsultSession, ConsultMessage
+from app.models.stored_image import StoredImage
 
 from app.routers import patient, face_exam, plan, timeline, dashboard, auth, ai
+from app.services.face_exam_worker import FaceExamWorker
+from app.services.consult_session_service import ConsultSessionService
+from app.services.plan_service import PlanService
+from app.services.survey_service import SurveyService
+from app.services.thumbnail_service import ThumbnailService
+from app.services.perceptual_hash_service import PerceptualHashService
+from app.ai.hedging import AIHedge
+from app.ai.registry import provider_registry
+from app.storage.registry import close_storage
+from app.utils.upload_files import UploadStaticFiles
 
 # 创建数据库表
 Base.metadata.create_all(bind=engine)
@@ -37,7 +49,30 @@ app.add_middleware(
 )
 
 # 静态文件服务 - 提供上传图片访问
-app.mount("/static/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
+app.mount("/static/uploads", UploadStaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
+
+@app.on_event("startup")
+async def startup():
+    # 重新投递上次未完成的面诊分析任务，以及对冲回调随重启丢失的临时结果
+    FaceExamWorker.resume_pending()
+    PlanService.resume_provisional()
+    SurveyService.resume_provisional()
+    # 后台加载近似图片索引
+    PerceptualHashService.warm_up()
+    # 定期清理空闲过期的问诊会话
+    ConsultSessionService.start_cleanup()
+    # 预先创建各任务的 AI Provider 并建立上游连接
+    if settings.AI_WARMUP_ENABLED:
+        await provider_registry.warm_up()
+
+@app.on_event("shutdown")
+async def shutdown():
+    FaceExamWorker.shutdown()
+    ConsultSessionService.stop_cleanup()
+    AIHedge.shutdown()
+    ThumbnailService.shutdown()
+    close_storage()
+    await provider_registry.aclose()
 
 @app.get("/")
 def root():
@@ -2,3 +2,6 @@ from app.models.base import Base
 from app.models.patient import Patient, User
 from app.models.face_exam import FaceExam
 from app.models.plan import Plan, Survey, TimelineEvent
+from app.models.analysis_cache import AnalysisCache
+from app.models.consult_session import ConsultSession, ConsultMessage
+from app.models.stored_image import StoredImage
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from datetime import datetime
+from app.models.base import Base
+
+class AnalysisCache(Base):
+    """面诊 AI 分析结果缓存（按图片内容寻址）"""
+    __tablename__ = "analysis_cache"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    
+    # sha256(image_hash | provider | 归一化的 last_metrics)
+    cache_key = Column(String, unique=True, index=True)
+    image_hash = Column(String, index=True)
+    provider = Column(String)
+    
+    # analyze_face 的完整返回值
+    result = Column(JSON)
+    
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_accessed_at = Column(DateTime, default=datetime.utcnow, index=True)
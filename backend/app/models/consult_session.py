@@ -0,0 +1,35 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy.orm import relationship
+from datetime import datetime
+from app.models.base import Base
+
+class ConsultSession(Base):
+    """AI 问诊会话（服务端保存对话轮次，客户端只需传会话 ID）"""
+    __tablename__ = "consult_sessions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, unique=True, index=True)
+    patient_id = Column(Integer, ForeignKey("patient.id"), nullable=True)
+    
+    message_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_active_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    messages = relationship(
+        "ConsultMessage", back_populates="session",
+        order_by="ConsultMessage.id", cascade="all, delete-orphan"
+    )
+
+class ConsultMessage(Base):
+    __tablename__ = "consult_messages"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("consult_sessions.id"), index=True)
+    
+    role = Column(String)  # "user" / "assistant"
+    content = Column(Text)
+    provider = Column(String, nullable=True)  # 回复来源，如 DeepSeek-V3 / MockAI
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    session = relationship("ConsultSession", back_populates="messages")
@@ -16,8 +16,12 @@ class FaceExam(Base):
     image_hash = Column(String, nullable=True)  # MD5 hash
     image_width = Column(Integer, nullable=True)
     image_height = Column(Integer, nullable=True)
+    image_phash = Column(String, nullable=True)  # 感知哈希，见 PerceptualHashService
+    # 其他患者名下的近似图片: [{"exam_id", "patient_id", "distance"}]
+    duplicate_matches = Column(JSON, nullable=True)
     
-    # 处理状态: processing, done, failed
+    # 处理状态: processing, provisional（AI 超时先返回的临时结果）, done, failed,
+    # imported（批量导入的历史照片，未做 AI 分析）
     status = Column(String, default="done")
     
     # Structured Analysis Results
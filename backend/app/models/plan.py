@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Text, Boolean
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.models.base import Base
@@ -19,6 +19,9 @@ class Plan(Base):
     # Structure: [ { "phase": "Week 1-2", "actions": {...} }, ... ]
     phases = Column(JSON)
     
+    # AI 超时时先保存的默认方案，AI 完成后替换并置为 False
+    is_provisional = Column(Boolean, default=False)
+    
     created_at = Column(DateTime, default=datetime.utcnow)
     
     patient = relationship("Patient", back_populates="plans")
@@ -37,6 +40,7 @@ class Survey(Base):
     # Calculated Score
     score = Column(Integer)
     summary_advice = Column(Text)
+    is_provisional = Column(Boolean, default=False)  # 规则建议先行，AI 建议完成后替换
     
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from datetime import datetime
+from app.models.base import Base
+
+class StoredImage(Base):
+    """上传图片的内容寻址索引（相同内容只存一份，按引用计数回收）"""
+    __tablename__ = "stored_images"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # 文件内容 MD5，与 FaceExam.image_hash 一致
+    image_hash = Column(String, unique=True, index=True)
+    # 相对 uploads/ 的路径，按 hash 分目录: ab/cd/abcd....jpg
+    file_path = Column(String)
+
+    size_bytes = Column(Integer)
+    width = Column(Integer, default=0)
+    height = Column(Integer, default=0)
+    # 文件头探测到的真实格式与 EXIF 方向
+    format = Column(String, nullable=True)
+    orientation = Column(Integer, default=1)
+    # 64 位感知哈希（16 位十六进制），用于近似重复检索
+    phash = Column(String, nullable=True)
+
+    # 引用次数：每次上传 +1，delete_image -1，归零时删除文件
+    ref_count = Column(Integer, default=1)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_referenced_at = Column(DateTime, default=datetime.utcnow)
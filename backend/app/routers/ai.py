@@ -1,7 +1,23 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional, Any
 from app.ai.deepseek_provider import DeepSeekProvider
+from app.ai.registry import provider_registry
+from app.ai.resilience import breakers_snapshot
+from app.ai.scheduler import scheduler, LANE_CONSULT
+from app.ai.metrics import ai_metrics
+from app.ai.history_compactor import HistoryCompactor
+from app.core.database import get_db, SessionLocal
+from app.schemas.consult import (
+    ConsultSessionCreate, ConsultSessionMessageIn, ConsultSession,
+    ConsultSessionDetail, ConsultSessionReply
+)
+from app.services.consult_session_service import ConsultSessionService
+from app.services.image_normalize_service import ImageNormalizeService
+from app.services.perceptual_hash_service import PerceptualHashService
+from app.utils.sse import format_sse, SSE_HEADERS
 
 router = APIRouter()
 
@@ -12,15 +28,39 @@ class ConsultRequest(BaseModel):
 class ConsultResponse(BaseModel):
     reply: str
     provider: str
-
-# 单例模式，避免每次请求都实例化
-_provider_instance = None
+    compaction: Optional[Dict[str, Any]] = None  # 历史压缩统计（token 数、摘要来源等）
 
 def get_provider():
-    global _provider_instance
-    if _provider_instance is None:
-        _provider_instance = DeepSeekProvider()
-    return _provider_instance
+    # 由注册表统一管理实例与连接池，避免每次请求都实例化
+    return provider_registry.get(LANE_CONSULT)
+
+@router.get("/status")
+def ai_status():
+    """
+    AI 上游健康状态（熔断器、调度排队、请求合并统计，供监控使用）
+    """
+    return {
+        "providers": provider_registry.snapshot(),
+        "circuit_breakers": breakers_snapshot(),
+        "scheduler": scheduler.stats(),
+        "single_flight": {
+            "sync": DeepSeekProvider._flight.stats(),
+            "async": DeepSeekProvider._async_flight.stats(),
+        },
+        "history_summary_cache": HistoryCompactor.stats(),
+        "consult_sessions": ConsultSessionService.stats(),
+    }
+
+@router.get("/metrics")
+def ai_metrics_snapshot():
+    """
+    AI 调用埋点汇总：按调用方/模型的延迟直方图与 token 用量、缓存命中率、降级比例，
+    以及分析前图片规范化节省的字节数与耗时、近似图片索引规模与查询耗时
+    """
+    snapshot = ai_metrics.snapshot()
+    snapshot["image_normalization"] = ImageNormalizeService.stats()
+    snapshot["phash_index"] = PerceptualHashService.stats()
+    return snapshot
 
 @router.post("/tcm-consult", response_model=ConsultResponse)
 async def tcm_consult(request: ConsultRequest):
@@ -30,25 +70,156 @@ async def tcm_consult(request: ConsultRequest):
     - 支持上下文对话
     - 自动降级到 Mock 响应
     """
-    provider = get_provider()
+    return await _consult_reply(get_provider(), request.history, request.message)
+
+
+async def _consult_reply(provider, history: list, message: str) -> ConsultResponse:
+    compaction = {}
     
     try:
-        reply = provider.chat(request.history, request.message)
+        reply = await provider.chat_async(history, message, compaction_stats=compaction)
         
         if reply:
-            return ConsultResponse(reply=reply, provider="DeepSeek-V3")
+            ai_metrics.record_result(LANE_CONSULT, fallback=False)
+            # 注册表可能解析到不同模型或 Mock，返回实际使用的 Provider 标识
+            return ConsultResponse(reply=reply, provider=provider.provider_id, compaction=compaction or None)
         
         # API 返回空，降级到 Mock
-        mock_reply = _get_mock_tcm_response(request.message)
+        ai_metrics.record_result(LANE_CONSULT, fallback=True)
+        mock_reply = _get_mock_tcm_response(message)
         return ConsultResponse(reply=mock_reply, provider="MockAI")
         
     except Exception as e:
         print(f"[AI Consult Error] {type(e).__name__}: {str(e)}")
         # 出错时返回 Mock 响应而非 500
-        mock_reply = _get_mock_tcm_response(request.message)
+        ai_metrics.record_result(LANE_CONSULT, fallback=True)
+        mock_reply = _get_mock_tcm_response(message)
         return ConsultResponse(reply=mock_reply, provider="MockAI-Fallback")
 
 
+@router.post("/tcm-consult/stream")
+async def tcm_consult_stream(request: ConsultRequest):
+    """
+    中医美容 AI 问诊接口（SSE 流式）
+    
+    事件格式：
+    - data: {"delta": "..."}                      增量文本
+    - event: fallback / data: {"reply", "provider"} 上游失败，客户端应以 reply 替换已收到的内容
+    - event: done / data: {"provider", "compaction"} 结束（附历史压缩统计）
+    """
+    provider = get_provider()
+    return StreamingResponse(
+        _consult_event_stream(provider, request.history, request.message),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+async def _consult_event_stream(provider, history: list, message: str, on_complete=None):
+    """
+    on_complete(reply, provider_name) 在回复完整结束后调用（会话接口用于保存本轮对话）
+    """
+    received = []
+    compaction = {}
+    try:
+        async for delta in provider.chat_stream_async(
+            history, message, compaction_stats=compaction
+        ):
+            received.append(delta)
+            yield format_sse({"delta": delta})
+        
+        if received:
+            ai_metrics.record_result(LANE_CONSULT, fallback=False)
+            if on_complete:
+                on_complete("".join(received), provider.provider_id)
+            yield format_sse({"provider": provider.provider_id, "compaction": compaction or None}, event="done")
+            return
+        fallback_provider = "MockAI"
+    except Exception as e:
+        print(f"[AI Consult Stream Error] {type(e).__name__}: {str(e)}")
+        fallback_provider = "MockAI-Fallback"
+    
+    # 上游为空或中途失败，降级到 Mock 响应
+    ai_metrics.record_result(LANE_CONSULT, fallback=True)
+    mock_reply = _get_mock_tcm_response(message)
+    if on_complete:
+        on_complete(mock_reply, fallback_provider)
+    yield format_sse({"reply": mock_reply, "provider": fallback_provider}, event="fallback")
+    yield format_sse({"provider": fallback_provider}, event="done")
+
+
+# ===== 服务端问诊会话 =====
+# 对话轮次保存在服务端，客户端每轮只需传 session_id 和新消息
+
+def _get_session_or_404(db: Session, session_id: str):
+    session = ConsultSessionService.get(db, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
+    return session
+
+
+@router.post("/consult-sessions", response_model=ConsultSession)
+def create_consult_session(payload: ConsultSessionCreate = None, db: Session = Depends(get_db)):
+    """
+    创建问诊会话
+    """
+    return ConsultSessionService.create(db, payload.patient_id if payload else None)
+
+
+@router.get("/consult-sessions/{session_id}", response_model=ConsultSessionDetail)
+def get_consult_session(session_id: str, db: Session = Depends(get_db)):
+    """
+    获取会话及全部对话记录
+    """
+    return _get_session_or_404(db, session_id)
+
+
+@router.delete("/consult-sessions/{session_id}")
+def delete_consult_session(session_id: str, db: Session = Depends(get_db)):
+    if not ConsultSessionService.delete(db, session_id):
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
+    return {"deleted": True}
+
+
+@router.post("/consult-sessions/{session_id}/messages", response_model=ConsultSessionReply)
+async def send_consult_message(session_id: str, payload: ConsultSessionMessageIn, db: Session = Depends(get_db)):
+    """
+    在会话中发送一条消息，历史由服务端提供（走与 /tcm-consult 相同的 chat 路径）
+    """
+    session = _get_session_or_404(db, session_id)
+    history = ConsultSessionService.get_history(db, session)
+    
+    result = await _consult_reply(get_provider(), history, payload.message)
+    ConsultSessionService.append_turn(db, session, payload.message, result.reply, result.provider)
+    return ConsultSessionReply(session_id=session_id, **result.model_dump())
+
+
+@router.post("/consult-sessions/{session_id}/messages/stream")
+def send_consult_message_stream(session_id: str, payload: ConsultSessionMessageIn, db: Session = Depends(get_db)):
+    """
+    在会话中发送一条消息（SSE 流式，事件格式同 /tcm-consult/stream）
+    回复完整结束后才写入会话；客户端中途断开时本轮不保存
+    """
+    session = _get_session_or_404(db, session_id)
+    history = ConsultSessionService.get_history(db, session)
+    
+    def save_turn(reply: str, provider_name: str):
+        # 流式响应期间请求级数据库会话可能已关闭，使用独立会话保存
+        stream_db = SessionLocal()
+        try:
+            stream_session = ConsultSessionService.get(stream_db, session_id)
+            if stream_session:
+                ConsultSessionService.append_turn(stream_db, stream_session, payload.message, reply, provider_name)
+        finally:
+            stream_db.close()
+    
+    return StreamingResponse(
+        _consult_event_stream(get_provider(), history, payload.message, on_complete=save_turn),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
 def _get_mock_tcm_response(message: str) -> str:
     """当 AI 服务不可用时的模拟响应"""
     if "失眠" in message or "睡眠" in message:
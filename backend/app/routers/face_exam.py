@@ -1,10 +1,18 @@
+import time
+import asyncio
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.schemas.patient import FaceExam, FaceExamCreate
+from app.core.config import settings
+from app.core.database import get_db, SessionLocal
+from app.schemas.patient import FaceExam, FaceExamCreate, FaceExamBatchResult
 from app.services.face_exam_service import FaceExamService
+from app.services.face_exam_worker import FaceExamWorker
 from app.services.image_upload_service import ImageUploadService
+from app.services.thumbnail_service import ThumbnailService
+from app.services.perceptual_hash_service import PerceptualHashService
+from app.utils.sse import format_sse, SSE_HEADERS
 
 router = APIRouter()
 
@@ -20,6 +28,7 @@ async def create_face_exam(
     patient_id: int = Form(...),
     image_file: UploadFile = File(None),
     image_url: str = Form(None),
+    async_mode: bool = Form(False),
     db: Session = Depends(get_db),
     service: FaceExamService = Depends(get_face_exam_service),
     upload_service: ImageUploadService = Depends(get_image_upload_service)
@@ -30,6 +39,12 @@ async def create_face_exam(
     支持两种方式：
     1. 上传图片文件 (image_file)
     2. 直接提供图片 URL (image_url)
+    
+    async_mode=true 时立即返回 status=processing 的记录，分析在后台完成，
+    可通过 GET /face-exams/{exam_id} 轮询或 GET /face-exams/{exam_id}/events 订阅结果
+    
+    启用对冲（AI_HEDGE_ENABLED）时，AI 超过 SLO 未返回会先返回 status=provisional 的临时结果，
+    AI 完成后在后台替换，同样可通过上述接口获取最终结果
     """
     final_image_url = image_url
     image_metadata = None
@@ -45,16 +60,102 @@ async def create_face_exam(
     if not final_image_url:
         final_image_url = "https://via.placeholder.com/400x500.png?text=Face+Image"
     
+    if async_mode:
+        exam = service.create_pending_exam(
+            db=db,
+            patient_id=patient_id,
+            image_url=final_image_url,
+            image_metadata=image_metadata
+        )
+        FaceExamWorker.submit(exam.id)
+        if image_metadata:
+            ThumbnailService.submit(image_metadata["file_path"])
+        return exam
+    
     # 创建诊断记录
-    exam = service.create_exam(
+    exam = await service.create_exam_async(
         db=db, 
         patient_id=patient_id, 
         image_url=final_image_url,
         image_metadata=image_metadata
     )
+    if image_metadata:
+        ThumbnailService.submit(image_metadata["file_path"])
     
     return exam
 
+@router.post("/batch", response_model=FaceExamBatchResult, summary="批量上传并诊断")
+async def create_face_exams_batch(
+    patient_ids: List[int] = Form(...),
+    image_files: List[UploadFile] = File(...),
+    db: Session = Depends(get_db),
+    service: FaceExamService = Depends(get_face_exam_service),
+    upload_service: ImageUploadService = Depends(get_image_upload_service)
+):
+    """
+    批量面诊（如义诊活动集中拍摄后一次上传）
+    
+    patient_ids 与 image_files 按顺序一一对应；图片并发保存，
+    AI 分析有限并发执行，诊断记录与时间轴批量写入。
+    返回每一项的成功/失败结果，单项失败不影响其他项。
+    """
+    if len(patient_ids) != len(image_files):
+        raise HTTPException(status_code=400, detail="patient_ids 与 image_files 数量不一致")
+    if len(image_files) > settings.FACE_EXAM_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多上传 {settings.FACE_EXAM_BATCH_MAX_ITEMS} 张图片"
+        )
+    
+    saved = await asyncio.gather(
+        *(upload_service.save_image(f) for f in image_files),
+        return_exceptions=True
+    )
+    
+    items = []
+    for patient_id, outcome in zip(patient_ids, saved):
+        if isinstance(outcome, ValueError):
+            items.append({"patient_id": patient_id, "error": str(outcome)})
+        elif isinstance(outcome, BaseException):
+            print(f"[FaceExam Batch Upload Error] {type(outcome).__name__}: {outcome}")
+            items.append({"patient_id": patient_id, "error": "图片保存失败"})
+        else:
+            items.append({
+                "patient_id": patient_id,
+                "image_url": outcome["file_url"],
+                "image_metadata": outcome
+            })
+    
+    try:
+        results = await service.create_exams_batch_async(db, items)
+    except BaseException:
+        # 整批写入失败：释放全部已保存图片的引用
+        for item in items:
+            if "image_metadata" in item:
+                await asyncio.to_thread(upload_service.delete_image, item["image_metadata"]["file_path"])
+        raise
+    # 图片已保存但记录未创建（患者不存在、AI 分析失败等）的条目释放本次引用，不生成缩略图
+    for item, result in zip(items, results):
+        if "image_metadata" in item and not result["success"]:
+            await asyncio.to_thread(upload_service.delete_image, item["image_metadata"]["file_path"])
+    for file_path in {
+        item["image_metadata"]["file_path"]
+        for item, result in zip(items, results) if "image_metadata" in item and result["success"]
+    }:
+        ThumbnailService.submit(file_path)
+    
+    batch_items = [
+        {"index": i, "patient_id": items[i]["patient_id"], **result}
+        for i, result in enumerate(results)
+    ]
+    succeeded = sum(1 for r in results if r["success"])
+    return {
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "items": batch_items
+    }
+
 @router.post("/upload", summary="仅上传图片")
 async def upload_image(
     image_file: UploadFile = File(...),
@@ -79,6 +180,77 @@ def read_patient_exams(patient_id: int, db: Session = Depends(get_db)):
     exams = service.get_history(db, patient_id)
     return exams
 
+@router.get("/{exam_id}", response_model=FaceExam)
+def read_exam(exam_id: int, db: Session = Depends(get_db)):
+    """
+    获取单条诊断记录（异步模式下用于轮询 status）
+    """
+    exam = FaceExamService().get_exam(db, exam_id)
+    if not exam:
+        raise HTTPException(status_code=404, detail="诊断记录不存在")
+    return exam
+
+@router.get("/{exam_id}/similar", summary="查找近似图片的诊断记录")
+def read_similar_exams(exam_id: int, max_distance: int = 8, db: Session = Depends(get_db)):
+    """
+    按感知哈希查找与该记录图片近似的其他诊断记录（含其他患者），按汉明距离升序：
+    [{"exam_id", "patient_id", "distance"}]，0 表示几乎相同
+    """
+    exam = FaceExamService().get_exam(db, exam_id)
+    if not exam:
+        raise HTTPException(status_code=404, detail="诊断记录不存在")
+    if not exam.image_phash:
+        return []
+    max_distance = max(0, min(max_distance, 16))
+    return [
+        m for m in PerceptualHashService.find(exam.image_phash, max_distance) if m["exam_id"] != exam_id
+    ]
+
+@router.get("/{exam_id}/events")
+async def subscribe_exam(exam_id: int):
+    """
+    订阅诊断完成事件（SSE）
+    
+    - event: status / data: {"id", "status"}   当前状态（processing 期间周期性发送）
+    - event: provisional / data: 完整诊断记录  AI 超时先返回的临时结果（仅发送一次）
+    - event: done / data: 完整诊断记录         status 变为 done 或 failed 时发送并结束
+    """
+    return StreamingResponse(
+        _exam_event_stream(exam_id),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+async def _exam_event_stream(exam_id: int):
+    started = time.monotonic()
+    provisional_sent = False
+    while True:
+        db = SessionLocal()
+        try:
+            exam = FaceExamService().get_exam(db, exam_id)
+            if not exam:
+                yield format_sse({"id": exam_id, "detail": "诊断记录不存在"}, event="error")
+                return
+            if exam.status == "provisional":
+                if not provisional_sent:
+                    provisional_sent = True
+                    yield format_sse(
+                        FaceExam.model_validate(exam, from_attributes=True).model_dump(), event="provisional"
+                    )
+            elif exam.status != "processing":
+                yield format_sse(FaceExam.model_validate(exam, from_attributes=True).model_dump(), event="done")
+                return
+            else:
+                yield format_sse({"id": exam.id, "status": exam.status}, event="status")
+        finally:
+            db.close()
+        
+        if time.monotonic() - started > settings.FACE_EXAM_EVENTS_TIMEOUT:
+            yield format_sse({"id": exam_id, "detail": "等待超时，请稍后轮询"}, event="timeout")
+            return
+        await asyncio.sleep(1)
+
 @router.put("/{exam_id}/confirm", response_model=FaceExam)
 def confirm_exam(
     exam_id: int, 
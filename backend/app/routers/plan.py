@@ -1,10 +1,11 @@
-from typing import List
+from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.schemas.plan import Plan, Survey, SurveyCreate
 from app.services.plan_service import PlanService
 from app.services.survey_service import SurveyService
+from app.services.plan_cache_service import PlanCacheService
 
 router = APIRouter()
 
@@ -28,6 +29,18 @@ def get_latest_plan(patient_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="No plan found")
     return plan
 
+@router.delete("/plans/cache")
+def invalidate_plan_cache(jieqi: Optional[str] = None):
+    """
+    清除 AI 方案缓存；指定 jieqi 时只清除该节气的缓存
+    """
+    if jieqi:
+        removed = PlanCacheService.invalidate_jieqi(jieqi)
+    else:
+        removed = PlanCacheService.stats()["size"]
+        PlanCacheService.clear()
+    return {"removed": removed, "stats": PlanCacheService.stats()}
+
 # --- Survey Router ---
 @router.post("/surveys", response_model=Survey)
 def submit_survey(survey: SurveyCreate, db: Session = Depends(get_db)):
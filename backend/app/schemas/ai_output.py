@@ -0,0 +1,50 @@
+import math
+from typing import List, Optional, Dict
+from pydantic import BaseModel, field_validator
+
+# LLM 结构化输出 Schemas（用于校验模型返回的 JSON，允许额外字段透传）
+class FaceMetricsOutput(BaseModel):
+    skin_age: int
+    hydration: int
+    inflammation: int
+    elasticity: int
+    pigmentation: int
+    wrinkles: int
+    
+    @field_validator("skin_age", "hydration", "inflammation", "elasticity", "pigmentation", "wrinkles", mode="before")
+    @classmethod
+    def round_fractional(cls, v):
+        # 模型常返回 72.5 / "72.5" 这类小数，按四舍五入取整而不是判为无效输出
+        if isinstance(v, str):
+            try:
+                v = float(v)
+            except ValueError:
+                return v
+        if isinstance(v, float) and math.isfinite(v):
+            return round(v)
+        return v
+    
+    class Config:
+        extra = "allow"
+
+class FaceAnalysisOutput(BaseModel):
+    metrics: FaceMetricsOutput
+    advice_summary: str
+    detailed_advice: str
+    
+    class Config:
+        extra = "allow"
+
+class PlanPhaseOutput(BaseModel):
+    phase: str
+    actions: Dict[str, List[str]] = {}
+    
+    class Config:
+        extra = "allow"
+
+class PlanOutput(BaseModel):
+    goal: Optional[str] = None
+    phases: List[PlanPhaseOutput]
+    
+    class Config:
+        extra = "allow"
@@ -0,0 +1,38 @@
+from typing import List, Optional, Any, Dict
+from pydantic import BaseModel
+from datetime import datetime
+
+# Consult Session Schemas
+class ConsultSessionCreate(BaseModel):
+    patient_id: Optional[int] = None
+
+class ConsultSessionMessageIn(BaseModel):
+    message: str
+
+class ConsultMessage(BaseModel):
+    role: str
+    content: str
+    provider: Optional[str] = None
+    created_at: datetime
+    
+    class Config:
+        orm_mode = True
+
+class ConsultSession(BaseModel):
+    session_id: str
+    patient_id: Optional[int] = None
+    message_count: int
+    created_at: datetime
+    last_active_at: datetime
+    
+    class Config:
+        orm_mode = True
+
+class ConsultSessionDetail(ConsultSession):
+    messages: List[ConsultMessage] = []
+
+class ConsultSessionReply(BaseModel):
+    session_id: str
+    reply: str
+    provider: str
+    compaction: Optional[Dict[str, Any]] = None
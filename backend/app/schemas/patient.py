@@ -39,9 +39,12 @@ class FaceExam(FaceExamBase):
     image_hash: Optional[str] = None
     image_width: Optional[int] = None
     image_height: Optional[int] = None
+    image_phash: Optional[str] = None
+    duplicate_matches: Optional[List[dict]] = None
     status: Optional[str] = "done"
-    metrics: dict
-    advice_summary: str
+    # processing 状态下分析结果尚未回填
+    metrics: Optional[dict] = None
+    advice_summary: Optional[str] = None
     detailed_advice: Optional[str]
     ai_provider: Optional[str]
     doctor_confirmed: bool = False
@@ -52,3 +55,15 @@ class FaceExam(FaceExamBase):
     class Config:
         orm_mode = True
 
+class FaceExamBatchItem(BaseModel):
+    index: int  # 对应请求中的第几张图片
+    patient_id: int
+    success: bool
+    exam: Optional[FaceExam] = None
+    error: Optional[str] = None
+
+class FaceExamBatchResult(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    items: List[FaceExamBatchItem]
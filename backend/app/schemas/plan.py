@@ -18,6 +18,7 @@ class Plan(PlanBase):
     patient_id: int
     generated_at_jieqi: str
     phases: List[Dict[str, Any]]
+    is_provisional: Optional[bool] = False
     created_at: datetime
     
     class Config:
@@ -36,6 +37,7 @@ class Survey(SurveyBase):
     patient_id: int
     score: Optional[int]
     summary_advice: Optional[str]
+    is_provisional: Optional[bool] = False
     created_at: datetime
     
     class Config:
@@ -0,0 +1,119 @@
+import json
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any
+from sqlalchemy.orm import Session
+from app.models.analysis_cache import AnalysisCache
+from app.core.config import settings
+from app.ai.metrics import ai_metrics
+from app.ai.scheduler import LANE_FACE_EXAM
+
+class AnalysisCacheService:
+    """
+    面诊分析结果缓存
+
+    键 = (图片 MD5, Provider/模型, 归一化的 last_metrics)，
+    命中时直接返回已存结果，不再调用 AI。
+    过期条目按 TTL 失效，超出容量时按最近访问时间做 LRU 淘汰。
+    """
+
+    @staticmethod
+    def _normalize_metrics(metrics: Any) -> str:
+        """把上次指标归一化为稳定的字符串（键排序、数值取整、兼容 SQLite 返回字符串）"""
+        if isinstance(metrics, str):
+            try:
+                metrics = json.loads(metrics)
+            except ValueError:
+                metrics = {}
+        if not isinstance(metrics, dict):
+            metrics = {}
+
+        normalized = {}
+        for key, value in metrics.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = int(round(value))
+            normalized[key] = value
+        return json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+    @staticmethod
+    def build_key(image_hash: str, provider_id: str, last_metrics: Any = None) -> str:
+        raw = "|".join([image_hash, provider_id, AnalysisCacheService._normalize_metrics(last_metrics)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get(db: Session, cache_key: str) -> Optional[Dict[str, Any]]:
+        """查询缓存，过期条目会被删除并视为未命中"""
+        if not settings.ANALYSIS_CACHE_ENABLED:
+            return None
+
+        entry = db.query(AnalysisCache).filter(AnalysisCache.cache_key == cache_key).first()
+        if not entry:
+            ai_metrics.record_cache("analysis", LANE_FACE_EXAM, hit=False)
+            return None
+
+        now = datetime.utcnow()
+        if entry.created_at < now - timedelta(seconds=settings.ANALYSIS_CACHE_TTL_SECONDS):
+            db.delete(entry)
+            db.commit()
+            ai_metrics.record_cache("analysis", LANE_FACE_EXAM, hit=False)
+            return None
+
+        ai_metrics.record_cache("analysis", LANE_FACE_EXAM, hit=True)
+
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_accessed_at = now
+        db.commit()
+
+        result = entry.result
+        if isinstance(result, str):
+            result = json.loads(result)
+        return dict(result)
+
+    @staticmethod
+    def put(db: Session, cache_key: str, image_hash: str, provider_id: str, result: Dict[str, Any]):
+        """写入缓存（降级结果不缓存），并按 LRU 淘汰超出容量的条目"""
+        if not settings.ANALYSIS_CACHE_ENABLED or result.get("is_fallback"):
+            return
+
+        entry = db.query(AnalysisCache).filter(AnalysisCache.cache_key == cache_key).first()
+        now = datetime.utcnow()
+        if entry:
+            entry.result = result
+            entry.created_at = now
+            entry.last_accessed_at = now
+        else:
+            db.add(AnalysisCache(
+                cache_key=cache_key,
+                image_hash=image_hash,
+                provider=provider_id,
+                result=result,
+                created_at=now,
+                last_accessed_at=now
+            ))
+        db.commit()
+
+        AnalysisCacheService._evict(db)
+
+    @staticmethod
+    def _evict(db: Session):
+        overflow = db.query(AnalysisCache).count() - settings.ANALYSIS_CACHE_MAX_ENTRIES
+        if overflow <= 0:
+            return
+
+        stale_ids = [
+            row.id for row in db.query(AnalysisCache.id)
+            .order_by(AnalysisCache.last_accessed_at.asc())
+            .limit(overflow).all()
+        ]
+        db.query(AnalysisCache).filter(AnalysisCache.id.in_(stale_ids))\
+            .delete(synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def purge_expired(db: Session) -> int:
+        """清理全部过期条目，返回删除数量"""
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.ANALYSIS_CACHE_TTL_SECONDS)
+        deleted = db.query(AnalysisCache).filter(AnalysisCache.created_at < cutoff)\
+            .delete(synchronize_session=False)
+        db.commit()
+        return deleted
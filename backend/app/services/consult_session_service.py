@@ -0,0 +1,152 @@
+import uuid
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.consult_session import ConsultSession, ConsultMessage
+from app.utils.lru_cache import LRUCache
+
+class ConsultSessionService:
+    """
+    AI 问诊会话
+
+    对话轮次持久化到数据库，最近活跃会话的历史保存在有界内存热缓存中，
+    每轮只需从缓存取出历史交给 Provider.chat，无需客户端回传完整 history。
+    空闲超过 CONSULT_SESSION_IDLE_SECONDS 的会话视为过期，由后台线程定期清理。
+    """
+
+    # 热缓存: session_id -> (message_count, 历史消息列表)
+    _hot = LRUCache(
+        max_entries=settings.CONSULT_SESSION_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.CONSULT_SESSION_IDLE_SECONDS
+    )
+    _cleanup_stop: Optional[threading.Event] = None
+
+    @staticmethod
+    def _expired(session: ConsultSession) -> bool:
+        idle = timedelta(seconds=settings.CONSULT_SESSION_IDLE_SECONDS)
+        return session.last_active_at < datetime.utcnow() - idle
+
+    @staticmethod
+    def create(db: Session, patient_id: Optional[int] = None) -> ConsultSession:
+        session = ConsultSession(session_id=uuid.uuid4().hex, patient_id=patient_id)
+        db.add(session)
+        db.commit()
+        db.refresh(session)
+        ConsultSessionService._hot.put(session.session_id, (0, []))
+        return session
+
+    @classmethod
+    def get(cls, db: Session, session_id: str) -> Optional[ConsultSession]:
+        """查询会话，已过期的会话会被删除并返回 None"""
+        session = db.query(ConsultSession).filter(ConsultSession.session_id == session_id).first()
+        if session and cls._expired(session):
+            cls._remove(db, session)
+            return None
+        return session
+
+    @classmethod
+    def get_history(cls, db: Session, session: ConsultSession) -> List[Dict[str, str]]:
+        """返回交给 Provider.chat 的历史消息（优先走热缓存）"""
+        cached = cls._hot.get(session.session_id)
+        if cached is not None and cached[0] == session.message_count:
+            return list(cached[1])
+
+        history = [
+            {"role": m.role, "content": m.content}
+            for m in db.query(ConsultMessage)
+            .filter(ConsultMessage.session_id == session.id)
+            .order_by(ConsultMessage.id.asc()).all()
+        ]
+        cls._hot.put(session.session_id, (len(history), history))
+        return list(history)
+
+    @classmethod
+    def append_turn(cls, db: Session, session: ConsultSession, message: str, reply: str, provider: str):
+        """保存一问一答，并同步更新热缓存"""
+        previous_count = session.message_count or 0
+        db.add(ConsultMessage(session_id=session.id, role="user", content=message))
+        db.add(ConsultMessage(session_id=session.id, role="assistant", content=reply, provider=provider))
+        session.message_count = previous_count + 2
+        session.last_active_at = datetime.utcnow()
+        db.commit()
+
+        cached = cls._hot.get(session.session_id)
+        if cached is not None and cached[0] == previous_count:
+            history = cached[1] + [
+                {"role": "user", "content": message},
+                {"role": "assistant", "content": reply},
+            ]
+            cls._hot.put(session.session_id, (session.message_count, history))
+        else:
+            # 同一会话并发写入时缓存可能落后，下次从数据库重建
+            cls._hot.pop(session.session_id)
+
+    @classmethod
+    def delete(cls, db: Session, session_id: str) -> bool:
+        session = db.query(ConsultSession).filter(ConsultSession.session_id == session_id).first()
+        if not session:
+            return False
+        cls._remove(db, session)
+        return True
+
+    @classmethod
+    def _remove(cls, db: Session, session: ConsultSession):
+        cls._hot.pop(session.session_id)
+        db.delete(session)
+        db.commit()
+
+    @classmethod
+    def purge_idle(cls, db: Session) -> int:
+        """清理全部空闲过期的会话及其消息，返回删除数量"""
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.CONSULT_SESSION_IDLE_SECONDS)
+        expired = db.query(ConsultSession.id, ConsultSession.session_id)\
+            .filter(ConsultSession.last_active_at < cutoff).all()
+        if not expired:
+            return 0
+
+        ids = [row.id for row in expired]
+        db.query(ConsultMessage).filter(ConsultMessage.session_id.in_(ids))\
+            .delete(synchronize_session=False)
+        db.query(ConsultSession).filter(ConsultSession.id.in_(ids))\
+            .delete(synchronize_session=False)
+        db.commit()
+        for row in expired:
+            cls._hot.pop(row.session_id)
+        return len(ids)
+
+    @classmethod
+    def start_cleanup(cls):
+        """启动后台清理线程（应用启动时调用）"""
+        if cls._cleanup_stop is not None:
+            return
+        cls._cleanup_stop = threading.Event()
+        threading.Thread(
+            target=cls._cleanup_loop, args=(cls._cleanup_stop,),
+            name="consult-session-cleanup", daemon=True
+        ).start()
+
+    @classmethod
+    def stop_cleanup(cls):
+        if cls._cleanup_stop is not None:
+            cls._cleanup_stop.set()
+            cls._cleanup_stop = None
+
+    @classmethod
+    def _cleanup_loop(cls, stop: threading.Event):
+        while not stop.wait(settings.CONSULT_SESSION_CLEANUP_INTERVAL):
+            db = SessionLocal()
+            try:
+                purged = cls.purge_idle(db)
+                if purged:
+                    print(f"[ConsultSession] purged {purged} idle sessions")
+            except Exception as e:
+                print(f"[ConsultSession Cleanup Error] {type(e).__name__}: {e}")
+            finally:
+                db.close()
+
+    @classmethod
+    def stats(cls) -> dict:
+        return cls._hot.stats()
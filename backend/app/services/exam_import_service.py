@@ -0,0 +1,330 @@
+import io
+import os
+import csv
+import json
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.face_exam import FaceExam
+from app.models.patient import Patient
+from app.services.face_exam_service import FaceExamService
+from app.services.face_exam_worker import FaceExamWorker
+from app.services.image_upload_service import ImageUploadService
+
+class ImportSource:
+    """导入源：ZIP 压缩包（按成员流式读取，不解压到磁盘）或目录"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        if not self.path.exists():
+            raise ValueError(f"导入源不存在: {path}")
+        self._zip = zipfile.ZipFile(self.path) if self.path.is_file() else None
+        self._root = None if self._zip is not None else self.path.resolve()
+
+    def open(self, name: str) -> BinaryIO:
+        if self._zip is not None:
+            return self._zip.open(name)
+        target = (self._root / name).resolve()
+        if self._root not in target.parents:
+            raise ValueError(f"文件路径超出导入目录: {name}")
+        return open(target, "rb")
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+
+
+class ExamImportService:
+    """
+    历史面诊照片批量导入
+
+    清单（CSV，默认取导入源根目录下的 manifest.csv）每行一张照片:
+        file      - 相对导入源根目录的路径
+        patient_id / phone - 患者 ID 或手机号（二选一）
+        taken_at  - 可选，拍摄时间（ISO 格式），写入 created_at
+    清单按批流式读取：先校验患者与拍摄时间，有效行的图片由线程池并行写入 ImageUploadService
+    （按 MD5 去重存储，此时不增加引用），同一患者已有相同图片的行跳过，
+    其余 FaceExam 记录与图片引用在同一事务中批量插入，提交后再加入感知哈希索引。
+    不做 AI 分析时记录状态为 imported；analyze=True 时为 processing 并交给 FaceExamWorker。
+    每批提交后把已完成行数写入状态文件，中断后重新运行同一命令从断点继续；
+    中断时已写入但未创建记录的图片引用数为 0，续传时回收。
+    """
+
+    MANIFEST_NAME = "manifest.csv"
+    # 引用数为 0 的图片超过该时长未被引用才回收，避免删除其他正在进行的导入刚写入的文件
+    RECLAIM_AFTER = timedelta(hours=1)
+
+    def __init__(
+        self,
+        source: str,
+        manifest: Optional[str] = None,
+        analyze: bool = False,
+        workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        state_path: Optional[str] = None,
+        errors_path: Optional[str] = None
+    ):
+        self.source = ImportSource(source)
+        self.manifest = manifest
+        self.analyze = analyze
+        self.workers = workers or settings.IMPORT_WORKERS
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.state_path = Path(state_path or f"{Path(source).resolve()}.import-state.json")
+        self.errors_path = errors_path
+        self.upload_service = ImageUploadService()
+        self.exam_service = FaceExamService()
+        # 手机号 -> 患者 ID；已确认存在的患者 ID
+        self._phones: Dict[str, Optional[int]] = {}
+        self._patient_ids: set = set()
+        self._pending_analysis: List[Future] = []
+
+    def run(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """执行导入，返回本次运行的统计；limit 为本次最多处理的清单行数"""
+        state = self._load_state()
+        stats = {
+            "rows": 0, "created": 0, "duplicates": 0, "failed": 0,
+            "files_new": 0, "files_deduplicated": 0, "bytes": 0,
+            "resumed_from": state["rows_done"], "reclaimed": 0,
+        }
+        if state["rows_done"]:
+            stats["reclaimed"] = self.upload_service.reclaim_unreferenced(self.RECLAIM_AFTER)
+            if stats["reclaimed"]:
+                print(f"[Import] reclaimed {stats['reclaimed']} unreferenced files")
+        started = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="exam-import")
+        errors_file = open(self.errors_path, "a", newline="", encoding="utf-8") if self.errors_path else None
+        errors = csv.writer(errors_file) if errors_file else None
+        try:
+            rows = self._read_manifest(state["rows_done"])
+            if limit:
+                rows = islice(rows, limit)
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                valid = self._validate(batch, stats, errors)
+                outcomes = list(executor.map(self._save, [row for row, _, _ in valid]))
+                self._insert(valid, outcomes, stats, errors)
+                stats["rows"] += len(batch)
+                state["rows_done"] = batch[-1]["_row"]
+                self._save_state(state)
+                if errors_file:
+                    errors_file.flush()
+                self._report(stats, started)
+            if self._pending_analysis:
+                print(f"[Import] waiting for {len(self._pending_analysis)} analysis jobs")
+                wait(self._pending_analysis)
+        finally:
+            executor.shutdown(wait=True)
+            if errors_file:
+                errors_file.close()
+            self.source.close()
+
+        stats.update(self._throughput(stats, started))
+        stats["rows_done"] = state["rows_done"]
+        return stats
+
+    def _read_manifest(self, skip: int) -> Iterator[Dict[str, Any]]:
+        """逐行读取清单，跳过已完成的前 skip 行；每行附带 _row（从 1 开始的数据行号）"""
+        if self.manifest:
+            stream = open(self.manifest, "rb")
+        else:
+            stream = self.source.open(self.MANIFEST_NAME)
+        with io.TextIOWrapper(stream, encoding="utf-8-sig", newline="") as text:
+            reader = csv.DictReader(text)
+            missing = {"file"} - set(reader.fieldnames or ())
+            if missing or not {"patient_id", "phone"} & set(reader.fieldnames or ()):
+                raise ValueError("清单需要 file 列，以及 patient_id 或 phone 列")
+            for number, row in enumerate(reader, start=1):
+                if number <= skip:
+                    continue
+                row["_row"] = number
+                yield row
+
+    def _save(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """在工作线程中执行：读取一张照片写入存储，返回上传元信息或错误"""
+        name = (row.get("file") or "").strip()
+        if not name:
+            return {"error": "缺少 file"}
+        try:
+            with self.source.open(name) as src:
+                # 引用在 _insert 中与记录一起提交
+                return {"metadata": self.upload_service.save_stream(
+                    src, name, normalize=self.analyze, reference=False
+                )}
+        except (KeyError, FileNotFoundError):
+            return {"error": f"文件不存在: {name}"}
+        except ValueError as e:
+            return {"error": str(e)}
+        except Exception as e:
+            print(f"[Import Error] row={row['_row']} {name} {type(e).__name__}: {e}")
+            return {"error": "图片保存失败"}
+
+    def _resolve_patients(self, db, batch: List[Dict[str, Any]]):
+        """按批查询本批新出现的手机号和患者 ID"""
+        phones = {
+            (row.get("phone") or "").strip() for row in batch
+            if not (row.get("patient_id") or "").strip()
+        } - set(self._phones) - {""}
+        if phones:
+            for row in db.query(Patient.id, Patient.phone).filter(Patient.phone.in_(phones)).all():
+                # 手机号重复时取最早建档的患者
+                if self._phones.get(row.phone) is None or row.id < self._phones[row.phone]:
+                    self._phones[row.phone] = row.id
+            for phone in phones:
+                self._phones.setdefault(phone, None)
+
+        ids = set()
+        for row in batch:
+            value = (row.get("patient_id") or "").strip()
+            if value.isdigit():
+                ids.add(int(value))
+        ids -= self._patient_ids
+        if ids:
+            self._patient_ids |= {row.id for row in db.query(Patient.id).filter(Patient.id.in_(ids)).all()}
+
+    def _patient_of(self, row: Dict[str, Any]) -> Optional[int]:
+        value = (row.get("patient_id") or "").strip()
+        if value:
+            return int(value) if value.isdigit() and int(value) in self._patient_ids else None
+        return self._phones.get((row.get("phone") or "").strip())
+
+    @staticmethod
+    def _fail(row: Dict[str, Any], error: str, stats: dict, errors):
+        stats["failed"] += 1
+        if errors:
+            errors.writerow([row["_row"], row.get("file"), error])
+
+    def _validate(self, batch: List[Dict[str, Any]], stats: dict, errors) -> List[tuple]:
+        """写入图片前校验患者与拍摄时间，返回有效行 [(row, patient_id, created_at)]"""
+        db = SessionLocal()
+        try:
+            self._resolve_patients(db, batch)
+        finally:
+            db.close()
+        valid = []
+        for row in batch:
+            if self._patient_of(row) is None:
+                self._fail(row, "患者不存在", stats, errors)
+                continue
+            created_at = None
+            if (row.get("taken_at") or "").strip():
+                try:
+                    created_at = datetime.fromisoformat(row["taken_at"].strip())
+                except ValueError:
+                    self._fail(row, f"taken_at 格式错误: {row['taken_at']}", stats, errors)
+                    continue
+            valid.append((row, self._patient_of(row), created_at))
+        return valid
+
+    def _insert(self, valid: List[tuple], outcomes: List[Dict[str, Any]], stats: dict, errors):
+        """
+        跳过失败行与重复图片，批量插入本批面诊记录并增加图片引用（同一事务），
+        提交成功后再加入感知哈希索引、提交分析任务
+        """
+        candidates = []
+        for (row, patient_id, created_at), outcome in zip(valid, outcomes):
+            metadata = outcome.get("metadata")
+            if metadata is None:
+                self._fail(row, outcome.get("error"), stats, errors)
+                continue
+            stats["bytes"] += metadata["size_bytes"]
+            stats["files_deduplicated" if metadata["deduplicated"] else "files_new"] += 1
+            candidates.append((row, patient_id, metadata, created_at))
+        if not candidates:
+            return
+
+        # 提交后不过期属性，索引与分析任务直接使用本批对象
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            # 同一患者已有相同图片（含重复运行同一批次）时不再创建记录
+            hashes = {metadata["hash"] for _, _, metadata, _ in candidates}
+            seen = {
+                (row.patient_id, row.image_hash)
+                for row in db.query(FaceExam.patient_id, FaceExam.image_hash)
+                .filter(FaceExam.image_hash.in_(hashes)).all()
+            }
+            created = []
+            for row, patient_id, metadata, created_at in candidates:
+                key = (patient_id, metadata["hash"])
+                if key in seen:
+                    stats["duplicates"] += 1
+                    continue
+                seen.add(key)
+                created.append((row, patient_id, metadata, created_at))
+            if not created:
+                return
+
+            try:
+                counts: Dict[str, int] = {}
+                for _, _, metadata, _ in created:
+                    counts[metadata["hash"]] = counts.get(metadata["hash"], 0) + 1
+                missing = self.upload_service.add_references(db, counts)
+                exams = []
+                for row, patient_id, metadata, created_at in created:
+                    if metadata["hash"] in missing:
+                        self._fail(row, "图片已被删除，请重新导入", stats, errors)
+                        continue
+                    exams.append(FaceExam(
+                        patient_id=patient_id,
+                        image_url=metadata["file_url"],
+                        image_hash=metadata["hash"],
+                        image_width=metadata["width"],
+                        image_height=metadata["height"],
+                        image_phash=metadata["phash"],
+                        status="processing" if self.analyze else "imported",
+                        ai_provider=None,
+                        created_at=created_at or datetime.utcnow()
+                    ))
+                db.add_all(exams)
+                db.commit()
+            except Exception:
+                # 记录与引用一起回滚；已写入的图片引用数为 0，续传时复用或回收
+                db.rollback()
+                raise
+            stats["created"] += len(exams)
+
+            # 只有已提交的记录才加入索引，提交失败不会留下指向不存在记录的索引项
+            self.exam_service.index_exams(db, exams)
+            if self.analyze:
+                self._pending_analysis = [f for f in self._pending_analysis if not f.done()]
+                self._pending_analysis += [FaceExamWorker.submit(exam.id) for exam in exams]
+        finally:
+            db.close()
+
+    def _load_state(self) -> Dict[str, Any]:
+        if self.state_path.exists():
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+            print(f"[Import] resuming after row {state['rows_done']} ({self.state_path})")
+            return state
+        return {"rows_done": 0}
+
+    def _save_state(self, state: Dict[str, Any]):
+        state["updated_at"] = datetime.now().isoformat()
+        tmp_path = self.state_path.with_name(self.state_path.name + ".part")
+        tmp_path.write_text(json.dumps(state), encoding="utf-8")
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def _throughput(stats: dict, started: float) -> Dict[str, float]:
+        elapsed = time.perf_counter() - started
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "rows_per_second": round(stats["rows"] / elapsed, 1) if elapsed else 0.0,
+            "mb_per_second": round(stats["bytes"] / elapsed / 1024 / 1024, 2) if elapsed else 0.0,
+        }
+
+    def _report(self, stats: dict, started: float):
+        speed = self._throughput(stats, started)
+        print(
+            f"[Import] rows={stats['resumed_from'] + stats['rows']} created={stats['created']} "
+            f"duplicates={stats['duplicates']} failed={stats['failed']} "
+            f"files new/dedup={stats['files_new']}/{stats['files_deduplicated']} "
+            f"{speed['rows_per_second']} rows/s {speed['mb_per_second']} MB/s"
+        )
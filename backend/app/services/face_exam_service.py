@@ -1,68 +1,491 @@
+import asyncio
+from sqlalchemy import or_, func
 from sqlalchemy.orm import Session
 from datetime import datetime
 from app.models.face_exam import FaceExam
+from app.models.patient import Patient
+from app.models.plan import TimelineEvent
 from app.ai.base import BaseAIProvider
 from app.ai.mock_provider import MockAIProvider
+from app.ai.registry import get_provider
+from app.ai.resilience import Deadline
+from app.ai.hedging import AIHedge
+from app.ai.metrics import ai_metrics
+from app.ai.scheduler import LANE_FACE_EXAM
+from app.core.config import settings
+from app.core.database import SessionLocal
 from app.services.timeline_service import TimelineService
-from typing import Optional, Dict, Any
+from app.services.analysis_cache_service import AnalysisCacheService
+from app.services.image_normalize_service import ImageNormalizeService
+from app.services.perceptual_hash_service import PerceptualHashService
+from typing import Optional, Dict, Any, List
 
 class FaceExamService:
     def __init__(self, ai_provider: BaseAIProvider = None):
-        # 默认使用 MockProvider，后续可注入 DeepSeekProvider
-        self.ai_provider = ai_provider or MockAIProvider()
+        # 默认按配置从 Provider 注册表获取（settings.AI_PROVIDER / AI_TASK_PROVIDERS）
+        self.ai_provider = ai_provider or get_provider(LANE_FACE_EXAM)
 
     def create_exam(
         self, 
         db: Session, 
         patient_id: int, 
         image_url: str,
-        image_metadata: Optional[Dict[str, Any]] = None
+        image_metadata: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None
     ):
         """
         创建新的面容诊断：
         1. 获取上一次诊断记录（用于保持Mock数据连续性）
-        2. 调用 AI Provider 分析图片
+        2. 调用 AI Provider 分析图片（同图同上下文命中缓存时跳过）
         3. 保存诊断结果到数据库
         4. 添加 Timeline 事件
         """
-        # 1. 获取上下文 (上一次的指标)
-        last_exam = db.query(FaceExam).filter(FaceExam.patient_id == patient_id)\
-            .order_by(FaceExam.created_at.desc()).first()
+        context = self._build_context(db, patient_id)
+        cache_key = self._cache_key(image_metadata, context)
+        analysis_result = self._get_cached_analysis(db, cache_key, patient_id, image_metadata)
+        if analysis_result is None:
+            analysis_result = self.ai_provider.analyze_face(
+                ImageNormalizeService.analysis_url(image_url), context, deadline or Deadline.after(settings.AI_DEADLINE_FACE_EXAM)
+            )
+            self._cache_analysis(db, cache_key, image_metadata, analysis_result)
+        return self._save_exam(db, patient_id, image_url, image_metadata, analysis_result)
+
+    async def create_exam_async(
+        self, 
+        db: Session, 
+        patient_id: int, 
+        image_url: str,
+        image_metadata: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None
+    ):
+        """
+        create_exam 的异步版本，AI 分析期间不阻塞事件循环
+        启用对冲时，AI 超过 AI_HEDGE_SLO_FACE_EXAM 未返回则先保存 provisional 记录
+        """
+        context = self._build_context(db, patient_id)
+        cache_key = self._cache_key(image_metadata, context)
+        analysis_result = self._get_cached_analysis(db, cache_key, patient_id, image_metadata)
+        if analysis_result is None:
+            deadline = deadline or Deadline.after(settings.AI_DEADLINE_FACE_EXAM)
+            async def analyze():
+                # 规范化副本可能需要先生成（阻塞操作），放到线程池中
+                analysis_url = await asyncio.to_thread(ImageNormalizeService.analysis_url, image_url)
+                return await self.ai_provider.analyze_face_async(analysis_url, context, deadline)
+            
+            if AIHedge.enabled(settings.AI_HEDGE_SLO_FACE_EXAM):
+                analysis_result, pending = await AIHedge.run_async(
+                    analyze, settings.AI_HEDGE_SLO_FACE_EXAM, LANE_FACE_EXAM
+                )
+                if pending is not None:
+                    return self._save_provisional_exam(
+                        db, patient_id, image_url, image_metadata, context, cache_key, pending
+                    )
+            else:
+                analysis_result = await analyze()
+            self._cache_analysis(db, cache_key, image_metadata, analysis_result)
+        return self._save_exam(db, patient_id, image_url, image_metadata, analysis_result)
+
+    def _save_provisional_exam(
+        self,
+        db: Session,
+        patient_id: int,
+        image_url: str,
+        image_metadata: Optional[Dict[str, Any]],
+        context: Dict[str, Any],
+        cache_key: Optional[str],
+        pending
+    ) -> FaceExam:
+        """
+        AI 未在 SLO 内返回：先用 Mock 结果保存 provisional 记录，
+        AI 完成后由 _finalize_provisional_exam 替换（时间轴事件也在那时记录）
+        """
+        fallback = MockAIProvider().analyze_face(image_url, context)
+        db_exam = FaceExam(
+            patient_id=patient_id,
+            image_url=image_url,
+            image_hash=image_metadata.get("hash") if image_metadata else None,
+            image_width=image_metadata.get("width") if image_metadata else None,
+            image_height=image_metadata.get("height") if image_metadata else None,
+            image_phash=image_metadata.get("phash") if image_metadata else None
+        )
+        self._fill_analysis(db_exam, fallback)
+        db_exam.status = "provisional"
+        db.add(db_exam)
+        db.commit()
+        db.refresh(db_exam)
+        self.index_exams(db, [db_exam])
+        
+        exam_id = db_exam.id
+        AIHedge.on_late(
+            pending, LANE_FACE_EXAM,
+            lambda result: self._finalize_provisional_exam(exam_id, cache_key, image_metadata, result)
+        )
+        return db_exam
+
+    def _finalize_provisional_exam(
+        self,
+        exam_id: int,
+        cache_key: Optional[str],
+        image_metadata: Optional[Dict[str, Any]],
+        analysis_result: Optional[Dict[str, Any]]
+    ) -> bool:
+        """用迟到的 AI 结果替换 provisional 记录；AI 失败或降级时保留临时结果。返回是否替换"""
+        db = SessionLocal()
+        try:
+            exam = self.get_exam(db, exam_id)
+            if not exam or exam.status != "provisional":
+                return False
+            
+            replaced = bool(analysis_result) and not analysis_result.get("is_fallback")
+            if replaced:
+                self._fill_analysis(exam, analysis_result)
+                self._cache_analysis(db, cache_key, image_metadata, analysis_result)
+            exam.status = "done"
+            db.commit()
+            db.refresh(exam)
+            self._add_timeline_event(db, exam, analysis_result if replaced else {"metrics": exam.metrics or {}})
+            return replaced
+        finally:
+            db.close()
+
+    def retry_provisional_exam(self, exam_id: int) -> bool:
+        """
+        服务重启后对冲回调已丢失的 provisional 记录：重新执行 AI 分析，
+        按 _finalize_provisional_exam 的规则替换或保留临时结果。返回是否替换
+        """
+        db = SessionLocal()
+        try:
+            exam = self.get_exam(db, exam_id)
+            if not exam or exam.status != "provisional":
+                return False
+            image_url = exam.image_url
+            context = self._build_context(db, exam.patient_id)
+            image_metadata = {"hash": exam.image_hash, "phash": exam.image_phash} if exam.image_hash else None
+            cache_key = self._cache_key(image_metadata, context)
+            analysis_result = self._get_cached_analysis(db, cache_key, exam.patient_id, image_metadata)
+        finally:
+            db.close()
+        
+        if analysis_result is None:
+            try:
+                analysis_result = self.ai_provider.analyze_face(
+                    ImageNormalizeService.analysis_url(image_url), context, Deadline.after(settings.AI_DEADLINE_FACE_EXAM)
+                )
+            except Exception as e:
+                print(f"[FaceExam Retry Error] exam={exam_id} {type(e).__name__}: {e}")
+                analysis_result = None
+        return self._finalize_provisional_exam(exam_id, cache_key, image_metadata, analysis_result)
+
+    async def create_exams_batch_async(
+        self,
+        db: Session,
+        items: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        批量创建面诊：
+        1. 一次查询校验患者并取每位患者上一次的指标
+        2. 以有限并发执行 AI 分析
+        3. 诊断记录与时间轴事件一次性批量写入
+
+        items: [{"patient_id", "image_url", "image_metadata", "error"}]，
+        error 非空的条目（如图片保存失败）直接记为失败。
+        返回与 items 等长的结果列表: {"success", "exam", "error"}
+        """
+        results: List[Dict[str, Any]] = [
+            {"success": False, "exam": None, "error": item.get("error")} for item in items
+        ]
+        patient_ids = {item["patient_id"] for item in items}
+        existing_ids = {
+            row.id for row in db.query(Patient.id).filter(Patient.id.in_(patient_ids)).all()
+        }
+        last_metrics = self._latest_metrics_by_patient(db, patient_ids)
+        
+        semaphore = asyncio.Semaphore(settings.FACE_EXAM_BATCH_CONCURRENCY)
+        
+        async def analyze(index: int, item: Dict[str, Any]):
+            context = {}
+            if item["patient_id"] in last_metrics:
+                context["last_metrics"] = last_metrics[item["patient_id"]]
+            cache_key = self._cache_key(item.get("image_metadata"), context)
+            cached = self._get_cached_analysis(db, cache_key, item["patient_id"], item.get("image_metadata"))
+            if cached is not None:
+                return index, cache_key, cached
+            try:
+                async with semaphore:
+                    analysis_url = await asyncio.to_thread(ImageNormalizeService.analysis_url, item["image_url"])
+                    result = await self.ai_provider.analyze_face_async(
+                        analysis_url, context, Deadline.after(settings.AI_DEADLINE_FACE_EXAM)
+                    )
+            except Exception as e:
+                print(f"[FaceExam Batch Error] item={index} {type(e).__name__}: {e}")
+                return index, cache_key, None
+            return index, cache_key, result
+        
+        tasks = []
+        for index, item in enumerate(items):
+            if results[index]["error"]:
+                continue
+            if item["patient_id"] not in existing_ids:
+                results[index]["error"] = "患者不存在"
+                continue
+            tasks.append(analyze(index, item))
+        
+        analyses = {}
+        for index, cache_key, result in await asyncio.gather(*tasks):
+            if result is not None:
+                analyses[index] = (cache_key, result)
+        
+        # 批量写入诊断记录
+        exams = {}
+        for index, item in enumerate(items):
+            if results[index]["error"]:
+                continue
+            if index not in analyses:
+                results[index]["error"] = "AI 分析失败"
+                continue
+            metadata = item.get("image_metadata")
+            exam = FaceExam(
+                patient_id=item["patient_id"],
+                image_url=item["image_url"],
+                image_hash=metadata.get("hash") if metadata else None,
+                image_width=metadata.get("width") if metadata else None,
+                image_height=metadata.get("height") if metadata else None,
+                image_phash=metadata.get("phash") if metadata else None
+            )
+            self._fill_analysis(exam, analyses[index][1])
+            exams[index] = exam
+        db.add_all(exams.values())
+        db.flush()
+        
+        # 批量写入时间轴
+        db.add_all([
+            TimelineEvent(
+                patient_id=exam.patient_id,
+                event_type="FaceExam",
+                title="完成面容智能诊断",
+                description=f"AI 分析完成，肤质年龄评估为 {(exam.metrics or {}).get('skin_age')} 岁",
+                related_id=exam.id
+            )
+            for exam in exams.values()
+        ])
+        db.commit()
+        
+        self.index_exams(db, list(exams.values()))
+        for index, exam in exams.items():
+            db.refresh(exam)
+            cache_key, analysis_result = analyses[index]
+            self._cache_analysis(db, cache_key, items[index].get("image_metadata"), analysis_result)
+            results[index].update(success=True, exam=exam)
+        
+        return results
+
+    def _latest_metrics_by_patient(self, db: Session, patient_ids) -> Dict[int, Any]:
+        """一次查询取出多位患者最近一次已完成诊断的指标"""
+        if not patient_ids:
+            return {}
+        done = or_(FaceExam.status == "done", FaceExam.status.is_(None))
+        latest = db.query(
+            FaceExam.patient_id,
+            func.max(FaceExam.created_at).label("created_at")
+        ).filter(FaceExam.patient_id.in_(patient_ids), done)\
+            .group_by(FaceExam.patient_id).subquery()
+        
+        rows = db.query(FaceExam.patient_id, FaceExam.metrics).join(
+            latest,
+            (FaceExam.patient_id == latest.c.patient_id) & (FaceExam.created_at == latest.c.created_at)
+        ).filter(done).all()
+        return {row.patient_id: row.metrics for row in rows if row.metrics}
+
+    def create_pending_exam(
+        self,
+        db: Session,
+        patient_id: int,
+        image_url: str,
+        image_metadata: Optional[Dict[str, Any]] = None
+    ) -> FaceExam:
+        """
+        异步模式：只插入 processing 状态的记录，AI 分析交给后台工作池
+        （见 FaceExamWorker），完成后由 process_exam 回填结果
+        """
+        db_exam = FaceExam(
+            patient_id=patient_id,
+            image_url=image_url,
+            image_hash=image_metadata.get("hash") if image_metadata else None,
+            image_width=image_metadata.get("width") if image_metadata else None,
+            image_height=image_metadata.get("height") if image_metadata else None,
+            image_phash=image_metadata.get("phash") if image_metadata else None,
+            status="processing",
+            ai_provider=None
+        )
+        db.add(db_exam)
+        db.commit()
+        db.refresh(db_exam)
+        self.index_exams(db, [db_exam])
+        return db_exam
+
+    def process_exam(self, db: Session, exam_id: int, deadline: Optional[Deadline] = None) -> Optional[FaceExam]:
+        """
+        对 processing 状态的记录执行 AI 分析并回填结果；失败时标记为 failed
+        """
+        exam = db.query(FaceExam).filter(FaceExam.id == exam_id).first()
+        if not exam or exam.status != "processing":
+            return exam
+        
+        try:
+            context = self._build_context(db, exam.patient_id)
+            image_metadata = {"hash": exam.image_hash, "phash": exam.image_phash} if exam.image_hash else None
+            cache_key = self._cache_key(image_metadata, context)
+            analysis_result = self._get_cached_analysis(db, cache_key, exam.patient_id, image_metadata)
+            if analysis_result is None:
+                analysis_result = self.ai_provider.analyze_face(
+                    ImageNormalizeService.analysis_url(exam.image_url), context, deadline or Deadline.after(settings.AI_DEADLINE_FACE_EXAM)
+                )
+                self._cache_analysis(db, cache_key, image_metadata, analysis_result)
+        except Exception as e:
+            print(f"[FaceExam Job Error] exam={exam_id} {type(e).__name__}: {e}")
+            db.rollback()
+            exam.status = "failed"
+            db.commit()
+            return exam
+        
+        self._fill_analysis(exam, analysis_result)
+        db.commit()
+        db.refresh(exam)
+        self._add_timeline_event(db, exam, analysis_result)
+        return exam
+
+    def get_exam(self, db: Session, exam_id: int) -> Optional[FaceExam]:
+        return db.query(FaceExam).filter(FaceExam.id == exam_id).first()
+
+    def _build_context(self, db: Session, patient_id: int) -> Dict[str, Any]:
+        """获取上下文 (上一次已完成诊断的指标)"""
+        last_exam = db.query(FaceExam).filter(
+            FaceExam.patient_id == patient_id,
+            or_(FaceExam.status == "done", FaceExam.status.is_(None))
+        ).order_by(FaceExam.created_at.desc()).first()
         
         context = {}
         if last_exam and last_exam.metrics:
             context["last_metrics"] = last_exam.metrics
-            
-        # 2. AI 分析
-        analysis_result = self.ai_provider.analyze_face(image_url, context)
+        return context
+
+    def _cache_key(self, image_metadata: Optional[Dict[str, Any]], context: Dict[str, Any]) -> Optional[str]:
+        """只有上传文件（有 hash）才走分析缓存，外部 URL 无法确认内容"""
+        image_hash = image_metadata.get("hash") if image_metadata else None
+        if not image_hash:
+            return None
+        return AnalysisCacheService.build_key(
+            image_hash, self.ai_provider.provider_id, context.get("last_metrics")
+        )
+
+    def _get_cached_analysis(
+        self,
+        db: Session,
+        cache_key: Optional[str],
+        patient_id: Optional[int] = None,
+        image_metadata: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        先按精确键查分析缓存；未命中时按感知哈希查找同一患者的近似图片
+        （重新压缩、缩放后再次上传的同一张照片），复用其已完成的真实 AI 分析结果。
+        近似复用不比较 last_metrics 上下文（精确缓存键包含），见 PerceptualHashService.find_reusable
+        """
+        if not cache_key:
+            return None
+        cached = AnalysisCacheService.get(db, cache_key)
+        phash = image_metadata.get("phash") if image_metadata else None
+        if cached is not None or patient_id is None or not phash or not settings.PHASH_REUSE_ENABLED:
+            return cached
         
-        # 3. 保存结果（包括图片元信息）
+        similar = PerceptualHashService.find_reusable(db, patient_id, phash)
+        ai_metrics.record_cache("near_duplicate", LANE_FACE_EXAM, hit=similar is not None)
+        if similar is None:
+            return None
+        return {
+            "metrics": similar.metrics,
+            "advice_summary": similar.advice_summary,
+            "detailed_advice": similar.detailed_advice,
+            "ai_provider": similar.ai_provider,
+        }
+
+    def _cache_analysis(
+        self,
+        db: Session,
+        cache_key: Optional[str],
+        image_metadata: Optional[Dict[str, Any]],
+        analysis_result: Dict[str, Any]
+    ):
+        if not cache_key:
+            return
+        AnalysisCacheService.put(
+            db, cache_key, image_metadata["hash"], self.ai_provider.provider_id, analysis_result
+        )
+
+    def _save_exam(
+        self,
+        db: Session,
+        patient_id: int,
+        image_url: str,
+        image_metadata: Optional[Dict[str, Any]],
+        analysis_result: Dict[str, Any]
+    ) -> FaceExam:
+        """保存诊断结果并记录时间轴"""
+        # 保存结果（包括图片元信息）
         db_exam = FaceExam(
             patient_id=patient_id,
             image_url=image_url,
             image_hash=image_metadata.get("hash") if image_metadata else None,
             image_width=image_metadata.get("width") if image_metadata else None,
             image_height=image_metadata.get("height") if image_metadata else None,
-            metrics=analysis_result["metrics"],
-            advice_summary=analysis_result["advice_summary"],
-            detailed_advice=analysis_result["detailed_advice"],
-            ai_provider=analysis_result.get("ai_provider", "Unknown")
+            image_phash=image_metadata.get("phash") if image_metadata else None
         )
+        self._fill_analysis(db_exam, analysis_result)
         db.add(db_exam)
         db.commit()
         db.refresh(db_exam)
+        self.index_exams(db, [db_exam])
         
-        # 4. 记录到时间轴
+        self._add_timeline_event(db, db_exam, analysis_result)
+        return db_exam
+
+    def index_exams(self, db: Session, exams: List[FaceExam]):
+        """
+        把新记录加入感知哈希索引；同一照片已出现在其他患者名下时
+        记入 duplicate_matches（疑似上传错患者），由前端/医生复核
+        """
+        flagged = False
+        for exam in exams:
+            if not exam.image_phash:
+                continue
+            matches = PerceptualHashService.cross_patient_matches(exam)
+            if matches:
+                exam.duplicate_matches = matches
+                flagged = True
+                print(
+                    f"[FaceExam] exam={exam.id} patient={exam.patient_id} image matches other patients: "
+                    + ", ".join(f"exam={m['exam_id']}/patient={m['patient_id']}" for m in matches)
+                )
+            PerceptualHashService.add(exam)
+        if flagged:
+            db.commit()
+
+    def _fill_analysis(self, exam: FaceExam, analysis_result: Dict[str, Any]):
+        exam.metrics = analysis_result["metrics"]
+        exam.advice_summary = analysis_result["advice_summary"]
+        exam.detailed_advice = analysis_result["detailed_advice"]
+        exam.ai_provider = analysis_result.get("ai_provider", "Unknown")
+        exam.status = "done"
+
+    def _add_timeline_event(self, db: Session, exam: FaceExam, analysis_result: Dict[str, Any]):
+        """记录到时间轴"""
         TimelineService.add_event(
             db=db, 
-            patient_id=patient_id, 
+            patient_id=exam.patient_id, 
             event_type="FaceExam",
             title="完成面容智能诊断",
             description=f"AI 分析完成，肤质年龄评估为 {analysis_result['metrics'].get('skin_age')} 岁",
-            related_id=db_exam.id
+            related_id=exam.id
         )
-        
-        return db_exam
 
     def confirm_exam(
         self, 
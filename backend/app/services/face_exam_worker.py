@@ -0,0 +1,74 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional
+from app.core.config import settings
+from app.ai.hedging import AIHedge
+from app.ai.scheduler import LANE_FACE_EXAM
+from app.core.database import SessionLocal
+from app.models.face_exam import FaceExam
+from app.services.face_exam_service import FaceExamService
+
+class FaceExamWorker:
+    """
+    面诊异步分析工作池
+
+    上传接口只插入 processing 记录后立即返回，分析任务在线程池中执行，
+    每个任务使用独立的数据库会话，完成后回填 metrics / 建议 / status。
+    """
+
+    _executor: Optional[ThreadPoolExecutor] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=settings.FACE_EXAM_WORKERS,
+                    thread_name_prefix="face-exam"
+                )
+            return cls._executor
+
+    @classmethod
+    def submit(cls, exam_id: int) -> Future:
+        return cls._get_executor().submit(cls._run, exam_id)
+
+    @staticmethod
+    def _run(exam_id: int):
+        db = SessionLocal()
+        try:
+            FaceExamService().process_exam(db, exam_id)
+        except Exception as e:
+            print(f"[FaceExam Worker Error] exam={exam_id} {type(e).__name__}: {e}")
+        finally:
+            db.close()
+
+    @classmethod
+    def resume_pending(cls) -> int:
+        """
+        服务重启后重新投递仍处于 processing 的任务；
+        provisional 记录的迟到回调已随进程丢失，重新执行 AI 分析后替换临时结果
+        """
+        db = SessionLocal()
+        try:
+            rows = db.query(FaceExam.id, FaceExam.status)\
+                .filter(FaceExam.status.in_(("processing", "provisional"))).all()
+        finally:
+            db.close()
+        
+        for row in rows:
+            if row.status == "processing":
+                cls.submit(row.id)
+            else:
+                AIHedge.resume(
+                    LANE_FACE_EXAM,
+                    lambda exam_id=row.id: FaceExamService().retry_provisional_exam(exam_id)
+                )
+        return len(rows)
+
+    @classmethod
+    def shutdown(cls):
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=False, cancel_futures=True)
+                cls._executor = None
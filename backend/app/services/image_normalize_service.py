@@ -0,0 +1,156 @@
+import time
+import threading
+from concurrent.futures import Future
+from pathlib import PurePosixPath
+from typing import Dict, Optional
+from app.core.config import settings
+from app.storage.registry import get_storage
+from app.services.thumbnail_service import ThumbnailService
+from app.utils.image_derivatives import normalize_image
+from app.utils.lru_cache import LRUCache
+
+UPLOAD_URL_PREFIX = "/static/uploads/"
+
+class ImageNormalizeService:
+    """
+    AI 分析前的图片规范化
+
+    手机原图常见 4000px 以上且带任意 EXIF 方向。首次分析前按需生成一份规范化副本
+    （abcd.jpg -> abcd_analysis.jpg）：按 EXIF 旋转、去除元数据、长边缩小到
+    ANALYSIS_IMAGE_MAX_SIDE 并重新编码。AI 分析使用规范化副本，原图保留归档不变。
+    上传请求不做规范化（仅预览的上传不需要副本）；解码与编码在缩略图进程池中执行。
+    """
+
+    # 已确认存在的规范化副本（对象存储后端使用），避免每次分析都发 HEAD 请求
+    _known = LRUCache(max_entries=10000, ttl_seconds=600)
+    # 正在生成的副本：同一原图的并发分析等待同一任务，不重复生成
+    _inflight: Dict[str, Future] = {}
+
+    _lock = threading.Lock()
+    _stats = {
+        "images": 0,
+        "failed": 0,
+        "original_bytes": 0,
+        "normalized_bytes": 0,
+        "original_pixels": 0,
+        "normalized_pixels": 0,
+        "normalize_seconds": 0.0,
+        "reused": 0,               # 副本已存在、直接复用的次数（内容寻址去重、重复分析）
+        "shared": 0,               # 并发分析等待同一生成任务、未重复生成的次数
+        "analysis_normalized": 0,  # AI 分析使用规范化副本的次数
+        "analysis_original": 0,    # 无副本、使用原图的次数
+    }
+
+    @staticmethod
+    def analysis_path(file_path: str) -> str:
+        """原图相对路径对应的规范化副本相对路径"""
+        path = PurePosixPath(file_path)
+        return path.with_name(f"{path.stem}_analysis.jpg").as_posix()
+
+    @classmethod
+    def normalize(cls, file_path: str) -> Optional[str]:
+        """
+        生成规范化副本（阻塞操作，应在线程池中调用），返回其访问 URL；
+        未启用或处理失败时返回 None，AI 分析回退到原图
+        """
+        if not settings.ANALYSIS_IMAGE_NORMALIZE_ENABLED:
+            return None
+        storage = get_storage()
+        relative_path = cls.analysis_path(file_path)
+        if storage.exists(relative_path):
+            # 内容寻址存储下同一原图只需处理一次
+            cls._known.put(relative_path, True)
+            with cls._lock:
+                cls._stats["reused"] += 1
+            return UPLOAD_URL_PREFIX + relative_path
+
+        with cls._lock:
+            future = cls._inflight.get(relative_path)
+            owner = future is None
+            if owner:
+                future = cls._inflight[relative_path] = Future()
+            else:
+                cls._stats["shared"] += 1
+        if not owner:
+            return future.result()
+        url = None
+        try:
+            url = cls._render(storage, file_path, relative_path)
+            return url
+        finally:
+            future.set_result(url)
+            with cls._lock:
+                cls._inflight.pop(relative_path, None)
+
+    @classmethod
+    def _render(cls, storage, file_path: str, relative_path: str) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            with storage.local_copy(file_path) as source:
+                target = source.with_name(PurePosixPath(relative_path).name)
+                result = ThumbnailService.run_in_pool(
+                    normalize_image, str(source), str(target),
+                    settings.ANALYSIS_IMAGE_MAX_SIDE, settings.ANALYSIS_IMAGE_QUALITY
+                )
+                storage.save(target, relative_path, content_type="image/jpeg")
+        except Exception as e:
+            print(f"[Image Normalize Error] {file_path} {type(e).__name__}: {e}")
+            with cls._lock:
+                cls._stats["failed"] += 1
+            return None
+        elapsed = time.perf_counter() - started
+
+        with cls._lock:
+            cls._stats["images"] += 1
+            cls._stats["normalize_seconds"] += elapsed
+            for key, value in result.items():
+                cls._stats[key] += value
+        cls._known.put(relative_path, True)
+        return UPLOAD_URL_PREFIX + relative_path
+
+    @classmethod
+    def analysis_url(cls, image_url: str) -> str:
+        """
+        交给 AI 分析的图片地址：本地上传的图片使用规范化副本（不存在时先生成，阻塞操作，
+        应在线程池中调用），生成失败或非本地上传时使用原地址
+        """
+        if not image_url or not image_url.startswith(UPLOAD_URL_PREFIX):
+            return image_url
+        relative_path = cls.analysis_path(image_url[len(UPLOAD_URL_PREFIX):])
+        storage = get_storage()
+        if storage.is_local:
+            normalized = storage.exists(relative_path)
+        else:
+            normalized = cls._known.get(relative_path) is not None or storage.exists(relative_path)
+            if normalized:
+                cls._known.put(relative_path, True)
+        reused = normalized
+        if not normalized:
+            normalized = cls.normalize(image_url[len(UPLOAD_URL_PREFIX):]) is not None
+        with cls._lock:
+            cls._stats["analysis_normalized" if normalized else "analysis_original"] += 1
+            if reused:
+                cls._stats["reused"] += 1
+        return UPLOAD_URL_PREFIX + relative_path if normalized else image_url
+
+    @classmethod
+    def stats(cls) -> dict:
+        with cls._lock:
+            stats = dict(cls._stats)
+        stats["bytes_saved"] = stats["original_bytes"] - stats["normalized_bytes"]
+        stats["byte_ratio"] = round(stats["normalized_bytes"] / stats["original_bytes"], 4) \
+            if stats["original_bytes"] else None
+        stats["pixel_ratio"] = round(stats["normalized_pixels"] / stats["original_pixels"], 4) \
+            if stats["original_pixels"] else None
+        # 复用与共享避免的生成工作：按平均单张耗时与平均节省字节估算
+        avoided = stats["reused"] + stats["shared"]
+        avg_seconds = stats["normalize_seconds"] / stats["images"] if stats["images"] else 0.0
+        stats["avg_normalize_ms"] = round(avg_seconds * 1000, 1) if stats["images"] else None
+        stats["reuse_rate"] = round(avoided / (avoided + stats["images"]), 4) \
+            if avoided + stats["images"] else None
+        stats["seconds_avoided_estimate"] = round(avoided * avg_seconds, 3)
+        # 每次使用副本的分析都少传输 (原图 - 副本) 字节，按已生成副本的平均值估算
+        stats["analysis_bytes_saved_estimate"] = stats["analysis_normalized"] * stats["bytes_saved"] // stats["images"] \
+            if stats["images"] else 0
+        stats["normalize_seconds"] = round(stats["normalize_seconds"], 3)
+        return stats
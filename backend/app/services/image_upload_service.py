@@ -1,22 +1,39 @@
-import os
 import uuid
+import asyncio
 import hashlib
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import BinaryIO, Dict, Optional
 from fastapi import UploadFile
-from PIL import Image
-import io
+from sqlalchemy.exc import IntegrityError
+from app.core.database import SessionLocal
+from app.models.stored_image import StoredImage
+from app.storage.registry import get_storage
+from app.services.thumbnail_service import ThumbnailService
+from app.services.image_normalize_service import ImageNormalizeService
+from app.core.config import settings
+from app.utils.image_probe import FORMAT_EXTENSIONS, probe_image
+from app.utils.perceptual_hash import compute_phash
 
 class ImageUploadService:
-    """图片上传服务 - 处理本地存储和元信息提取"""
+    """
+    图片上传服务 - 处理本地存储和元信息提取
+    
+    文件按内容寻址存储（ab/cd/<md5><ext>，后端由 STORAGE_BACKEND 选择：本地 uploads/ 或 S3 兼容对象存储），
+    stored_images 表记录引用计数：
+    重复上传同一张图片直接返回已有文件，不再落盘；delete_image 只在最后一个引用移除后删除文件。
+    新图片只读取文件头校验真实格式；文件写入、索引读写等阻塞操作都在线程池中执行，不阻塞事件循环。
+    """
     
     UPLOAD_DIR = Path("uploads")
     ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+    CHUNK_SIZE = 256 * 1024  # 分块读取大小
     
     def __init__(self):
-        # 确保上传目录存在
+        # 确保上传目录存在（S3 后端时仅用作上传临时目录）
         self.UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        self.storage = get_storage()
     
     async def save_image(self, file: UploadFile) -> dict:
         """
@@ -30,8 +47,13 @@ class ImageUploadService:
                 "width": int,      # 图片宽度
                 "height": int,     # 图片高度
                 "size_bytes": int, # 文件大小
+                "format": str,     # 真实图片格式（JPEG/PNG/GIF/WEBP）
+                "orientation": int, # EXIF 方向（1-8）
+                "phash": str,      # 感知哈希（近似重复检索，计算失败或关闭时为 None）
+                "analysis_url": str,  # 供 AI 分析的规范化副本 URL（上传时不生成，为 None）
                 "original_name": str,
-                "uploaded_at": str
+                "uploaded_at": str,
+                "deduplicated": bool  # 是否复用了已存储的相同文件
             }
         """
         # 验证文件扩展名
@@ -39,60 +61,266 @@ class ImageUploadService:
         if file_ext not in self.ALLOWED_EXTENSIONS:
             raise ValueError(f"不支持的文件格式: {file_ext}")
         
-        # 读取文件内容
-        content = await file.read()
-        
-        # 验证文件大小
-        if len(content) > self.MAX_FILE_SIZE:
-            raise ValueError(f"文件过大，最大支持 {self.MAX_FILE_SIZE // 1024 // 1024}MB")
-        
-        # 计算文件 hash
-        file_hash = hashlib.md5(content).hexdigest()
-        
-        # 生成唯一文件名
-        unique_name = f"{uuid.uuid4().hex}{file_ext}"
-        
-        # 按日期分目录存储
-        date_folder = datetime.now().strftime("%Y%m%d")
-        save_dir = self.UPLOAD_DIR / date_folder
-        save_dir.mkdir(parents=True, exist_ok=True)
+        # 表单解析时已知大小的文件直接拒绝，不再读取
+        if file.size is not None and file.size > self.MAX_FILE_SIZE:
+            raise ValueError(self._too_large_message())
         
-        file_path = save_dir / unique_name
-        
-        # 提取图片元信息
-        width, height = 0, 0
+        # 内容 hash 需读完才能确定，先分块写入临时目录，边写边计算 hash 和校验大小
+        tmp_path = self._tmp_path()
+        file_hash = hashlib.md5()
+        size_bytes = 0
         try:
-            img = Image.open(io.BytesIO(content))
-            width, height = img.size
-        except Exception:
-            pass  # 如果无法解析图片尺寸，继续保存
+            f = await asyncio.to_thread(open, tmp_path, "wb")
+            try:
+                while True:
+                    chunk = await file.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size_bytes += len(chunk)
+                    if size_bytes > self.MAX_FILE_SIZE:
+                        raise ValueError(self._too_large_message())
+                    file_hash.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+            
+            image_hash = file_hash.hexdigest()
+            stored, deduplicated = await asyncio.to_thread(
+                self._store, tmp_path, image_hash, size_bytes
+            )
+        finally:
+            await asyncio.to_thread(tmp_path.unlink, missing_ok=True)
         
-        # 保存文件
-        with open(file_path, "wb") as f:
-            f.write(content)
+        # 规范化副本在分析前按需生成（ImageNormalizeService.analysis_url），不占用上传请求
+        return self._metadata(stored, image_hash, deduplicated, None, file.filename)
+    
+    def save_stream(self, src: BinaryIO, filename: str, normalize: bool = True,
+                    reference: bool = True) -> dict:
+        """
+        同步保存文件流中的图片（批量导入等非请求场景，由调用方在工作线程中执行）
+        校验规则与返回值同 save_image；normalize=False 时不生成 AI 分析用的规范化副本。
+        reference=False 时只保证文件与索引存在、不增加引用（新文件引用数为 0），
+        由调用方在创建记录的同一事务中调用 add_references，中断时不会遗留多余引用
+        """
+        file_ext = Path(filename).suffix.lower()
+        if file_ext not in self.ALLOWED_EXTENSIONS:
+            raise ValueError(f"不支持的文件格式: {file_ext}")
         
-        # 构建返回信息
-        relative_path = f"{date_folder}/{unique_name}"
+        tmp_path = self._tmp_path()
+        file_hash = hashlib.md5()
+        size_bytes = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                while True:
+                    chunk = src.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size_bytes += len(chunk)
+                    if size_bytes > self.MAX_FILE_SIZE:
+                        raise ValueError(self._too_large_message())
+                    file_hash.update(chunk)
+                    f.write(chunk)
+            
+            image_hash = file_hash.hexdigest()
+            stored, deduplicated = self._store(tmp_path, image_hash, size_bytes, int(reference))
+        finally:
+            tmp_path.unlink(missing_ok=True)
         
+        analysis_url = ImageNormalizeService.normalize(stored.file_path) if normalize else None
+        return self._metadata(stored, image_hash, deduplicated, analysis_url, filename)
+    
+    @staticmethod
+    def _metadata(stored: StoredImage, image_hash: str, deduplicated: bool,
+                  analysis_url: Optional[str], original_name: str) -> dict:
         return {
-            "file_path": relative_path,
-            "file_url": f"/static/uploads/{relative_path}",
-            "hash": file_hash,
-            "width": width,
-            "height": height,
-            "size_bytes": len(content),
-            "original_name": file.filename,
-            "uploaded_at": datetime.now().isoformat()
+            "file_path": stored.file_path,
+            "file_url": f"/static/uploads/{stored.file_path}",
+            "hash": image_hash,
+            "width": stored.width,
+            "height": stored.height,
+            "size_bytes": stored.size_bytes,
+            "format": stored.format,
+            "orientation": stored.orientation or 1,
+            "phash": stored.phash,
+            "analysis_url": analysis_url,
+            "original_name": original_name,
+            "uploaded_at": datetime.now().isoformat(),
+            "deduplicated": deduplicated
         }
     
-    def get_full_path(self, relative_path: str) -> Path:
-        """获取文件的完整路径"""
-        return self.UPLOAD_DIR / relative_path
+    def _tmp_path(self) -> Path:
+        tmp_dir = self.UPLOAD_DIR / ".tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        return tmp_dir / f"{uuid.uuid4().hex}.part"
+    
+    def _too_large_message(self) -> str:
+        return f"文件过大，最大支持 {self.MAX_FILE_SIZE // 1024 // 1024}MB"
+    
+    @staticmethod
+    def _hashed_path(image_hash: str, file_ext: str) -> str:
+        return f"{image_hash[:2]}/{image_hash[2:4]}/{image_hash}{file_ext}"
+    
+    def _store(self, tmp_path: Path, image_hash: str, size_bytes: int, references: int = 1):
+        """在线程池中执行：复用已存储的相同文件，或校验格式后保存为新文件，返回 (索引记录, 是否复用)"""
+        stored = self._add_reference(image_hash, references)
+        if stored is not None:
+            return stored, True
+        
+        # 只读取文件头，按真实格式而不是文件名校验
+        probe = probe_image(tmp_path)
+        allowed = [ext for ext in FORMAT_EXTENSIONS.get(probe["format"], ()) if ext in self.ALLOWED_EXTENSIONS]
+        if not allowed:
+            raise ValueError(f"不支持的文件格式: {probe['format']}")
+        return self._store_new(tmp_path, image_hash, allowed[0], size_bytes, probe, references), False
+    
+    def _add_reference(self, image_hash: str, references: int = 1) -> Optional[StoredImage]:
+        """已存储相同内容时引用计数增加 references 并返回索引记录，否则返回 None"""
+        db = SessionLocal()
+        try:
+            updated = db.query(StoredImage)\
+                .filter(StoredImage.image_hash == image_hash)\
+                .update({
+                    StoredImage.ref_count: StoredImage.ref_count + references,
+                    StoredImage.last_referenced_at: datetime.utcnow()
+                }, synchronize_session=False)
+            db.commit()
+            if not updated:
+                return None
+            stored = db.query(StoredImage).filter(StoredImage.image_hash == image_hash).first()
+            # 索引记录存在但文件丢失（如被手工清理）时按新文件重新写入
+            if stored is None or not self.storage.exists(stored.file_path):
+                if stored is not None:
+                    db.delete(stored)
+                    db.commit()
+                return None
+            db.expunge(stored)
+            return stored
+        finally:
+            db.close()
+    
+    def _store_new(self, tmp_path: Path, image_hash: str, file_ext: str, size_bytes: int,
+                   probe: dict, references: int = 1) -> StoredImage:
+        """把临时文件保存到内容寻址路径（本地为原子重命名，S3 为分片上传）并写入索引"""
+        relative_path = self._hashed_path(image_hash, file_ext)
+        # 感知哈希需在保存前计算（S3 后端上传后会删除本地临时文件）
+        phash = self._phash(tmp_path)
+        self.storage.save(tmp_path, relative_path, content_type=f"image/{probe['format'].lower()}")
+        
+        stored = StoredImage(
+            image_hash=image_hash,
+            file_path=relative_path,
+            size_bytes=size_bytes,
+            width=probe["width"],
+            height=probe["height"],
+            format=probe["format"],
+            orientation=probe["orientation"],
+            phash=phash,
+            ref_count=references
+        )
+        db = SessionLocal()
+        try:
+            db.add(stored)
+            db.commit()
+            db.refresh(stored)
+            db.expunge(stored)
+            return stored
+        except IntegrityError:
+            # 相同内容被并发上传，另一请求已写入索引，改为增加引用
+            db.rollback()
+            existing = self._add_reference(image_hash, references)
+            if existing is None:
+                raise
+            if existing.file_path != relative_path:
+                # 与旧规则存储的同内容文件路径不同，删除本次多余的文件
+                self.storage.delete(relative_path)
+            return existing
+        finally:
+            db.close()
+    
+    @staticmethod
+    def _phash(path: Path) -> Optional[str]:
+        if not settings.PHASH_ENABLED:
+            return None
+        try:
+            return compute_phash(path)
+        except Exception as e:
+            print(f"[ImageUpload] phash failed for {path}: {e}")
+            return None
+    
+    @staticmethod
+    def add_references(db, counts: Dict[str, int]) -> set:
+        """
+        在调用方事务中为已存储的图片增加引用（hash -> 引用数，不提交），
+        与 save_stream(reference=False) 配合，使引用与面诊记录同时提交或回滚。
+        返回索引中已不存在的 hash（保存后被 delete_image 回收），调用方不应为其创建记录
+        """
+        now = datetime.utcnow()
+        missing = set()
+        for image_hash, count in counts.items():
+            updated = db.query(StoredImage)\
+                .filter(StoredImage.image_hash == image_hash)\
+                .update({
+                    StoredImage.ref_count: StoredImage.ref_count + count,
+                    StoredImage.last_referenced_at: now
+                }, synchronize_session=False)
+            if not updated:
+                missing.add(image_hash)
+        return missing
+    
+    def reclaim_unreferenced(self, older_than: timedelta) -> int:
+        """
+        删除引用数为 0 且超过 older_than 未被引用的图片（批量导入中断后未创建记录的文件），
+        返回删除的文件数；最近写入的跳过，避免与正在进行的导入竞争
+        """
+        cutoff = datetime.utcnow() - older_than
+        db = SessionLocal()
+        try:
+            stale = db.query(StoredImage.id, StoredImage.file_path)\
+                .filter(StoredImage.ref_count <= 0, StoredImage.last_referenced_at < cutoff).all()
+            reclaimed = 0
+            for row in stale:
+                # 条件删除：期间被重新引用的记录保留
+                released = db.query(StoredImage)\
+                    .filter(StoredImage.id == row.id, StoredImage.ref_count <= 0)\
+                    .delete(synchronize_session=False)
+                db.commit()
+                if released:
+                    self.storage.delete(row.file_path)
+                    ThumbnailService.remove(row.file_path)
+                    reclaimed += 1
+            return reclaimed
+        finally:
+            db.close()
+    
+    def get_full_path(self, relative_path: str) -> str:
+        """获取文件在存储后端中的完整位置（本地路径或 s3://bucket/key）"""
+        return self.storage.full_path(relative_path)
     
     def delete_image(self, relative_path: str) -> bool:
-        """删除图片文件"""
-        full_path = self.get_full_path(relative_path)
-        if full_path.exists():
-            full_path.unlink()
+        """
+        移除一个图片引用，最后一个引用移除后才删除文件
+        未登记在索引中的旧文件（按日期目录存储）直接删除
+        """
+        db = SessionLocal()
+        try:
+            stored = db.query(StoredImage).filter(StoredImage.file_path == relative_path).first()
+            if stored is None:
+                if self.storage.exists(relative_path):
+                    self.storage.delete(relative_path)
+                    ThumbnailService.remove(relative_path)
+                    return True
+                return False
+            
+            db.query(StoredImage).filter(StoredImage.id == stored.id)\
+                .update({StoredImage.ref_count: StoredImage.ref_count - 1}, synchronize_session=False)
+            # 仅当引用已归零时删除，避免与并发上传的 +1 竞争
+            released = db.query(StoredImage)\
+                .filter(StoredImage.id == stored.id, StoredImage.ref_count <= 0)\
+                .delete(synchronize_session=False)
+            db.commit()
+            if released:
+                self.storage.delete(relative_path)
+                ThumbnailService.remove(relative_path)
             return True
-        return False
+        finally:
+            db.close()
@@ -0,0 +1,168 @@
+import time
+import threading
+from typing import Any, Dict, List, Optional
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.face_exam import FaceExam
+from app.utils.hamming_index import HammingIndex
+
+# MockAIProvider（MockAI-v1）与 DeepSeek 降级数据（MockAI）的 ai_provider 前缀
+MOCK_PROVIDER_PREFIX = "MockAI"
+
+class PerceptualHashService:
+    """
+    面诊图片的近似重复检索
+
+    上传时计算的感知哈希（FaceExam.image_phash）加载到进程内多索引哈希表（HammingIndex），
+    按汉明距离查找近似图片：
+    - 同一患者重新压缩/轻微裁剪后重复上传时复用已有分析结果
+    - 同一张照片出现在不同患者名下时在诊断记录上标记（duplicate_matches）
+    索引在启动时后台加载（或首次使用时加载），本进程新增记录提交后直接加入，
+    并按 PHASH_INDEX_REFRESH_SECONDS 在后台线程增量同步其他节点写入的记录。
+    """
+
+    _index: Optional[HammingIndex] = None
+    _loaded = False          # 首次全量加载是否完成
+    _synced_id = 0           # 已从数据库同步到的最大记录 ID
+    _local_ids: set = set()  # 本进程 add 的、ID 大于 _synced_id 的记录（同步时跳过，避免重复）
+    _synced_at = 0.0
+    _refreshing = False
+    _lock = threading.Lock()       # 保护索引读写，只在内存操作期间持有
+    _sync_lock = threading.Lock()  # 同一时刻只有一个同步在查询数据库
+    _lookups = 0
+    _lookup_seconds = 0.0
+
+    SYNC_PAGE_SIZE = 50000
+
+    @classmethod
+    def _sync(cls):
+        """
+        从数据库增量加载 ID 大于 _synced_id 的记录（面诊记录只增不删，ID 单调递增）。
+        按页查询，数据库查询期间不持有索引锁，每页只在加入内存索引时短暂持锁
+        """
+        with cls._sync_lock:
+            try:
+                while True:
+                    db = SessionLocal()
+                    try:
+                        rows = db.query(FaceExam.id, FaceExam.patient_id, FaceExam.image_phash)\
+                            .filter(FaceExam.id > cls._synced_id, FaceExam.image_phash.isnot(None))\
+                            .order_by(FaceExam.id).limit(cls.SYNC_PAGE_SIZE).all()
+                    finally:
+                        db.close()
+                    with cls._lock:
+                        if cls._index is None:
+                            cls._index = HammingIndex()
+                        for row in rows:
+                            if row.id not in cls._local_ids:
+                                cls._index.add(int(row.image_phash, 16), (row.id, row.patient_id))
+                        if rows:
+                            cls._synced_id = rows[-1].id
+                            cls._local_ids = {i for i in cls._local_ids if i > cls._synced_id}
+                    if len(rows) < cls.SYNC_PAGE_SIZE:
+                        break
+                cls._loaded = True
+                cls._synced_at = time.monotonic()
+            except Exception as e:
+                print(f"[PerceptualHash] index sync failed: {type(e).__name__}: {e}")
+            finally:
+                cls._refreshing = False
+
+    @classmethod
+    def _ensure_fresh(cls):
+        """首次使用时同步加载；之后按 PHASH_INDEX_REFRESH_SECONDS 在后台线程增量同步，查询不等待"""
+        if not cls._loaded:
+            cls._sync()
+            return
+        if cls._refreshing or time.monotonic() - cls._synced_at <= settings.PHASH_INDEX_REFRESH_SECONDS:
+            return
+        with cls._lock:
+            if cls._refreshing:
+                return
+            cls._refreshing = True
+        threading.Thread(target=cls._sync, name="phash-sync", daemon=True).start()
+
+    @classmethod
+    def warm_up(cls):
+        """应用启动时在后台完成首次加载，避免第一个上传请求等待全表读取"""
+        if settings.PHASH_ENABLED:
+            threading.Thread(target=cls._sync, name="phash-sync", daemon=True).start()
+
+    @classmethod
+    def add(cls, exam: FaceExam):
+        """加入已提交的记录"""
+        if not exam.image_phash:
+            return
+        cls._ensure_fresh()
+        with cls._lock:
+            # 首次加载失败时索引为空，下次使用时重试
+            if cls._index is None or exam.id <= cls._synced_id or exam.id in cls._local_ids:
+                return
+            cls._index.add(int(exam.image_phash, 16), (exam.id, exam.patient_id))
+            cls._local_ids.add(exam.id)
+
+    @classmethod
+    def find(cls, phash: str, max_distance: int) -> List[Dict[str, Any]]:
+        """返回距离不超过 max_distance 的面诊记录: [{"exam_id", "patient_id", "distance"}]"""
+        cls._ensure_fresh()
+        with cls._lock:
+            if cls._index is None:
+                return []
+            started = time.perf_counter()
+            matches = cls._index.search(int(phash, 16), max_distance)
+            cls._lookups += 1
+            cls._lookup_seconds += time.perf_counter() - started
+        return [
+            {"exam_id": exam_id, "patient_id": patient_id, "distance": distance}
+            for distance, (exam_id, patient_id) in matches
+        ]
+
+    @classmethod
+    def find_reusable(cls, db: Session, patient_id: int, phash: Optional[str]) -> Optional[FaceExam]:
+        """
+        同一患者近似图片中距离最近、已完成真实 AI 分析的记录（用于复用分析结果）
+
+        与精确分析缓存一样排除降级结果：Mock Provider（ai_provider 以 MockAI 开头，
+        包括 DeepSeek 失败时的 MockAI 降级数据）的记录不复用。
+        注意精确缓存键包含 last_metrics 上下文，这里不比较上下文：复用的是同一张照片
+        当时的分析结果，即使期间患者又有新的面诊记录
+        """
+        if not phash or not settings.PHASH_REUSE_ENABLED:
+            return None
+        candidates = [
+            m for m in cls.find(phash, settings.PHASH_REUSE_MAX_DISTANCE) if m["patient_id"] == patient_id
+        ]
+        if not candidates:
+            return None
+        distances = {m["exam_id"]: m["distance"] for m in candidates}
+        exams = db.query(FaceExam).filter(
+            FaceExam.id.in_(distances),
+            or_(FaceExam.status == "done", FaceExam.status.is_(None)),
+            FaceExam.metrics.isnot(None),
+            FaceExam.ai_provider.isnot(None),
+            FaceExam.ai_provider.notlike(f"{MOCK_PROVIDER_PREFIX}%")
+        ).all()
+        if not exams:
+            return None
+        return min(exams, key=lambda e: (distances[e.id], -e.id))
+
+    @classmethod
+    def cross_patient_matches(cls, exam: FaceExam) -> List[Dict[str, Any]]:
+        """其他患者名下的近似图片（疑似同一照片被关联到不同患者）"""
+        if not exam.image_phash:
+            return []
+        return [
+            m for m in cls.find(exam.image_phash, settings.PHASH_DUPLICATE_MAX_DISTANCE)
+            if m["patient_id"] != exam.patient_id
+        ]
+
+    @classmethod
+    def stats(cls) -> dict:
+        with cls._lock:
+            return {
+                "indexed": cls._index.size if cls._index else 0,
+                "lookups": cls._lookups,
+                "avg_lookup_ms": round(cls._lookup_seconds / cls._lookups * 1000, 4) if cls._lookups else None,
+            }
@@ -0,0 +1,69 @@
+import copy
+from typing import Optional, Dict, Any, Tuple
+from app.core.config import settings
+from app.utils.lru_cache import LRUCache
+from app.ai.metrics import ai_metrics
+from app.ai.scheduler import LANE_PLAN
+
+class PlanCacheService:
+    """
+    AI 方案生成结果缓存
+
+    方案提示词只依赖节气和六项肤质指标，因此以
+    (节气, 分桶后的指标) 为键复用 AI 结果；同一桶内的患者共享一份基础方案，
+    个性化部分仍由 PlanService._enhance_phases_with_exam 在其上叠加。
+    """
+
+    METRIC_KEYS = ["skin_age", "hydration", "inflammation", "elasticity", "pigmentation", "wrinkles"]
+
+    _cache = LRUCache(max_entries=settings.PLAN_CACHE_MAX_ENTRIES)
+
+    @staticmethod
+    def _bucket_size(metric: str) -> int:
+        if metric == "skin_age":
+            return settings.PLAN_CACHE_SKIN_AGE_BUCKET
+        return settings.PLAN_CACHE_METRIC_BUCKET
+
+    @staticmethod
+    def quantize_metrics(metrics: Optional[Dict[str, Any]]) -> Dict[str, int]:
+        """把指标量化为所在桶的中值，作为提示词输入和缓存键"""
+        quantized = {}
+        for metric in PlanCacheService.METRIC_KEYS:
+            value = (metrics or {}).get(metric)
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            size = PlanCacheService._bucket_size(metric)
+            quantized[metric] = int(value // size) * size + size // 2
+        return quantized
+
+    @staticmethod
+    def build_key(jieqi: str, quantized_metrics: Dict[str, int]) -> Tuple:
+        return (jieqi, tuple(sorted(quantized_metrics.items())))
+
+    @classmethod
+    def get(cls, key: Tuple) -> Optional[Dict[str, Any]]:
+        if not settings.PLAN_CACHE_ENABLED:
+            return None
+        plan = cls._cache.get(key)
+        ai_metrics.record_cache("plan", LANE_PLAN, hit=plan is not None)
+        # 调用方会就地修改 phases，返回副本避免污染缓存
+        return copy.deepcopy(plan) if plan is not None else None
+
+    @classmethod
+    def put(cls, key: Tuple, plan: Dict[str, Any]) -> None:
+        if not settings.PLAN_CACHE_ENABLED:
+            return
+        cls._cache.put(key, copy.deepcopy(plan))
+
+    @classmethod
+    def invalidate_jieqi(cls, jieqi: str) -> int:
+        """清除某个节气下的全部缓存方案，返回清除数量"""
+        return cls._cache.pop_where(lambda key: key[0] == jieqi)
+
+    @classmethod
+    def clear(cls) -> None:
+        cls._cache.clear()
+
+    @classmethod
+    def stats(cls) -> dict:
+        return cls._cache.stats()
@@ -1,3 +1,4 @@
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 import json
@@ -5,7 +6,16 @@ from app.models.plan import Plan, Survey
 from app.models.face_exam import FaceExam
 from app.services.timeline_service import TimelineService
 from app.utils.jieqi import JieqiUtils
-from app.ai.deepseek_provider import DeepSeekProvider
+from app.ai.registry import get_provider
+from app.ai.resilience import Deadline
+from app.ai.scheduler import LANE_PLAN
+from app.ai.metrics import ai_metrics
+from app.ai.hedging import AIHedge
+from app.ai.json_extractor import extract_json
+from app.schemas.ai_output import PlanOutput
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services.plan_cache_service import PlanCacheService
 
 def _parse_json_field(value):
     """将 JSON 字段解析为字典（处理 SQLite 返回字符串的情况）"""
@@ -21,25 +31,26 @@ def _parse_json_field(value):
     return {}
 
 class PlanService:
-    _ai_provider = None
-    
-    @classmethod
-    def get_ai_provider(cls):
-        if cls._ai_provider is None:
-            cls._ai_provider = DeepSeekProvider()
-        return cls._ai_provider
+    @staticmethod
+    def get_ai_provider():
+        return get_provider(LANE_PLAN)
 
-    def generate_plan_for_patient(self, db: Session, patient_id: int):
+    def generate_plan_for_patient(self, db: Session, patient_id: int, deadline: Deadline = None):
         """
         为患者生成基于节气、面诊和问卷的个性化方案
+        deadline 为 AI 调用的时间预算，默认 settings.AI_DEADLINE_PLAN
         """
+        if deadline is None:
+            deadline = Deadline.after(settings.AI_DEADLINE_PLAN)
+        
         # 1. 获取当前节气
         current_jieqi = JieqiUtils.get_current_jieqi()
         jieqi_advice = JieqiUtils.get_advice_for_jieqi(current_jieqi)
         
-        # 2. 获取最新面诊结果
+        # 2. 获取最新面诊结果（跳过仍在分析中的记录）
         latest_exam = db.query(FaceExam).filter(
-            FaceExam.patient_id == patient_id
+            FaceExam.patient_id == patient_id,
+            or_(FaceExam.status == "done", FaceExam.status.is_(None))
         ).order_by(FaceExam.created_at.desc()).first()
         
         # 3. 获取最近问卷数据
@@ -63,8 +74,8 @@ class PlanService:
                 for s in recent_surveys
             ]
         
-        # 5. 调用 AI 生成个性化方案
-        plan_data = self._generate_ai_plan(context, current_jieqi)
+        # 5. 调用 AI 生成个性化方案（启用对冲且超时时 pending 为仍在进行的 AI 调用）
+        plan_data, pending = self._generate_ai_plan(context, current_jieqi, deadline)
         
         # 5. 根据面诊结果增强方案
         enhanced_phases = self._enhance_phases_with_exam(
@@ -80,12 +91,20 @@ class PlanService:
             start_date=datetime.now(),
             end_date=datetime.now() + timedelta(days=14),
             goal=self._generate_goal(latest_exam, jieqi_advice),
-            phases=enhanced_phases
+            phases=enhanced_phases,
+            is_provisional=pending is not None
         )
         db.add(db_plan)
         db.commit()
         db.refresh(db_plan)
         
+        if pending is not None:
+            plan_id, exam_id = db_plan.id, latest_exam.id if latest_exam else None
+            AIHedge.on_late(
+                pending, LANE_PLAN,
+                lambda plan: self._finalize_provisional_plan(plan_id, exam_id, jieqi_advice, plan)
+            )
+        
         # 7. 记录时间轴
         TimelineService.add_event(
             db=db,
@@ -121,37 +140,124 @@ class PlanService:
             
         return "、".join(filter(None, goals[:3]))
     
-    def _generate_ai_plan(self, context: dict, jieqi: str) -> dict:
-        """使用 AI 生成个性化方案，带快速降级"""
-        import json
+    def _generate_ai_plan(self, context: dict, jieqi: str, deadline: Deadline = None):
+        """
+        使用 AI 生成个性化方案，带缓存和快速降级
+        返回 (方案, pending)：启用对冲且 AI 超过 AI_HEDGE_SLO_PLAN 未返回时，
+        方案为默认方案，pending 为仍在后台进行的 AI 调用
+        """
+        # 指标按桶量化后作为提示词输入，同一节气同一桶的患者复用同一份 AI 方案
+        metrics = PlanCacheService.quantize_metrics(context.get('metrics'))
+        cache_key = PlanCacheService.build_key(jieqi, metrics)
         
+        cached_plan = PlanCacheService.get(cache_key)
+        if cached_plan is not None:
+            ai_metrics.record_result(LANE_PLAN, fallback=False)
+            return cached_plan, None
+        
+        def request_plan():
+            plan = self._request_ai_plan(metrics, jieqi, deadline)
+            if plan:
+                PlanCacheService.put(cache_key, plan)
+            return plan
+        
+        pending = None
+        if AIHedge.enabled(settings.AI_HEDGE_SLO_PLAN):
+            plan, pending = AIHedge.run(request_plan, settings.AI_HEDGE_SLO_PLAN, LANE_PLAN)
+        else:
+            plan = request_plan()
+        if plan:
+            ai_metrics.record_result(LANE_PLAN, fallback=False)
+            return plan, None
+        
+        # 降级到默认方案（不缓存）；对冲超时的由 _finalize_provisional_plan 按最终方案计入
+        if pending is None:
+            ai_metrics.record_result(LANE_PLAN, fallback=True)
+        return self._get_default_plan(context.get('jieqi_advice', {})), pending
+    
+    def _finalize_provisional_plan(self, plan_id: int, exam_id: int, jieqi_advice: dict, plan_data: dict) -> bool:
+        """用迟到的 AI 方案替换临时的默认方案；AI 失败时保留默认方案。返回是否替换"""
+        db = SessionLocal()
+        try:
+            db_plan = db.query(Plan).filter(Plan.id == plan_id).first()
+            if not db_plan or not db_plan.is_provisional:
+                return False
+            
+            if plan_data:
+                exam = db.query(FaceExam).filter(FaceExam.id == exam_id).first() if exam_id else None
+                db_plan.phases = self._enhance_phases_with_exam(
+                    plan_data.get("phases", []), exam, jieqi_advice
+                )
+            db_plan.is_provisional = False
+            db.commit()
+            ai_metrics.record_result(LANE_PLAN, fallback=not plan_data)
+            return bool(plan_data)
+        finally:
+            db.close()
+    
+    @staticmethod
+    def resume_provisional() -> int:
+        """服务重启后，为对冲回调已丢失的 provisional 方案重新请求 AI 方案"""
+        db = SessionLocal()
+        try:
+            plan_ids = [row.id for row in db.query(Plan.id).filter(Plan.is_provisional == True).all()]
+        finally:
+            db.close()
+        for plan_id in plan_ids:
+            AIHedge.resume(LANE_PLAN, lambda plan_id=plan_id: PlanService().retry_provisional_plan(plan_id))
+        return len(plan_ids)
+
+    def retry_provisional_plan(self, plan_id: int) -> bool:
+        """按方案生成时的节气与患者最新面诊重新请求 AI 方案，再按 _finalize_provisional_plan 写回"""
+        db = SessionLocal()
+        try:
+            db_plan = db.query(Plan).filter(Plan.id == plan_id).first()
+            if not db_plan or not db_plan.is_provisional:
+                return False
+            jieqi = db_plan.generated_at_jieqi
+            latest_exam = db.query(FaceExam).filter(
+                FaceExam.patient_id == db_plan.patient_id,
+                or_(FaceExam.status == "done", FaceExam.status.is_(None))
+            ).order_by(FaceExam.created_at.desc()).first()
+            exam_id = latest_exam.id if latest_exam else None
+            metrics = PlanCacheService.quantize_metrics(
+                _parse_json_field(latest_exam.metrics) if latest_exam and latest_exam.metrics else None
+            )
+        finally:
+            db.close()
+        
+        cache_key = PlanCacheService.build_key(jieqi, metrics)
+        plan_data = PlanCacheService.get(cache_key)
+        if plan_data is None:
+            plan_data = self._request_ai_plan(metrics, jieqi, Deadline.after(settings.AI_DEADLINE_PLAN))
+            if plan_data:
+                PlanCacheService.put(cache_key, plan_data)
+        return self._finalize_provisional_plan(
+            plan_id, exam_id, JieqiUtils.get_advice_for_jieqi(jieqi), plan_data
+        )
+    
+    def _request_ai_plan(self, metrics: dict, jieqi: str, deadline: Deadline = None) -> dict:
+        """调用 AI 生成方案，失败返回 None"""
         try:
             provider = PlanService.get_ai_provider()
             
             # 简化的提示词（减少 token，加快响应）
             prompt = f"""根据以下信息生成14天护理方案，直接输出JSON：
 节气：{jieqi}
-面诊指标：{json.dumps(context.get('metrics', {}), ensure_ascii=False) if context.get('metrics') else '无'}
+面诊指标：{json.dumps(metrics, ensure_ascii=False) if metrics else '无'}
 
 输出格式（只输出JSON）：
 {{"goal": "目标", "phases": [{{"phase": "第1-3天", "actions": {{"护理": ["建议1"], "饮食": ["建议1"]}}}}, {{"phase": "第4-10天", "actions": {{}}}}, {{"phase": "第11-14天", "actions": {{}}}}]}}"""
 
-            result = provider.chat([], prompt)
+            result = provider.chat([], prompt, deadline=deadline, lane=LANE_PLAN)
             
             if result:
-                json_str = result
-                if "```json" in result:
-                    json_str = result.split("```json")[1].split("```")[0]
-                elif "```" in result:
-                    json_str = result.split("```")[1].split("```")[0]
-                
-                return json.loads(json_str.strip())
+                return extract_json(result, PlanOutput)
                 
         except Exception as e:
             print(f"[Plan AI Error] {e}")
         
-        # 降级到默认方案
-        return self._get_default_plan(context.get('jieqi_advice', {}))
+        return None
     
     def _format_survey_context(self, surveys: list) -> str:
         """格式化问卷数据为上下文"""
@@ -2,23 +2,29 @@ from sqlalchemy.orm import Session
 from app.models.plan import Survey
 from app.schemas.plan import SurveyCreate
 from app.services.timeline_service import TimelineService
-from app.ai.deepseek_provider import DeepSeekProvider
+from app.ai.registry import get_provider
+from app.ai.resilience import Deadline
+from app.ai.scheduler import LANE_SURVEY
+from app.ai.metrics import ai_metrics
+from app.ai.hedging import AIHedge
+from app.core.config import settings
+from app.core.database import SessionLocal
 from typing import Dict, Any, List
 
 class SurveyService:
-    _ai_provider = None
-    
-    @classmethod
-    def get_ai_provider(cls):
-        if cls._ai_provider is None:
-            cls._ai_provider = DeepSeekProvider()
-        return cls._ai_provider
+    @staticmethod
+    def get_ai_provider():
+        return get_provider(LANE_SURVEY)
     
     @staticmethod
-    def submit_survey(db: Session, survey_in: SurveyCreate):
+    def submit_survey(db: Session, survey_in: SurveyCreate, deadline: Deadline = None):
         """
         提交问卷并进行智能评分分析
+        deadline 为 AI 调用的时间预算，默认 settings.AI_DEADLINE_SURVEY
         """
+        if deadline is None:
+            deadline = Deadline.after(settings.AI_DEADLINE_SURVEY)
+        
         # 计算总分
         score = 0
         answer_details = {}
@@ -29,24 +35,45 @@ class SurveyService:
                     score += int(v)
                     answer_details[k] = int(v)
         
-        # AI 智能分析建议
-        advice = SurveyService._generate_ai_advice(
-            survey_in.survey_type, 
-            score, 
-            answer_details
-        )
+        # AI 智能分析建议（启用对冲时，超过 AI_HEDGE_SLO_SURVEY 先用规则建议）
+        pending = None
+        if AIHedge.enabled(settings.AI_HEDGE_SLO_SURVEY):
+            advice, pending = AIHedge.run(
+                lambda: SurveyService._request_ai_advice(survey_in.survey_type, score, answer_details, deadline),
+                settings.AI_HEDGE_SLO_SURVEY, LANE_SURVEY
+            )
+            if pending is None:
+                # 按时返回时在此计入结果；超时的由 _finalize_provisional_advice 按最终建议计入
+                ai_metrics.record_result(LANE_SURVEY, fallback=not advice)
+            if not advice:
+                advice = SurveyService._rule_advice(survey_in.survey_type, score, answer_details)
+        else:
+            advice = SurveyService._generate_ai_advice(
+                survey_in.survey_type, 
+                score, 
+                answer_details,
+                deadline
+            )
 
         db_survey = Survey(
             patient_id=survey_in.patient_id,
             survey_type=survey_in.survey_type,
             answers=survey_in.answers,
             score=score,
-            summary_advice=advice
+            summary_advice=advice,
+            is_provisional=pending is not None
         )
         db.add(db_survey)
         db.commit()
         db.refresh(db_survey)
         
+        if pending is not None:
+            survey_id = db_survey.id
+            AIHedge.on_late(
+                pending, LANE_SURVEY,
+                lambda ai_advice: SurveyService._finalize_provisional_advice(survey_id, ai_advice)
+            )
+        
         # 记录时间轴
         TimelineService.add_event(
             db=db,
@@ -60,10 +87,19 @@ class SurveyService:
         return db_survey
 
     @staticmethod
-    def _generate_ai_advice(survey_type: str, score: int, answers: Dict[str, Any]) -> str:
+    def _generate_ai_advice(survey_type: str, score: int, answers: Dict[str, Any], deadline: Deadline = None) -> str:
         """
-        使用 AI 根据问卷类型和答案生成智能建议
+        使用 AI 根据问卷类型和答案生成智能建议，失败时降级到本地规则
         """
+        advice = SurveyService._request_ai_advice(survey_type, score, answers, deadline)
+        ai_metrics.record_result(LANE_SURVEY, fallback=not advice)
+        if advice:
+            return advice
+        return SurveyService._rule_advice(survey_type, score, answers)
+    
+    @staticmethod
+    def _request_ai_advice(survey_type: str, score: int, answers: Dict[str, Any], deadline: Deadline = None) -> str:
+        """调用 AI 生成建议，失败返回空字符串"""
         try:
             provider = SurveyService.get_ai_provider()
             
@@ -82,13 +118,64 @@ class SurveyService:
 
 直接输出建议内容，不要有开头寒暄。"""
 
-            result = provider.chat([], prompt)
+            result = provider.chat([], prompt, deadline=deadline, lane=LANE_SURVEY)
             if result:
                 return result.strip()[:500]  # 限制长度
         except Exception as e:
             print(f"[Survey AI Error] {e}")
+        return ""
+    
+    @staticmethod
+    def resume_provisional() -> int:
+        """服务重启后，为对冲回调已丢失的 provisional 问卷重新请求 AI 建议"""
+        db = SessionLocal()
+        try:
+            survey_ids = [row.id for row in db.query(Survey.id).filter(Survey.is_provisional == True).all()]
+        finally:
+            db.close()
+        for survey_id in survey_ids:
+            AIHedge.resume(LANE_SURVEY, lambda survey_id=survey_id: SurveyService._retry_provisional_advice(survey_id))
+        return len(survey_ids)
+    
+    @staticmethod
+    def _retry_provisional_advice(survey_id: int) -> bool:
+        db = SessionLocal()
+        try:
+            survey = db.query(Survey).filter(Survey.id == survey_id).first()
+            if not survey or not survey.is_provisional:
+                return False
+            survey_type, score = survey.survey_type, survey.score
+            answers = {
+                k: int(v) for k, v in (survey.answers or {}).items() if isinstance(v, (int, float))
+            } if isinstance(survey.answers, dict) else {}
+        finally:
+            db.close()
         
-        # 降级到本地规则
+        advice = SurveyService._request_ai_advice(
+            survey_type, score, answers, Deadline.after(settings.AI_DEADLINE_SURVEY)
+        )
+        return SurveyService._finalize_provisional_advice(survey_id, advice)
+    
+    @staticmethod
+    def _finalize_provisional_advice(survey_id: int, advice: str) -> bool:
+        """用迟到的 AI 建议替换规则建议；AI 失败时保留规则建议。返回是否替换"""
+        db = SessionLocal()
+        try:
+            survey = db.query(Survey).filter(Survey.id == survey_id).first()
+            if not survey or not survey.is_provisional:
+                return False
+            if advice:
+                survey.summary_advice = advice
+            survey.is_provisional = False
+            db.commit()
+            ai_metrics.record_result(LANE_SURVEY, fallback=not advice)
+            return bool(advice)
+        finally:
+            db.close()
+    
+    @staticmethod
+    def _rule_advice(survey_type: str, score: int, answers: Dict[str, Any]) -> str:
+        """本地规则建议（AI 不可用或超时时使用）"""
         if "满意度" in survey_type:
             return SurveyService._analyze_satisfaction(score, answers)
         elif "健康" in survey_type:
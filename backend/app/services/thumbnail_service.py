@@ -0,0 +1,176 @@
+import threading
+import mimetypes
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, as_completed
+from pathlib import PurePosixPath
+from typing import Optional
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.face_exam import FaceExam
+from app.storage.registry import get_storage
+from app.utils.image_derivatives import derivative_name, render_derivatives
+
+UPLOAD_URL_PREFIX = "/static/uploads/"
+
+class ThumbnailService:
+    """
+    上传图片的缩略图/衍生图生成
+
+    图片解码与编码是 CPU 密集操作，放在独立进程池中执行，不占用请求线程和 GIL。
+    按 THUMBNAIL_SIZES x THUMBNAIL_FORMATS 生成，与原图存放在同一目录（abcd.jpg -> abcd_w240.webp），
+    完成后回填引用该原图的 FaceExam.thumbnail_url。
+    每个任务由调度线程取得原图的本地副本（S3 后端时下载）、等待进程池渲染、再把衍生图写回存储后端。
+    """
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _dispatcher: Optional[ThreadPoolExecutor] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _get_executor(cls) -> ProcessPoolExecutor:
+        with cls._lock:
+            if cls._executor is None:
+                # spawn: 不继承父进程的线程与数据库连接
+                cls._executor = ProcessPoolExecutor(
+                    max_workers=settings.THUMBNAIL_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return cls._executor
+
+    @classmethod
+    def _get_dispatcher(cls) -> ThreadPoolExecutor:
+        with cls._lock:
+            if cls._dispatcher is None:
+                cls._dispatcher = ThreadPoolExecutor(
+                    max_workers=settings.THUMBNAIL_WORKERS,
+                    thread_name_prefix="thumbnail"
+                )
+            return cls._dispatcher
+
+    @classmethod
+    def run_in_pool(cls, fn, *args):
+        """在图片处理进程池中执行 fn 并等待结果（fn 须只依赖 Pillow，见 app.utils.image_derivatives）"""
+        return cls._get_executor().submit(fn, *args).result()
+
+    @staticmethod
+    def thumbnail_path(file_path: str) -> str:
+        """原图相对路径对应的 thumbnail_url 衍生图相对路径"""
+        name = derivative_name(
+            PurePosixPath(file_path).name, settings.THUMBNAIL_SIZES[0], settings.THUMBNAIL_FORMATS[0]
+        )
+        return PurePosixPath(file_path).with_name(name).as_posix()
+
+    @classmethod
+    def _generate(cls, file_path: str) -> int:
+        """生成并保存衍生图，回填 thumbnail_url，返回更新的面诊记录数（在调度线程中执行）"""
+        storage = get_storage()
+        source_path = PurePosixPath(file_path)
+        # 先在存储后端检查目标是否已存在：去重复用的原图不再下载、渲染和上传
+        # （S3 后端的 local_copy 是空的临时目录，render_derivatives 自身的跳过判断对其无效）
+        missing = {
+            (source_path.parent / name).as_posix()
+            for name in (
+                derivative_name(source_path.name, size, fmt)
+                for size in settings.THUMBNAIL_SIZES for fmt in settings.THUMBNAIL_FORMATS
+            )
+            if not storage.exists((source_path.parent / name).as_posix())
+        }
+        if missing:
+            with storage.local_copy(file_path) as source:
+                names = cls._get_executor().submit(
+                    render_derivatives,
+                    str(source),
+                    settings.THUMBNAIL_SIZES,
+                    settings.THUMBNAIL_FORMATS,
+                    settings.THUMBNAIL_QUALITY
+                ).result()
+                for name in names:
+                    key = (source_path.parent / name).as_posix()
+                    if key in missing:
+                        storage.save(source.with_name(name), key,
+                                     content_type=mimetypes.guess_type(name)[0])
+        return cls._apply(file_path)
+
+    @classmethod
+    def _apply(cls, file_path: str) -> int:
+        """为引用该原图且尚无缩略图的面诊记录回填 thumbnail_url，返回更新条数"""
+        db = SessionLocal()
+        try:
+            updated = db.query(FaceExam)\
+                .filter(FaceExam.image_url == UPLOAD_URL_PREFIX + file_path,
+                        FaceExam.thumbnail_url.is_(None))\
+                .update({FaceExam.thumbnail_url: UPLOAD_URL_PREFIX + cls.thumbnail_path(file_path)},
+                        synchronize_session=False)
+            db.commit()
+            return updated
+        finally:
+            db.close()
+
+    @classmethod
+    def submit(cls, file_path: Optional[str]) -> Optional[Future]:
+        """面诊记录落库后调用：后台生成衍生图并回填 thumbnail_url"""
+        if not settings.THUMBNAIL_ENABLED or not file_path:
+            return None
+        return cls._get_dispatcher().submit(cls._run, file_path)
+
+    @classmethod
+    def _run(cls, file_path: str):
+        try:
+            cls._generate(file_path)
+        except Exception as e:
+            print(f"[Thumbnail Error] {file_path} {type(e).__name__}: {e}")
+
+    @staticmethod
+    def remove(file_path: str) -> int:
+        """删除原图的全部衍生图（缩略图、分析用规范化副本；原图最后一个引用移除时调用）"""
+        storage = get_storage()
+        source = PurePosixPath(file_path)
+        removed = 0
+        for key in storage.list(source.with_name(f"{source.stem}_").as_posix()):
+            storage.delete(key)
+            removed += 1
+        return removed
+
+    @classmethod
+    def backfill(cls, limit: Optional[int] = None) -> dict:
+        """为已有的、图片存放在本地上传目录但没有缩略图的面诊记录补生成缩略图"""
+        db = SessionLocal()
+        try:
+            query = db.query(FaceExam.image_url)\
+                .filter(FaceExam.thumbnail_url.is_(None),
+                        FaceExam.image_url.like(UPLOAD_URL_PREFIX + "%"))\
+                .distinct()
+            if limit:
+                query = query.limit(limit)
+            file_paths = [row.image_url[len(UPLOAD_URL_PREFIX):] for row in query.all()]
+        finally:
+            db.close()
+
+        stats = {"images": len(file_paths), "exams_updated": 0, "missing": 0, "failed": 0}
+        storage = get_storage()
+        futures = {}
+        for file_path in file_paths:
+            if not storage.exists(file_path):
+                stats["missing"] += 1
+                continue
+            futures[cls._get_dispatcher().submit(cls._generate, file_path)] = file_path
+
+        for future in as_completed(futures):
+            file_path = futures[future]
+            try:
+                # _generate 已回填 thumbnail_url 并返回更新条数
+                stats["exams_updated"] += future.result()
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"[Thumbnail Backfill Error] {file_path} {type(e).__name__}: {e}")
+        return stats
+
+    @classmethod
+    def shutdown(cls):
+        with cls._lock:
+            if cls._dispatcher is not None:
+                cls._dispatcher.shutdown(wait=False, cancel_futures=True)
+                cls._dispatcher = None
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=False, cancel_futures=True)
+                cls._executor = None
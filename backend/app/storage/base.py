@@ -0,0 +1,56 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List
+
+
+class BaseStorageBackend(ABC):
+    """
+    上传文件存储后端
+
+    key 为相对路径（如 ab/cd/<hash>.jpg），与 FaceExam.image_url 中 /static/uploads/ 之后的部分一致。
+    写入以本地文件为输入：上传先落到本地临时文件计算 hash，再交给后端保存。
+    """
+
+    # 是否可由本地 /static/uploads 直接提供文件；否则该路径重定向到 url(key)
+    is_local: bool = False
+
+    @abstractmethod
+    def save(self, local_path: Path, key: str, content_type: str = None) -> None:
+        """保存本地文件到 key（local_path 会被移走或删除，调用后不应再使用）"""
+        pass
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def list(self, prefix: str) -> List[str]:
+        """列出以 prefix 开头的全部 key"""
+        pass
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        """浏览器可直接访问的地址（本地为静态路径，对象存储为预签名或公开地址）"""
+        pass
+
+    @abstractmethod
+    def full_path(self, key: str) -> str:
+        """文件在后端中的完整位置（本地路径或 s3://bucket/key），用于日志与排查"""
+        pass
+
+    @abstractmethod
+    @contextmanager
+    def local_copy(self, key: str) -> Iterator[Path]:
+        """
+        提供文件的本地路径用于解码处理，退出时清理临时副本。
+        同目录下写出的衍生文件可再用 save(path, 同目录 key) 保存。
+        """
+        pass
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,59 @@
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List
+from app.storage.base import BaseStorageBackend
+
+
+class LocalStorageBackend(BaseStorageBackend):
+    """本地磁盘存储（默认），文件由 /static/uploads 静态服务直接提供"""
+
+    is_local = True
+
+    def __init__(self, root: str = "uploads"):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key
+
+    def save(self, local_path: Path, key: str, content_type: str = None) -> None:
+        target = self._path(key)
+        if Path(local_path).resolve() == target.resolve():
+            # 衍生图直接写在原图旁边，已在目标位置
+            return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(local_path, target)
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def delete(self, key: str) -> bool:
+        path = self._path(key)
+        if path.exists():
+            path.unlink(missing_ok=True)
+            return True
+        return False
+
+    def list(self, prefix: str) -> List[str]:
+        directory, _, name_prefix = prefix.rpartition("/")
+        base = self._path(directory) if directory else self.root
+        if not base.is_dir():
+            return []
+        return [
+            (f"{directory}/{p.name}" if directory else p.name)
+            for p in base.iterdir() if p.is_file() and p.name.startswith(name_prefix)
+        ]
+
+    def url(self, key: str) -> str:
+        return f"/static/uploads/{key}"
+
+    def full_path(self, key: str) -> str:
+        return str(self._path(key))
+
+    @contextmanager
+    def local_copy(self, key: str) -> Iterator[Path]:
+        path = self._path(key)
+        if not path.exists():
+            raise FileNotFoundError(str(path))
+        yield path
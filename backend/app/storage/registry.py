@@ -0,0 +1,33 @@
+import threading
+from typing import Optional
+from app.core.config import settings
+from app.storage.base import BaseStorageBackend
+from app.storage.local import LocalStorageBackend
+
+_storage: Optional[BaseStorageBackend] = None
+_lock = threading.Lock()
+
+
+def get_storage() -> BaseStorageBackend:
+    """按 settings.STORAGE_BACKEND 返回进程内共享的存储后端（local / s3）"""
+    global _storage
+    with _lock:
+        if _storage is None:
+            backend = settings.STORAGE_BACKEND.lower()
+            if backend == "s3":
+                from app.storage.s3 import S3StorageBackend
+                _storage = S3StorageBackend()
+            else:
+                if backend != "local":
+                    print(f"[Storage] unknown STORAGE_BACKEND '{backend}', using local")
+                _storage = LocalStorageBackend()
+        return _storage
+
+
+def close_storage():
+    """释放连接池（应用关闭时调用）"""
+    global _storage
+    with _lock:
+        if _storage is not None:
+            _storage.close()
+            _storage = None
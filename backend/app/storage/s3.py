@@ -0,0 +1,112 @@
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List
+from app.core.config import settings
+from app.storage.base import BaseStorageBackend
+
+
+class S3StorageBackend(BaseStorageBackend):
+    """
+    S3 兼容对象存储（AWS S3 / MinIO 等），多个后端节点共享同一份上传文件
+
+    - 进程内共用一个 boto3 client（线程安全），连接池大小 S3_MAX_POOL_CONNECTIONS
+    - 超过 S3_MULTIPART_THRESHOLD 的文件按 S3_MULTIPART_CHUNKSIZE 分片并发上传，按块读取本地文件
+    - 对象写入时带上 immutable Cache-Control；浏览器通过预签名 URL（或 S3_PUBLIC_BASE_URL）读取
+    """
+
+    is_local = False
+
+    def __init__(self):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 需要安装 boto3: pip install boto3") from e
+
+        self.bucket = settings.S3_BUCKET
+        self.prefix = settings.S3_KEY_PREFIX
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT_URL or None,
+            region_name=settings.S3_REGION,
+            aws_access_key_id=settings.S3_ACCESS_KEY or None,
+            aws_secret_access_key=settings.S3_SECRET_KEY or None,
+            config=Config(
+                max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+                retries={"max_attempts": 3, "mode": "standard"},
+                # MinIO 等自建服务通常不支持虚拟主机风格的 bucket 域名
+                s3={"addressing_style": "path" if settings.S3_ENDPOINT_URL else "auto"},
+            ),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=settings.S3_MULTIPART_CONCURRENCY,
+        )
+        self._scratch = Path(settings.S3_SCRATCH_DIR)
+        self._scratch.mkdir(parents=True, exist_ok=True)
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def save(self, local_path: Path, key: str, content_type: str = None) -> None:
+        extra = {"CacheControl": f"public, max-age={settings.UPLOAD_CACHE_MAX_AGE}, immutable"}
+        if content_type:
+            extra["ContentType"] = content_type
+        try:
+            self.client.upload_file(
+                str(local_path), self.bucket, self._key(key),
+                ExtraArgs=extra, Config=self.transfer_config
+            )
+        finally:
+            Path(local_path).unlink(missing_ok=True)
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key: str) -> bool:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        return True
+
+    def list(self, prefix: str) -> List[str]:
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            keys += [obj["Key"][len(self.prefix):] for obj in page.get("Contents", [])]
+        return keys
+
+    def url(self, key: str) -> str:
+        if settings.S3_PUBLIC_BASE_URL:
+            return f"{settings.S3_PUBLIC_BASE_URL.rstrip('/')}/{self._key(key)}"
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key)},
+            ExpiresIn=settings.S3_PRESIGN_EXPIRES,
+        )
+
+    def full_path(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self._key(key)}"
+
+    @contextmanager
+    def local_copy(self, key: str) -> Iterator[Path]:
+        # 每次下载到独立的临时目录，衍生文件写在同一目录，退出时整体删除
+        workdir = Path(tempfile.mkdtemp(dir=self._scratch))
+        try:
+            path = workdir / Path(key).name
+            self.client.download_file(self.bucket, self._key(key), str(path), Config=self.transfer_config)
+            yield path
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def close(self) -> None:
+        self.client.close()
@@ -0,0 +1,69 @@
+from pathlib import Path
+from typing import List, Sequence
+from PIL import Image, ImageOps
+
+# 只依赖 Pillow：在子进程中执行，避免子进程导入数据库等应用模块
+
+_EXTENSIONS = {"webp": ".webp", "jpeg": ".jpg"}
+
+
+def derivative_name(source_name: str, size: int, fmt: str) -> str:
+    """原图文件名 -> 衍生图文件名，例如 abcd.jpg -> abcd_w240.webp"""
+    return f"{Path(source_name).stem}_w{size}{_EXTENSIONS[fmt]}"
+
+
+def render_derivatives(source_path: str, sizes: Sequence[int], formats: Sequence[str],
+                       quality: int) -> List[str]:
+    """
+    按尺寸（长边像素，不放大）和格式生成衍生图，写入原图所在目录，返回生成的文件名。
+    已存在的衍生图直接跳过（内容寻址存储下同一原图只需生成一次）。
+    """
+    source = Path(source_path)
+    targets = [
+        (size, fmt, source.with_name(derivative_name(source.name, size, fmt)))
+        for size in sizes for fmt in formats
+    ]
+    missing = [t for t in targets if not t[2].exists()]
+    if missing:
+        with Image.open(source) as img:
+            img.seek(0)  # GIF 等多帧图片只取第一帧
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            # 从大到小依次缩放，每次以上一尺寸的结果为输入
+            for size in sorted({t[0] for t in missing}, reverse=True):
+                img.thumbnail((size, size), Image.LANCZOS)
+                for _, fmt, target in (t for t in missing if t[0] == size):
+                    frame = img.convert("RGB") if fmt == "jpeg" else img
+                    tmp = target.with_name(f".{target.name}.part")
+                    frame.save(tmp, format=fmt.upper(), quality=quality, optimize=True)
+                    tmp.replace(target)
+    return [t[2].name for t in targets]
+
+
+def normalize_image(source_path: str, target_path: str, max_side: int, quality: int) -> dict:
+    """
+    生成供 AI 分析使用的规范化图片：按 EXIF 方向旋转、去除全部元数据、
+    长边缩小到 max_side（不放大），重新编码为 JPEG。返回前后字节数与像素数。
+    """
+    source = Path(source_path)
+    target = Path(target_path)
+    with Image.open(source) as img:
+        img.seek(0)
+        original_pixels = img.width * img.height
+        if img.format == "JPEG":
+            # JPEG 可在解码时按 1/2、1/4、1/8 缩放，大图只解码所需的分辨率
+            img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        # 不传 exif / icc_profile，输出不带任何元数据
+        tmp = target.with_name(f".{target.name}.part")
+        img.save(tmp, format="JPEG", quality=quality, optimize=True)
+        tmp.replace(target)
+        return {
+            "original_bytes": source.stat().st_size,
+            "normalized_bytes": target.stat().st_size,
+            "original_pixels": original_pixels,
+            "normalized_pixels": img.width * img.height,
+        }
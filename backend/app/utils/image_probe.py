@@ -0,0 +1,33 @@
+from PIL import Image, UnidentifiedImageError
+
+# 真实格式 -> 允许的扩展名（第一个为存储时使用的规范扩展名）
+FORMAT_EXTENSIONS = {
+    "JPEG": (".jpg", ".jpeg"),
+    "PNG": (".png",),
+    "GIF": (".gif",),
+    "WEBP": (".webp",),
+}
+
+_EXIF_ORIENTATION = 0x0112
+
+
+def probe_image(path) -> dict:
+    """
+    只读取文件头获取图片元信息，不解码像素
+
+    Returns:
+        dict: {"format": "JPEG", "width": int, "height": int, "orientation": int}
+        orientation 为 EXIF 方向（1-8，无 EXIF 时为 1），width/height 为未旋转的存储尺寸
+    """
+    try:
+        # Image.open 是惰性的：只解析文件头，像素数据在 load() 时才读取
+        with Image.open(path) as img:
+            orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+            return {
+                "format": img.format,
+                "width": img.width,
+                "height": img.height,
+                "orientation": orientation if orientation in range(1, 9) else 1,
+            }
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise ValueError("无法识别的图片文件") from e
@@ -0,0 +1,43 @@
+import numpy as np
+from PIL import Image, ImageOps
+
+# 64 位 DCT 感知哈希（pHash）：对重新压缩、缩放、轻微裁剪和调色不敏感，
+# 两张图片的汉明距离越小越相似（同一张照片通常 <= 4，不同照片通常 > 20）
+
+_DCT_SIZE = 32
+_HASH_SIZE = 8
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """正交 DCT-II 变换矩阵，二维 DCT = M @ X @ M.T"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def phash_image(img: Image.Image) -> str:
+    """计算已打开图片的感知哈希，返回 16 位十六进制字符串"""
+    gray = img.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE].flatten()
+    # 直流分量只反映整体亮度，不参与中位数计算
+    bits = low > np.median(low[1:])
+    return f"{int(''.join('1' if b else '0' for b in bits), 2):016x}"
+
+
+def compute_phash(path) -> str:
+    """读取图片文件计算感知哈希（按 EXIF 方向校正，JPEG 只按所需分辨率解码）"""
+    with Image.open(path) as img:
+        img.seek(0)
+        if img.format == "JPEG":
+            img.draft("L", (_DCT_SIZE * 2, _DCT_SIZE * 2))
+        return phash_image(ImageOps.exif_transpose(img))
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
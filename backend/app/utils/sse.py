@@ -0,0 +1,15 @@
+import json
+from typing import Optional
+
+# SSE 响应通用头：禁用缓存，并关闭 nginx 缓冲以保证逐条下发
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+def format_sse(data: dict, event: Optional[str] = None) -> str:
+    """格式化一条 SSE 事件"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
@@ -0,0 +1,68 @@
+import os
+from typing import Union
+from pathlib import Path, PurePosixPath
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, RedirectResponse, Response
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from starlette.types import Scope
+from app.core.config import settings
+from app.storage.registry import get_storage
+
+
+class UploadStaticFiles(StaticFiles):
+    """
+    上传图片的静态文件服务
+
+    上传目录按内容寻址，同一路径的内容永不改变（文件名即 image_hash，衍生图由其确定生成），
+    因此可以用文件名作为强 ETag，并返回长期有效的 immutable Cache-Control，
+    浏览器和 CDN 命中缓存后不再回源重新验证。
+    Range 请求（含 If-Range）和 ASGI pathsend 零拷贝由 FileResponse 处理。
+
+    存储后端为对象存储时，同一路径重定向到预签名（或公开）地址，数据库中保存的 URL 不变。
+    """
+
+    # 单次读取块大小，大图减少读取/发送次数（服务器不支持 pathsend 时生效）
+    chunk_size = 256 * 1024
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        # 不对外提供上传中的临时文件（.tmp/ 目录、.part 文件）
+        if any(part.startswith(".") for part in PurePosixPath(path).parts):
+            raise HTTPException(status_code=404)
+        storage = get_storage()
+        if not storage.is_local:
+            return self.redirect_response(storage.url(path))
+        return await super().get_response(path, scope)
+
+    @staticmethod
+    def redirect_response(url: str) -> Response:
+        if settings.S3_PUBLIC_BASE_URL:
+            # 公开地址固定不变，重定向本身也可长期缓存
+            cache_control = f"public, max-age={settings.UPLOAD_CACHE_MAX_AGE}, immutable"
+        else:
+            # 预签名地址每次生成都不同：缓存重定向半个有效期，浏览器在此期间复用同一地址及其图片缓存
+            cache_control = f"private, max-age={settings.S3_PRESIGN_EXPIRES // 2}"
+        return RedirectResponse(url, status_code=307, headers={"cache-control": cache_control})
+
+    def file_response(
+        self,
+        full_path: Union[str, os.PathLike],
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            stat_result=stat_result,
+            headers={
+                "etag": f'"{Path(full_path).stem}"',
+                "cache-control": f"public, max-age={settings.UPLOAD_CACHE_MAX_AGE}, immutable",
+            },
+        )
+        response.chunk_size = self.chunk_size
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,28 @@
+"""
+缩略图回填脚本 - 为已有面诊记录生成缩略图并填写 thumbnail_url
+运行: python backfill_thumbnails.py [--limit N]
+"""
+import sys
+import time
+import argparse
+sys.path.insert(0, '.')
+
+from app.services.thumbnail_service import ThumbnailService
+
+def backfill(limit=None):
+    started = time.perf_counter()
+    try:
+        stats = ThumbnailService.backfill(limit=limit)
+    finally:
+        ThumbnailService.shutdown()
+    elapsed = time.perf_counter() - started
+    
+    print(f"🖼️  图片: {stats['images']}  更新面诊记录: {stats['exams_updated']}")
+    print(f"⏭️  原图缺失: {stats['missing']}  生成失败: {stats['failed']}")
+    print(f"\n✅ Backfill complete in {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="为已有面诊记录生成缩略图")
+    parser.add_argument("--limit", type=int, default=None, help="最多处理的图片数")
+    args = parser.parse_args()
+    backfill(args.limit)
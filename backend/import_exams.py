@@ -0,0 +1,54 @@
+"""
+历史面诊照片批量导入脚本 - 从 ZIP 压缩包或目录按清单导入
+运行: python import_exams.py <ZIP 或目录> [--manifest manifest.csv] [--analyze] [--workers N]
+
+清单（CSV，默认为导入源根目录下的 manifest.csv）:
+    file,phone,taken_at
+    2019/zhang_0301.jpg,13800000001,2019-03-01
+    2019/li_0302.jpg,13800000002,
+也可用 patient_id 列代替 phone。中断后重新运行同一命令会从上次提交的批次继续。
+导入完成后可运行 python backfill_thumbnails.py 生成缩略图。
+"""
+import sys
+import argparse
+sys.path.insert(0, '.')
+
+from app.services.exam_import_service import ExamImportService
+from app.services.face_exam_worker import FaceExamWorker
+from app.storage.registry import close_storage
+
+def run(args):
+    service = ExamImportService(
+        args.source,
+        manifest=args.manifest,
+        analyze=args.analyze,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        state_path=args.state,
+        errors_path=args.errors
+    )
+    try:
+        stats = service.run(limit=args.limit)
+    finally:
+        FaceExamWorker.shutdown()
+        close_storage()
+    
+    print(f"\n📄 本次处理清单行: {stats['rows']}（累计完成 {stats['rows_done']}）")
+    print(f"✅ 新建面诊记录: {stats['created']}  ⏭️  已存在跳过: {stats['duplicates']}  ❌ 失败: {stats['failed']}")
+    print(f"🖼️  新图片: {stats['files_new']}  复用已存储图片: {stats['files_deduplicated']}")
+    print(
+        f"\n⏱️  {stats['elapsed_seconds']}s  "
+        f"{stats['rows_per_second']} rows/s  {stats['mb_per_second']} MB/s"
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从 ZIP 或目录批量导入历史面诊照片")
+    parser.add_argument("source", help="ZIP 压缩包或目录")
+    parser.add_argument("--manifest", default=None, help="清单 CSV 路径，默认取导入源中的 manifest.csv")
+    parser.add_argument("--analyze", action="store_true", help="导入后执行 AI 分析（默认只导入照片）")
+    parser.add_argument("--workers", type=int, default=None, help="并行写入图片的线程数")
+    parser.add_argument("--batch-size", type=int, default=None, help="每批提交的记录数")
+    parser.add_argument("--state", default=None, help="断点状态文件，默认 <导入源>.import-state.json")
+    parser.add_argument("--errors", default=None, help="失败行输出 CSV（行号, 文件, 原因）")
+    parser.add_argument("--limit", type=int, default=None, help="本次最多处理的清单行数")
+    run(parser.parse_args())
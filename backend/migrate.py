@@ -14,6 +14,13 @@ def migrate():
             ("face_exams", "image_width", "INTEGER"),
             ("face_exams", "image_height", "INTEGER"),
             ("face_exams", "status", "VARCHAR DEFAULT 'done'"),
+            ("plans", "is_provisional", "BOOLEAN DEFAULT 0"),
+            ("surveys", "is_provisional", "BOOLEAN DEFAULT 0"),
+            ("stored_images", "format", "VARCHAR"),
+            ("stored_images", "orientation", "INTEGER DEFAULT 1"),
+            ("stored_images", "phash", "VARCHAR"),
+            ("face_exams", "image_phash", "VARCHAR"),
+            ("face_exams", "duplicate_matches", "JSON"),
         ]
         
         for table, column, col_type in columns_to_add:
@@ -0,0 +1,262 @@
+"""
+本地 S3 兼容桩服务 - 用于离线验证 S3StorageBackend（MinIO 的轻量替代）
+
+运行:
+    python s3_stub_server.py --port 9100 --bucket face-ai-uploads
+
+然后让后端指向它:
+    STORAGE_BACKEND=s3 S3_ENDPOINT_URL=http://127.0.0.1:9100 S3_ACCESS_KEY=stub S3_SECRET_KEY=stub \\
+        uvicorn app.main:app
+
+支持路径风格（path-style）的 PutObject / GetObject（含 Range）/ HeadObject / DeleteObject /
+ListObjectsV2 / 分片上传（Create / UploadPart / Complete / Abort）与 CreateBucket / HeadBucket。
+不校验签名，预签名 URL 直接可用；对象保存在内存中。GET /_stub/stats 查看请求统计。
+"""
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+from email.utils import formatdate
+from xml.sax.saxutils import escape
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+
+
+class StubConfig:
+    def __init__(self):
+        self.latency = 0.0       # 每个请求的固定延迟（秒）
+        self.error_rate = 0.0    # 返回 503 SlowDown 的比例，用于验证重试
+
+
+config = StubConfig()
+stats = {"requests": 0, "errors": 0, "puts": 0, "gets": 0, "multipart_parts": 0, "multipart_completed": 0}
+
+# bucket -> key -> {"body", "etag", "content_type", "cache_control", "last_modified"}
+buckets = {}
+# upload_id -> {"bucket", "key", "parts": {part_number: bytes}, "content_type", "cache_control"}
+uploads = {}
+
+app = FastAPI(title="S3 Stub Server")
+
+
+def _xml(body: str, status_code: int = 200) -> Response:
+    return Response(
+        f'<?xml version="1.0" encoding="UTF-8"?>\n{body}',
+        status_code=status_code, media_type="application/xml"
+    )
+
+
+def _error(code: str, message: str, status_code: int) -> Response:
+    return _xml(f"<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>", status_code)
+
+
+def _decode_aws_chunked(data: bytes) -> bytes:
+    """
+    解码 aws-chunked 请求体（boto3 默认附带校验和时使用）:
+    <十六进制长度>[;chunk-signature=...]\\r\\n<数据>\\r\\n ... 0\\r\\n<trailer>\\r\\n\\r\\n
+    """
+    out = bytearray()
+    pos = 0
+    while pos < len(data):
+        line_end = data.index(b"\r\n", pos)
+        size = int(data[pos:line_end].split(b";")[0], 16)
+        if size == 0:
+            break
+        start = line_end + 2
+        out += data[start:start + size]
+        pos = start + size + 2
+    return bytes(out)
+
+
+async def _read_body(request: Request) -> bytes:
+    body = await request.body()
+    sha = request.headers.get("x-amz-content-sha256", "")
+    if "aws-chunked" in request.headers.get("content-encoding", "") or sha.startswith("STREAMING-"):
+        body = _decode_aws_chunked(body)
+    return body
+
+
+def _object_headers(obj: dict) -> dict:
+    headers = {
+        "ETag": obj["etag"],
+        "Last-Modified": formatdate(obj["last_modified"], usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Content-Type": obj["content_type"],
+    }
+    if obj["cache_control"]:
+        headers["Cache-Control"] = obj["cache_control"]
+    return headers
+
+
+def _store(bucket: str, key: str, body: bytes, etag: str, content_type: str, cache_control: str):
+    buckets[bucket][key] = {
+        "body": body,
+        "etag": etag,
+        "content_type": content_type or "binary/octet-stream",
+        "cache_control": cache_control,
+        "last_modified": time.time(),
+    }
+
+
+@app.get("/_stub/stats")
+async def get_stats():
+    return {
+        **stats,
+        "buckets": {name: len(objects) for name, objects in buckets.items()},
+        "pending_uploads": len(uploads),
+    }
+
+
+@app.middleware("http")
+async def inject_faults(request: Request, call_next):
+    if request.url.path.startswith("/_stub/"):
+        return await call_next(request)
+    stats["requests"] += 1
+    if config.latency:
+        await asyncio.sleep(config.latency)
+    if random.random() < config.error_rate:
+        stats["errors"] += 1
+        return _error("SlowDown", "Please reduce your request rate.", 503)
+    return await call_next(request)
+
+
+@app.api_route("/{bucket}", methods=["GET", "PUT", "HEAD", "DELETE"])
+@app.api_route("/{bucket}/", methods=["GET", "PUT", "HEAD", "DELETE"], include_in_schema=False)
+async def bucket_ops(bucket: str, request: Request):
+    if request.method == "PUT":
+        buckets.setdefault(bucket, {})
+        return Response(headers={"Location": f"/{bucket}"})
+    if bucket not in buckets:
+        if request.method == "HEAD":
+            return Response(status_code=404)
+        return _error("NoSuchBucket", bucket, 404)
+    if request.method == "HEAD":
+        return Response()
+    if request.method == "DELETE":
+        if buckets[bucket]:
+            return _error("BucketNotEmpty", bucket, 409)
+        del buckets[bucket]
+        return Response(status_code=204)
+
+    # ListObjectsV2（不分页，桩服务数据量小）
+    prefix = request.query_params.get("prefix", "")
+    keys = sorted(k for k in buckets[bucket] if k.startswith(prefix))
+    contents = "".join(
+        f"<Contents><Key>{escape(k)}</Key><Size>{len(buckets[bucket][k]['body'])}</Size>"
+        f"<ETag>{escape(buckets[bucket][k]['etag'])}</ETag>"
+        f"<LastModified>{time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(buckets[bucket][k]['last_modified']))}</LastModified>"
+        f"<StorageClass>STANDARD</StorageClass></Contents>"
+        for k in keys
+    )
+    return _xml(
+        f'<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+        f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix>"
+        f"<KeyCount>{len(keys)}</KeyCount><MaxKeys>1000</MaxKeys><IsTruncated>false</IsTruncated>"
+        f"{contents}</ListBucketResult>"
+    )
+
+
+@app.api_route("/{bucket}/{key:path}", methods=["GET", "PUT", "POST", "HEAD", "DELETE"])
+async def object_ops(bucket: str, key: str, request: Request):
+    if bucket not in buckets:
+        return _error("NoSuchBucket", bucket, 404)
+    params = request.query_params
+    objects = buckets[bucket]
+
+    if request.method == "POST" and "uploads" in params:
+        upload_id = uuid.uuid4().hex
+        uploads[upload_id] = {
+            "bucket": bucket, "key": key, "parts": {},
+            "content_type": request.headers.get("content-type"),
+            "cache_control": request.headers.get("cache-control"),
+        }
+        return _xml(
+            f"<InitiateMultipartUploadResult><Bucket>{escape(bucket)}</Bucket>"
+            f"<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+        )
+
+    if "uploadId" in params:
+        upload = uploads.get(params["uploadId"])
+        if upload is None:
+            return _error("NoSuchUpload", params["uploadId"], 404)
+        if request.method == "PUT":
+            body = await _read_body(request)
+            upload["parts"][int(params["partNumber"])] = body
+            stats["multipart_parts"] += 1
+            return Response(headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+        if request.method == "DELETE":
+            del uploads[params["uploadId"]]
+            return Response(status_code=204)
+        if request.method == "POST":
+            del uploads[params["uploadId"]]
+            parts = [upload["parts"][n] for n in sorted(upload["parts"])]
+            digest = hashlib.md5(b"".join(hashlib.md5(p).digest() for p in parts)).hexdigest()
+            etag = f'"{digest}-{len(parts)}"'
+            _store(bucket, key, b"".join(parts), etag, upload["content_type"], upload["cache_control"])
+            stats["multipart_completed"] += 1
+            return _xml(
+                f"<CompleteMultipartUploadResult><Location>/{escape(bucket)}/{escape(key)}</Location>"
+                f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+                f"<ETag>{escape(etag)}</ETag></CompleteMultipartUploadResult>"
+            )
+
+    if request.method == "PUT":
+        body = await _read_body(request)
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        _store(bucket, key, body, etag, request.headers.get("content-type"), request.headers.get("cache-control"))
+        stats["puts"] += 1
+        return Response(headers={"ETag": etag})
+
+    if request.method == "DELETE":
+        objects.pop(key, None)
+        return Response(status_code=204)
+
+    obj = objects.get(key)
+    if obj is None:
+        if request.method == "HEAD":
+            return Response(status_code=404)
+        return _error("NoSuchKey", key, 404)
+
+    headers = _object_headers(obj)
+    size = len(obj["body"])
+    if request.method == "HEAD":
+        headers["Content-Length"] = str(size)
+        return Response(headers=headers)
+
+    stats["gets"] += 1
+    http_range = request.headers.get("range")
+    if http_range and http_range.startswith("bytes="):
+        start_s, _, end_s = http_range[len("bytes="):].partition("-")
+        if start_s:
+            start, end = int(start_s), min(int(end_s) if end_s else size - 1, size - 1)
+        else:
+            start, end = max(0, size - int(end_s)), size - 1
+        if start >= size or start > end:
+            return _error("InvalidRange", http_range, 416)
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return Response(obj["body"][start:end + 1], status_code=206, headers=headers)
+    return Response(obj["body"], headers=headers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="S3 兼容的本地对象存储桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--bucket", action="append", default=[], help="启动时创建的 bucket，可重复")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="503 SlowDown 比例 0-1")
+    args = parser.parse_args()
+
+    config.latency = args.latency
+    config.error_rate = args.error_rate
+    for bucket in args.bucket or ["face-ai-uploads"]:
+        buckets.setdefault(bucket, {})
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,11 @@ export interface FaceExam {
     id: number;
     patient_id: number;
     image_url: string;
+    thumbnail_url?: string;
     image_hash?: string;
+    image_phash?: string;
+    // 同一照片出现在其他患者名下（疑似上传错患者）
+    duplicate_matches?: { exam_id: number; patient_id: number; distance: number }[];
     image_width?: number;
     image_height?: number;
     status?: string;